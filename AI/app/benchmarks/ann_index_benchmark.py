@@ -0,0 +1,160 @@
+"""
+Recall vs latency vs memory for the recipe index types.
+
+Uses the shard checkpoints written by build_recipe_index.py as the corpus,
+builds every index type over them and compares each one against the exact
+flat index.
+
+Usage (from AI/app/benchmarks):
+    python ann_index_benchmark.py
+    python ann_index_benchmark.py --queries 2000 --nprobe 8 16 32 --ef-search 32 64 128
+    python ann_index_benchmark.py --out ann_results.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from recipe_index import BUILD_DIR, make_index, apply_search_params  # noqa: E402
+
+
+def rss_mb() -> float:
+    """
+    Current resident memory of this process in MB (linux), falls back to peak RSS
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_corpus(build_dir: str, limit: int = None):
+    paths = sorted(glob.glob(os.path.join(build_dir, "shard_*.npz")))
+    if not paths:
+        raise SystemExit(f"No shards in {build_dir}. Run build_recipe_index.py first")
+    ids, embeddings = [], []
+    for path in paths:
+        with np.load(path) as shard:
+            ids.append(shard["ids"])
+            embeddings.append(shard["embeddings"])
+    ids = np.concatenate(ids)[:limit]
+    embeddings = np.concatenate(embeddings)[:limit]
+    return ids, embeddings
+
+
+def make_queries(embeddings: np.ndarray, n: int, noise: float, seed: int = 0) -> np.ndarray:
+    """
+    Real pantries are never an exact recipe, so queries are corpus vectors
+    nudged by a bit of gaussian noise and renormalised
+    """
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), n, replace=False)].copy()
+    queries += rng.normal(0, noise, queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def time_queries(index, queries: np.ndarray, k: int):
+    """
+    Runs queries one at a time (like the API does) and returns (ids, latencies_ms)
+    """
+    found = np.empty((len(queries), k), dtype="int64")
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found[i:i + 1] = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+    return found, latencies
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = [len(np.intersect1d(f, t)) for f, t in zip(found, truth)]
+    return float(np.mean(hits) / truth.shape[1])
+
+
+def build(index_type: str, ids: np.ndarray, embeddings: np.ndarray, args):
+    before = rss_mb()
+    start = time.perf_counter()
+    nlist = args.nlist or int(max(1, min(4 * np.sqrt(len(ids)), len(ids) // 39)))
+    index = make_index(index_type, embeddings.shape[1], nlist=nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+    if index_type == "ivfpq":
+        index.train(embeddings[:max(args.train_size, nlist * 39)])
+    index.add_with_ids(embeddings, ids)
+    build_s = time.perf_counter() - start
+    size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+    return index, build_s, size_mb, rss_mb() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recipe index types")
+    parser.add_argument("--build-dir", default=BUILD_DIR)
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N corpus vectors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--train-size", type=int, default=100000)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, default=1, help="faiss threads, 1 matches a single API request")
+    parser.add_argument("--out", default=None, help="write results as json")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    ids, embeddings = load_corpus(args.build_dir, args.limit)
+    queries = make_queries(embeddings, min(args.queries, len(embeddings)), args.noise)
+    print(f"corpus: {len(ids)} x {embeddings.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    sweeps = {
+        "flat": [{}],
+        "ivfpq": [{"nprobe": n} for n in args.nprobe],
+        "hnsw": [{"efSearch": ef} for ef in args.ef_search],
+    }
+
+    results = []
+    truth = None
+    for index_type, param_sets in sweeps.items():
+        index, build_s, size_mb, rss_delta = build(index_type, ids, embeddings, args)
+        for params in param_sets:
+            apply_search_params(index, params)
+            found, latencies = time_queries(index, queries, args.k)
+            if truth is None:
+                truth = found  # flat runs first and is the exact answer
+            results.append({
+                "index_type": index_type,
+                "params": params,
+                f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "index_mb": round(size_mb, 1),
+                "rss_delta_mb": round(rss_delta, 1),
+                "build_s": round(build_s, 2),
+            })
+        del index
+
+    print(f"\n{'index':<8}{'params':<18}{'recall':>8}{'p50 ms':>9}{'p99 ms':>9}{'index MB':>10}{'RSS +MB':>9}")
+    for r in results:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items()) or "-"
+        print(f"{r['index_type']:<8}{params:<18}{r[f'recall@{args.k}']:>8.3f}"
+              f"{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['index_mb']:>10.1f}{r['rss_delta_mb']:>9.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"corpus": len(ids), "queries": len(queries), "results": results}, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
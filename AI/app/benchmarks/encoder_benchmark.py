@@ -0,0 +1,136 @@
+"""
+PyTorch vs ONNX Runtime (fp32 and int8) for the pantry query encoder.
+
+Pantries are random ingredient subsets of recipes in the current index. For
+each encoder it measures single-query latency (what a cache miss on the API
+costs), batched throughput, cosine to the PyTorch embeddings, and recall@k
+of the FAISS results against the PyTorch results on the same index.
+
+Needs an export first: python ../models/onnx_encoder.py export
+
+Usage (from AI/app/benchmarks):
+    python encoder_benchmark.py
+    python encoder_benchmark.py --threads 1 4 --queries 2000
+    python encoder_benchmark.py --out encoder_results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from recipe_index import IndexSnapshot  # noqa: E402
+from pantry_cache import canonical_pantry  # noqa: E402
+from onnx_encoder import ONNX_DIR, OnnxEncoder, model_dir  # noqa: E402
+from ann_index_benchmark import recall_at_k, rss_mb  # noqa: E402
+
+
+def make_pantries(snap, n: int, seed: int = 0) -> list:
+    """
+    Pantry texts built like the recommender builds them, from 3-10
+    ingredients of a random recipe plus a couple from another one
+    """
+    rng = np.random.default_rng(seed)
+    parts = snap.recipes.column("RecipeIngredientParts")
+    texts = []
+    for _ in range(n):
+        first, second = (parts[int(i)].as_py() or [] for i in rng.integers(0, snap.recipes.num_rows, 2))
+        items = list(rng.permutation(first)[:rng.integers(3, 11)]) + list(rng.permutation(second)[:2])
+        texts.append(" ".join(canonical_pantry(items)) or "salt")
+    return texts
+
+
+def load_encoders(model_name: str, onnx_path: str, variants: list, threads: int) -> dict:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    encoders = {}
+    before = rss_mb()
+    encoders["torch"] = (SentenceTransformer(model_name, device="cpu"), rss_mb() - before)
+    for variant in variants:
+        before = rss_mb()
+        encoders[f"onnx-{variant}"] = (OnnxEncoder(onnx_path, variant, threads), rss_mb() - before)
+    return encoders
+
+
+def time_single(encoder, texts: list) -> np.ndarray:
+    """
+    Encodes one text per call like an API cache miss, returns latencies in ms
+    """
+    latencies = np.empty(len(texts))
+    for i, text in enumerate(texts):
+        start = time.perf_counter()
+        encoder.encode([text], normalize_embeddings=True)
+        latencies[i] = (time.perf_counter() - start) * 1000
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PyTorch and ONNX query encoders")
+    parser.add_argument("--onnx-dir", default=None, help=f"default {ONNX_DIR}/<model>")
+    parser.add_argument("--variants", nargs="+", default=["fp32", "int8"])
+    parser.add_argument("--queries", type=int, default=1000, help="pantries for the batched run and recall")
+    parser.add_argument("--single", type=int, default=200, help="pantries encoded one at a time")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="intra-op threads for both runtimes")
+    parser.add_argument("--out", default=None, help="write results as json")
+    args = parser.parse_args()
+
+    snap = IndexSnapshot()
+    model_name = snap.manifest["model_name"]
+    onnx_path = args.onnx_dir or model_dir(model_name)
+    texts = make_pantries(snap, args.queries)
+    print(f"model {model_name}, index v{snap.version} ({snap.manifest['count']} recipes, "
+          f"{snap.manifest.get('index_type', 'flat')}), {len(texts)} pantries, k={args.k}")
+
+    results = []
+    for threads in args.threads:
+        encoders = load_encoders(model_name, onnx_path, args.variants, threads)
+        reference = None
+        truth = None
+        for name, (encoder, rss_delta) in encoders.items():
+            encoder.encode(texts[:8], normalize_embeddings=True)  # warm up allocations
+            latencies = time_single(encoder, texts[:args.single])
+            start = time.perf_counter()
+            embeddings = np.asarray(
+                encoder.encode(texts, batch_size=args.batch_size, normalize_embeddings=True), dtype="float32"
+            )
+            batch_s = time.perf_counter() - start
+            _, found = snap.index.search(embeddings, args.k)
+            if reference is None:
+                reference, truth = embeddings, found  # torch runs first and is what the index was built with
+            cosine = np.sum(embeddings * reference, axis=1)
+            results.append({
+                "encoder": name,
+                "threads": threads,
+                "single_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "single_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                "batch_qps": round(len(texts) / batch_s, 1),
+                "mean_cosine": round(float(cosine.mean()), 5),
+                "min_cosine": round(float(cosine.min()), 5),
+                f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                "rss_delta_mb": round(rss_delta, 1),
+            })
+        del encoders
+
+    print(f"\n{'encoder':<12}{'threads':>8}{'p50 ms':>9}{'p95 ms':>9}{'batch q/s':>11}"
+          f"{'cos mean':>10}{'cos min':>9}{'recall':>8}{'RSS +MB':>9}")
+    for r in results:
+        print(f"{r['encoder']:<12}{r['threads']:>8}{r['single_p50_ms']:>9.3f}{r['single_p95_ms']:>9.3f}"
+              f"{r['batch_qps']:>11.1f}{r['mean_cosine']:>10.4f}{r['min_cosine']:>9.4f}"
+              f"{r[f'recall@{args.k}']:>8.3f}{r['rss_delta_mb']:>9.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"model": model_name, "index_version": snap.version, "queries": len(texts),
+                       "results": results}, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Accuracy and throughput of the item classifier against the zero-shot BART baseline.
+
+Trains on 80% of the food / non-food samples and scores the other 20%. The
+BART baseline is slow, so it only runs on the first --bart-samples held-out
+items and is skipped if transformers isn't installed.
+
+Usage (from AI/app/benchmarks):
+    python item_classifier_benchmark.py
+    python item_classifier_benchmark.py --bart-samples 0    # skip BART
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+from model1_item_classifier import QUANTIZE_TOLERANCE, ItemClassifier, load_samples  # noqa: E402
+
+BART_LABELS = ["grocery food product", "household product"]
+
+
+def run_classifier(classifier, texts: list, batch_size: int):
+    start = time.perf_counter()
+    predicted = []
+    for i in range(0, len(texts), batch_size):
+        predicted.extend(r["is_food"] for r in classifier.classify(texts[i:i + batch_size]))
+    return np.array(predicted, dtype=int), time.perf_counter() - start
+
+
+def run_bart(texts: list, batch_size: int):
+    from transformers import pipeline
+
+    zero_shot = pipeline("zero-shot-classification", model="facebook/bart-large-mnli", device=-1)
+    start = time.perf_counter()
+    predicted = []
+    for i in range(0, len(texts), batch_size):
+        for result in zero_shot(texts[i:i + batch_size], BART_LABELS, multi_label=False):
+            predicted.append(int(result["labels"][0] == BART_LABELS[0]))
+    return np.array(predicted, dtype=int), time.perf_counter() - start
+
+
+def report(name: str, truth, predicted, seconds: float):
+    print(f"{name:<22}{accuracy_score(truth, predicted):>9.3f}{f1_score(truth, predicted):>9.3f}"
+          f"{len(predicted) / seconds:>14.0f}{seconds * 1000 / len(predicted):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the food / non-food classifier")
+    parser.add_argument("--batch-size", type=int, default=64, help="items per classify() call")
+    parser.add_argument("--bart-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    texts, labels = load_samples()
+    train_texts, test_texts, train_labels, test_labels = train_test_split(
+        texts, labels, test_size=0.2, random_state=0, stratify=labels
+    )
+    print(f"train {len(train_texts)}, test {len(test_texts)}, batch size {args.batch_size}\n")
+    print(f"{'model':<22}{'accuracy':>9}{'food F1':>9}{'items/sec':>14}{'ms/item':>10}")
+
+    # int8 only shrinks the saved weights, it's timed to show it costs nothing
+    float_classifier = ItemClassifier.train(train_texts, train_labels)
+    for name, classifier in (("char-ngram float32", float_classifier),
+                             ("char-ngram int8", float_classifier.quantized())):
+        predicted, seconds = run_classifier(classifier, test_texts, args.batch_size)
+        report(name, test_labels, predicted, seconds)
+
+    # the same items again are all exact-match cache hits
+    predicted, seconds = run_classifier(classifier, test_texts, args.batch_size)
+    report("char-ngram cached", test_labels, predicted, seconds)
+
+    error = float_classifier.quantization_error(test_texts)
+    print(f"\nint8 vs float32: max food probability difference {error:.4f} "
+          f"({'ok' if error <= QUANTIZE_TOLERANCE else 'FAIL'}, tolerance {QUANTIZE_TOLERANCE})")
+
+    if args.bart_samples > 0:
+        try:
+            subset = test_texts[:args.bart_samples]
+            predicted, seconds = run_bart(subset, 16)
+            report(f"bart zero-shot (n={len(subset)})", test_labels[:len(subset)], predicted, seconds)
+        except ImportError:
+            print("bart zero-shot: skipped, transformers is not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Per-worker memory when N serving processes load the recipe index artifact.
+
+"copy" is how workers used to load it (every process deserialises its own
+index and metadata), "mmap" maps both from the page cache. RSS counts shared
+pages in every process, so PSS (proportional set size, linux only) is the
+number that shows the sharing.
+
+The SentenceTransformer model is not included, each worker still loads its own.
+
+Usage (from AI/app/benchmarks):
+    python worker_memory_benchmark.py --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+
+
+def memory_mb() -> dict:
+    """
+    RSS and PSS of this process in MB, PSS is None where smaps_rollup is missing
+    """
+    stats = {"rss": None, "pss": None}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                stats["rss"] = int(line.split()[1]) / 1024
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    stats["pss"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return stats
+
+
+def worker(mode: str, queries: int, ready, results):
+    from recipe_index import load_artifact, lookup_rows
+
+    before = memory_mb()
+    start = time.perf_counter()
+    index, recipes, _ = load_artifact(mmap=(mode == "mmap"))
+    if mode == "copy":
+        # old path kept the metadata as a pandas frame
+        recipes = recipes.to_pandas()
+    load_s = time.perf_counter() - start
+
+    # touch the whole index like real traffic eventually does
+    rng = np.random.default_rng(os.getpid())
+    xq = rng.standard_normal((queries, index.d)).astype("float32")
+    _, ids = index.search(xq, 10)
+    if mode == "copy":
+        recipes.set_index("RecipeId").loc[ids[ids >= 0]]
+    else:
+        lookup_rows(recipes.column("RecipeId").to_numpy(), ids[ids >= 0])
+
+    # wait for every worker so PSS reflects all of them being alive at once
+    ready.wait()
+    after = memory_mb()
+    results.put({
+        "load_s": load_s,
+        "rss": after["rss"] - before["rss"],
+        "pss": None if after["pss"] is None else after["pss"] - before["pss"],
+    })
+    ready.wait()
+
+
+def run(mode: str, workers: int, queries: int) -> list:
+    ctx = mp.get_context("spawn")
+    ready = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, queries, ready, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory for copy vs mmap loading")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, index + metadata only (MB added per worker)")
+    print(f"{'mode':<6}{'load s':>9}{'RSS':>10}{'PSS':>10}")
+    for mode in ("copy", "mmap"):
+        stats = run(mode, args.workers, args.queries)
+        load_s = np.mean([s["load_s"] for s in stats])
+        rss = np.mean([s["rss"] for s in stats])
+        pss = [s["pss"] for s in stats if s["pss"] is not None]
+        pss = f"{np.mean(pss):>10.1f}" if pss else f"{'n/a':>10}"
+        print(f"{mode:<6}{load_s:>9.3f}{rss:>10.1f}{pss}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Offline build of the recipe FAISS index over the full recipes corpus.
+
+Streams the parquet in chunks, encodes each chunk on a process pool and
+checkpoints every shard's embeddings to BUILD_DIR, so a killed build picks
+up where it stopped. When all shards exist, the index and metadata are
+written as a new versioned artifact that the recommender loads at startup.
+
+Usage:
+    python build_recipe_index.py                 # full corpus
+    python build_recipe_index.py --limit 5000    # quick local build
+    python build_recipe_index.py --fresh         # drop old checkpoints first
+    python build_recipe_index.py --index-type hnsw --ef-search 64
+    python build_recipe_index.py --index-type ivfpq --nlist 4096 --nprobe 16
+
+Re-running with a different --index-type reuses the encoded shards, only the
+index itself is rebuilt.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import pyarrow.parquet as pq
+
+from recipe_index import (
+    BUILD_DIR, DATA_PATH, FILTER_SOURCE_COLUMNS, INDEX_TYPES, METADATA_COLUMNS, MODEL_NAME,
+    apply_search_params, ingredients_to_text, make_index, write_artifact,
+)
+from recipe_filters import total_minutes
+
+BUILD_STATE_FILE = "build.json"
+
+# each worker process loads its own copy of the model once
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # stop every worker from grabbing all cores
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_shard(shard_no: int, ids: np.ndarray, texts: list, batch_size: int, shard_path: str):
+    """
+    Encodes one shard and writes it to disk. Runs inside a worker process
+    """
+    embeddings = _worker_model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=False,
+        normalize_embeddings=True
+    ).astype("float32")
+
+    # write to a temp file first so a crash never leaves a half written shard
+    tmp_path = shard_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, ids=ids, embeddings=embeddings)
+    os.replace(tmp_path, shard_path)
+    return shard_no, len(ids)
+
+
+def shard_path(build_dir: str, shard_no: int) -> str:
+    return os.path.join(build_dir, f"shard_{shard_no:05d}.npz")
+
+
+def iter_chunks(data_path: str, chunk_rows: int, limit: int = None):
+    """
+    Streams (shard_no, ids, texts) from the parquet without loading it all
+    """
+    parquet_file = pq.ParquetFile(data_path)
+    seen = 0
+    batches = parquet_file.iter_batches(
+        batch_size=chunk_rows,
+        columns=["RecipeId", "RecipeIngredientParts"]
+    )
+    for shard_no, batch in enumerate(batches):
+        if limit is not None and seen >= limit:
+            return
+        if limit is not None:
+            batch = batch.slice(0, limit - seen)
+        seen += batch.num_rows
+
+        ids = batch.column("RecipeId").to_numpy(zero_copy_only=False).astype("int64")
+        texts = [ingredients_to_text(parts) for parts in batch.column("RecipeIngredientParts").to_pylist()]
+        yield shard_no, ids, texts
+
+
+def check_build_state(build_dir: str, state: dict, fresh: bool):
+    """
+    Makes sure checkpoints on disk came from a build with the same settings.
+    Shards are only reusable if the chunking and model are unchanged
+    """
+    if fresh and os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir, exist_ok=True)
+
+    state_path = os.path.join(build_dir, BUILD_STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            previous = json.load(f)
+        if previous != state:
+            raise SystemExit(
+                f"Checkpoints in {build_dir} were built with {previous}, "
+                f"not {state}. Re-run with --fresh to start over"
+            )
+    else:
+        with open(state_path, "w") as f:
+            json.dump(state, f, indent=2)
+
+
+def encode_corpus(args) -> list:
+    """
+    Encodes every shard that is not already checkpointed.
+    Returns the list of shard paths in order
+    """
+    threads = max(1, args.threads_per_worker)
+    paths = []
+    pending = set()
+    encoded = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(args.model, threads)
+    ) as pool:
+        for shard_no, ids, texts in iter_chunks(args.data, args.chunk_rows, args.limit):
+            path = shard_path(args.build_dir, shard_no)
+            paths.append(path)
+            if os.path.exists(path):
+                print(f"shard {shard_no}: already encoded, skipping")
+                continue
+
+            # keep only a couple of shards queued per worker so memory stays flat
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                encoded += _report(done, start, encoded)
+
+            pending.add(pool.submit(_encode_shard, shard_no, ids, texts, args.batch_size, path))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            encoded += _report(done, start, encoded)
+
+    elapsed = time.perf_counter() - start
+    if encoded:
+        print(f"encoded {encoded} recipes in {elapsed:.1f}s ({encoded / elapsed:.1f} recipes/sec)")
+    return paths
+
+
+def _report(done, start: float, encoded_so_far: int) -> int:
+    total = encoded_so_far
+    for future in done:
+        shard_no, n = future.result()
+        total += n
+        rate = total / max(time.perf_counter() - start, 1e-9)
+        print(f"shard {shard_no}: done ({total} recipes so far, {rate:.1f} recipes/sec)")
+    return total - encoded_so_far
+
+
+def iter_shards(paths: list):
+    for path in paths:
+        with np.load(path) as shard:
+            yield shard["ids"], shard["embeddings"]
+
+
+def training_sample(paths: list, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Picks roughly `size` vectors spread evenly over all shards for IVF training
+    """
+    rng = np.random.default_rng(seed)
+    total = sum(len(ids) for ids, _ in iter_shards(paths))
+    fraction = min(1.0, size / max(total, 1))
+    sample = []
+    for _, embeddings in iter_shards(paths):
+        take = max(1, int(round(len(embeddings) * fraction)))
+        sample.append(embeddings[rng.choice(len(embeddings), take, replace=False)])
+    return np.concatenate(sample)
+
+
+def default_nlist(total: int) -> int:
+    # rule of thumb is ~4*sqrt(n) lists, each list needs ~39 points to train
+    return int(max(1, min(4 * np.sqrt(total), total // 39, 65536)))
+
+
+def build_index(paths: list, args):
+    """
+    Builds the configured index type from the shard checkpoints, keyed by RecipeId
+    """
+    total = sum(len(ids) for ids, _ in iter_shards(paths))
+    dim = next(iter_shards(paths))[1].shape[1]
+    nlist = args.nlist or default_nlist(total)
+
+    index = make_index(args.index_type, dim, nlist=nlist, pq_m=args.pq_m,
+                       hnsw_m=args.hnsw_m, ef_construction=args.ef_construction)
+    index_params = {"type": args.index_type}
+    search_params = {}
+
+    if args.index_type == "ivfpq":
+        sample = training_sample(paths, max(args.train_size, nlist * 39))
+        print(f"Training IVF{nlist},PQ{args.pq_m} on {len(sample)} vectors...")
+        index.train(sample)
+        index_params.update(nlist=nlist, pq_m=args.pq_m)
+        search_params["nprobe"] = args.nprobe
+    elif args.index_type == "hnsw":
+        index_params.update(hnsw_m=args.hnsw_m, ef_construction=args.ef_construction)
+        search_params["efSearch"] = args.ef_search
+
+    for ids, embeddings in iter_shards(paths):
+        index.add_with_ids(embeddings, ids)
+
+    apply_search_params(index, search_params)
+    return index, index_params, search_params
+
+
+def load_metadata(data_path: str, limit: int = None):
+    available = set(pq.read_schema(data_path).names)
+    table = pq.read_table(data_path, columns=METADATA_COLUMNS + [c for c in FILTER_SOURCE_COLUMNS if c in available])
+    if limit is not None:
+        table = table.slice(0, limit)
+    df = table.to_pandas()
+    df["RecipeId"] = df["RecipeId"].astype("int64")
+    df["TotalMinutes"] = total_minutes(df).astype("float32")
+    return df.drop(columns=[c for c in ("PrepTime", "CookTime", "TotalTime") if c in df])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the recipe FAISS index artifact")
+    parser.add_argument("--data", default=DATA_PATH, help="recipes parquet file")
+    parser.add_argument("--build-dir", default=BUILD_DIR, help="where shard checkpoints are kept")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--chunk-rows", type=int, default=20000, help="recipes per shard")
+    parser.add_argument("--batch-size", type=int, default=256, help="encode batch size inside a shard")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=None, help="only index the first N recipes")
+    parser.add_argument("--fresh", action="store_true", help="delete existing checkpoints first")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--nlist", type=int, default=None, help="ivfpq: number of lists (default ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=48, help="ivfpq: sub-quantizers, must divide the embedding dim")
+    parser.add_argument("--nprobe", type=int, default=16, help="ivfpq: lists scanned per query")
+    parser.add_argument("--train-size", type=int, default=100000, help="ivfpq: training vectors")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="hnsw: links per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="hnsw: build time beam width")
+    parser.add_argument("--ef-search", type=int, default=64, help="hnsw: query time beam width")
+    args = parser.parse_args()
+
+    check_build_state(args.build_dir, {
+        "data": os.path.abspath(args.data),
+        "model": args.model,
+        "chunk_rows": args.chunk_rows,
+        "limit": args.limit,
+    }, args.fresh)
+
+    build_start = time.perf_counter()
+    paths = encode_corpus(args)
+
+    print(f"Building {args.index_type} FAISS index from shards...")
+    index, index_params, search_params = build_index(paths, args)
+    metadata = load_metadata(args.data, args.limit)
+    build_seconds = time.perf_counter() - build_start
+
+    out_dir = write_artifact(index, metadata, {
+        "model_name": args.model,
+        "dim": index.d,
+        "index_type": args.index_type,
+        "index_params": index_params,
+        "search_params": search_params,
+        "source": os.path.abspath(args.data),
+        "build_seconds": round(build_seconds, 1),
+        "recipes_per_sec": round(index.ntotal / build_seconds, 1),
+    })
+    print(f"wrote {index.ntotal} recipes to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import numpy as np
+
+from pantry_cache import normalise_item
+
+INGREDIENTS_DIR = "ingredients"
+_ARRAYS = ("vocab", "indptr", "postings", "sizes")
+
+
+def _singular(word: str) -> str:
+    # crude, but enough for "tomatoes" / "eggs" / "berries" to line up
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def normalise_ingredient(name) -> str:
+    return " ".join(_singular(word) for word in normalise_item(name).split())
+
+
+class IngredientIndex:
+    """
+    Inverted index from normalised ingredient to the metadata rows that use it.
+
+    Stored CSR style as sorted int arrays: the rows for vocab[t] are
+    postings[indptr[t]:indptr[t + 1]]. sizes[row] is the number of distinct
+    ingredients in that recipe. Rows line up with the artifact metadata table.
+    """
+
+    def __init__(self, vocab, indptr, postings, sizes):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings = postings
+        self.sizes = sizes
+
+    @classmethod
+    def build(cls, ingredient_lists):
+        """
+        Builds the index from RecipeIngredientParts values in metadata row order
+        """
+        term_ids = {}
+        pair_terms, pair_rows = [], []
+        sizes = np.zeros(len(ingredient_lists), dtype="int16")
+
+        for row, parts in enumerate(ingredient_lists):
+            if parts is None or isinstance(parts, str):
+                parts = [] if parts is None else [parts]
+            terms = {normalise_ingredient(part) for part in parts}
+            terms.discard("")
+            sizes[row] = len(terms)
+            for term in terms:
+                pair_terms.append(term_ids.setdefault(term, len(term_ids)))
+                pair_rows.append(row)
+
+        # renumber terms in sorted order so lookups can use searchsorted
+        unsorted_vocab = np.array(list(term_ids), dtype=str)
+        order = np.argsort(unsorted_vocab)
+        new_id = np.empty(len(order), dtype="int64")
+        new_id[order] = np.arange(len(order))
+
+        pair_terms = new_id[np.asarray(pair_terms, dtype="int64")]
+        pair_rows = np.asarray(pair_rows, dtype="int32")
+        by_term = np.lexsort((pair_rows, pair_terms))
+
+        indptr = np.zeros(len(order) + 1, dtype="int64")
+        np.cumsum(np.bincount(pair_terms, minlength=len(order)), out=indptr[1:])
+        return cls(unsorted_vocab[order], indptr, pair_rows[by_term], sizes)
+
+    def save(self, artifact_dir: str):
+        out_dir = os.path.join(artifact_dir, INGREDIENTS_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(out_dir, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, artifact_dir: str, mmap: bool = True):
+        """
+        Loads the arrays memory mapped so workers share them like the FAISS index
+        """
+        in_dir = os.path.join(artifact_dir, INGREDIENTS_DIR)
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(in_dir, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS))
+
+    def term_ids(self, pantry_items) -> np.ndarray:
+        """
+        Maps pantry items to vocab ids. An item that isn't an ingredient on its
+        own falls back to its longest trailing phrase that is, so
+        "free range eggs" still counts as "egg"
+        """
+        found = set()
+        for item in pantry_items:
+            words = normalise_ingredient(item).split()
+            for start in range(len(words)):
+                term_id = self._lookup(" ".join(words[start:]))
+                if term_id is not None:
+                    found.add(term_id)
+                    break
+        return np.array(sorted(found), dtype="int64")
+
+    def _lookup(self, term: str):
+        pos = int(np.searchsorted(self.vocab, term))
+        if pos < len(self.vocab) and self.vocab[pos] == term:
+            return pos
+        return None
+
+    def have_counts(self, term_ids: np.ndarray):
+        """
+        Returns (rows, counts): every recipe that uses at least one pantry
+        ingredient and how many of its ingredients the pantry covers
+        """
+        if len(term_ids) == 0:
+            return np.empty(0, dtype="int32"), np.empty(0, dtype="int64")
+        starts, ends = self.indptr[term_ids], self.indptr[term_ids + 1]
+        postings = np.concatenate([self.postings[s:e] for s, e in zip(starts, ends)])
+        return np.unique(postings, return_counts=True)
+
+    def score_rows(self, term_ids: np.ndarray, rows: np.ndarray):
+        """
+        Coverage (fraction of the recipe's ingredients in the pantry) and
+        missing ingredient counts for specific rows, e.g. FAISS candidates
+        """
+        touched, counts = self.have_counts(term_ids)
+        have = np.zeros(len(rows), dtype="int64")
+        if len(touched):
+            pos = np.minimum(np.searchsorted(touched, rows), len(touched) - 1)
+            hit = touched[pos] == rows
+            have[hit] = counts[pos[hit]]
+        sizes = self.sizes[rows].astype("int64")
+        coverage = np.divide(have, sizes, out=np.zeros(len(rows)), where=sizes > 0)
+        return coverage, sizes - have
+
+    def cookable(self, term_ids: np.ndarray, min_coverage: float = 0.8, limit: int = 10, allowed=None):
+        """
+        Recipes where the pantry covers at least `min_coverage` of the
+        ingredients, best coverage first, then fewest missing. allowed(rows)
+        optionally returns a mask of the rows that pass the search filters.
+        Returns (rows, coverage, missing)
+        """
+        rows, have = self.have_counts(term_ids)
+        sizes = self.sizes[rows].astype("int64")
+        coverage = have / np.maximum(sizes, 1)
+        keep = coverage >= min_coverage
+        if allowed is not None:
+            keep &= allowed(rows)
+        rows, coverage, missing = rows[keep], coverage[keep], (sizes - have)[keep]
+
+        order = np.lexsort((missing, -coverage))[:limit]
+        return rows[order], coverage[order], missing[order]
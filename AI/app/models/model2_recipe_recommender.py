@@ -1,73 +1,273 @@
 import os
-import joblib
-import pandas as pd
+import time
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-import hashlib
-
-# build path to data file since relative paths can be unreliable
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = os.path.join(BASE_DIR, "../data/recipes.parquet")
-MODEL_PATH = os.path.normpath(os.path.join(BASE_DIR, "recipe_assets.pkl"))
-INDEX_PATH = os.path.normpath(os.path.join(BASE_DIR, "recipe_index.faiss"))
-
-df = pd.read_parquet(DATA_PATH)
-df = df[['Name', 'RecipeIngredientParts']] # keeps these columns and drops everything else. later we should also import images, recipe instructions, preptime, cooktime, recipecategory, recipeingredientquantities, keywords for searching and maybe aggregatedrating 
-df = df.sample(5000) # limit to 5000 recipes for faster testing. full 500k dataset will probably take 1-2 hours to compute. only need to compute once before prod
-
-# join each list in recipeingredientparts into a single string
-df['ingredients_text'] = df['RecipeIngredientParts'].apply(
-    lambda x: " ".join(x).lower() if isinstance(x, list) else str(x).lower()
+
+from recipe_index import IndexSnapshot, current_version, filtered_search_params
+from pantry_cache import PantryEmbeddingCache, pantry_key, pantry_to_text
+from recommendation_store import PrecomputedRecommendations, encoder_backend
+
+RECOMMEND_MODES = ("dense", "hybrid")
+HYBRID_CANDIDATES = 100  # faiss hits re-ranked by pantry coverage in hybrid mode
+HYBRID_ALPHA = 0.5  # weight of similarity vs coverage in the hybrid score
+
+# filtered searches on ivfpq / hnsw scan nprobe / efSearch times this at most
+# (it starts at 1 / the fraction of recipes that pass and doubles while short)
+FILTER_MAX_WIDEN = float(os.getenv("RECIPE_FILTER_MAX_WIDEN", "64"))
+
+# how often (seconds) to check CURRENT for a newer artifact, 0 turns it off
+INDEX_RELOAD_INTERVAL = float(os.getenv("RECIPE_INDEX_RELOAD_SECONDS", "30"))
+
+# "torch" (SentenceTransformer) or "onnx" (int8 export from onnx_encoder.py)
+RECIPE_ENCODER = os.getenv("RECIPE_ENCODER", "torch")
+
+
+def load_encoder(model_name: str):
+    """
+    The query encoder for model_name. An ONNX export that is missing, from
+    another model or hasn't passed its cosine check falls back to PyTorch
+    """
+    if RECIPE_ENCODER == "onnx":
+        try:
+            from onnx_encoder import OnnxEncoder
+            return OnnxEncoder.load(model_name)
+        except (ImportError, OSError, ValueError) as e:
+            print("ONNX encoder unavailable, using PyTorch:", e)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+# serving only loads the prebuilt artifact. run build_recipe_index.py once to
+# encode the full corpus. time, category and rating are kept for filtering,
+# later we should also keep images, recipe instructions,
+# recipeingredientquantities and keywords
+snapshot = IndexSnapshot()
+model = load_encoder(snapshot.manifest["model_name"])
+
+print(f"model and FAISS index v{snapshot.version} ready ({snapshot.manifest['count']} recipes)")
+
+# shared by every user, keyed on the canonical pantry rather than user_id.
+# the ONNX encoder gets its own namespace so the two never share embeddings
+pantry_cache = PantryEmbeddingCache.from_env(
+    namespace=getattr(model, "cache_namespace", snapshot.manifest["model_name"])
 )
 
-# load cached model if exists and index if available
-if os.path.exists(MODEL_PATH) and os.path.exists(INDEX_PATH):
-    print("Loading cached model and FAISS index...")
-    model, df = joblib.load(MODEL_PATH)
-    index = faiss.read_index(INDEX_PATH)
-else:
-    print("Encoding recipes with MiniLM (first-time setup)...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings = model.encode(
-        df['ingredients_text'].tolist(),
-        show_progress_bar=True,
-        batch_size=256,
-        normalize_embeddings=True
-    )
+# top-N per user from precompute_recommendations.py, answers users whose
+# pantry hasn't changed since the last run without encoding or searching
+precomputed = PrecomputedRecommendations()
 
-# build FAISS index
-dim = embeddings.shape[1]
-index = faiss.IndexFlatIP(dim)
-index.add(embeddings.astype('float32'))
+# optional callback(stage, seconds) for timing encode / search, the backend
+# points it at its metrics
+on_stage = None
 
-# cache model and index for future runs
-joblib.dump((model, df), MODEL_PATH)
-faiss.write_index(index, INDEX_PATH)
+def _record_stage(stage, start):
+    if on_stage is not None:
+        on_stage(stage, time.perf_counter() - start)
 
-print("model and FAISS index ready")
+_reload_lock = threading.Lock()
+_last_reload_check = time.monotonic()
 
-pantry_cache = {}
+def reload_if_changed(force=False):
+    """
+    Swaps in the version CURRENT points at if it changed.
+    Rebinding `snapshot` is atomic, queries already running keep the snapshot
+    they started with until they finish. Only one thread loads, the rest
+    carry on with the old version meanwhile
+    """
+    global snapshot, _last_reload_check
+    if not force and (INDEX_RELOAD_INTERVAL <= 0 or time.monotonic() - _last_reload_check < INDEX_RELOAD_INTERVAL):
+        return snapshot
+    if not _reload_lock.acquire(blocking=force):
+        return snapshot
+    try:
+        _last_reload_check = time.monotonic()
+        version = current_version()
+        if version is not None and version != snapshot.version:
+            new_snapshot = IndexSnapshot(version)
+            if new_snapshot.manifest["model_name"] != snapshot.manifest["model_name"]:
+                # the loaded encoder can't produce queries for this index
+                print(f"not switching to index v{version}: built with a different model, restart to load it")
+            else:
+                snapshot = new_snapshot
+                print(f"switched to FAISS index v{version} ({snapshot.manifest['count']} recipes)")
+    finally:
+        _reload_lock.release()
+    return snapshot
 
-def recommend_recipes(pantry_items, top_n=10, user_id=None):
+def to_records(snap, hit_ids, similarities=None, **columns):
     """
-    Recommend top N recipes based on a user's pantry ingredients.
+    Turns result ids (plus any per-hit score arrays) into a list of plain dicts
+    """
+    names = snap.recipes.column("Name").take(snap.rows(hit_ids)).to_pylist()
+    records = [{"recipe_id": int(recipe_id), "name": name} for recipe_id, name in zip(hit_ids, names)]
+    if similarities is not None:
+        columns = {"similarity": similarities, **columns}
+    for column, values in columns.items():
+        for record, value in zip(records, values.tolist()):
+            record[column] = value
+    return records
+
+def require_filters(snap):
+    if snap.filters is None:
+        raise ValueError("This index artifact has no filter columns, rebuild it with build_recipe_index.py")
+    return snap.filters
+
+def select_recipes(snap, filters):
     """
-    pantry_text = " ".join(pantry_items).lower().strip()
-    pantry_hash = hashlib.md5(pantry_text.encode()).hexdigest()
+    The cached Selection for a filters dict, None when nothing is filtered
+    """
+    if not filters:
+        return None
+    return require_filters(snap).select(filters, snap.recipe_ids)
+
+def search_recipes(snap, pantry_embs, top_n=10, selection=None):
+    """
+    Runs one FAISS search for a batch of pantry embeddings.
+    Returns (similarities, ids) lists per pantry with faiss's -1 padding removed
 
-    if user_id and user_id in pantry_cache and pantry_cache[user_id][0] == pantry_hash:
-        pantry_emb = pantry_cache[user_id][1]
+    With a selection, FAISS skips every recipe outside it during the search.
+    Approximate indexes then see fewer matching candidates, so their
+    nprobe / efSearch is widened by how selective the filter is, and doubled
+    again for pantries that still come back short
+    """
+    start = time.perf_counter()
+    if selection is None:
+        similarities, ids = snap.index.search(pantry_embs, top_n)
+    elif selection.count == 0:
+        similarities = np.zeros((len(pantry_embs), top_n), dtype="float32")
+        ids = np.full((len(pantry_embs), top_n), -1, dtype="int64")
     else:
-        pantry_emb = model.encode([pantry_text], normalize_embeddings=True).astype('float32')
-        if user_id:
-            pantry_cache[user_id] = (pantry_hash, pantry_emb)
+        widen = min(FILTER_MAX_WIDEN, 1 / selection.fraction)
+        similarities, ids = snap.index.search(
+            pantry_embs, top_n, params=filtered_search_params(snap.index, selection.selector, widen)
+        )
+        wanted = min(top_n, selection.count)
+        exact = snap.manifest.get("index_type", "flat") == "flat"
+        while not exact and widen < FILTER_MAX_WIDEN:
+            short = np.flatnonzero((ids >= 0).sum(axis=1) < wanted)
+            if not len(short):
+                break
+            widen = min(FILTER_MAX_WIDEN, widen * 2)
+            similarities[short], ids[short] = snap.index.search(
+                pantry_embs[short], top_n, params=filtered_search_params(snap.index, selection.selector, widen)
+            )
+    _record_stage("faiss_search", start)
+    found = ids >= 0  # faiss pads with -1 when there are fewer than top_n hits
+    return [(sims[keep], hit_ids[keep]) for sims, hit_ids, keep in zip(similarities, ids, found)]
 
-    similarities, indices = index.search(pantry_emb, top_n)
-    results = df.iloc[indices[0]].copy()
-    results['similarity'] = similarities[0]
+def embed_pantries(pantries):
+    """
+    Embeds pantries, using the cache where possible. Cache misses are encoded
+    in a single model.encode call
+    """
+    texts = [pantry_to_text(pantry_items) for pantry_items in pantries]
+    keys = [pantry_key(text) for text in texts]
+    cached = pantry_cache.get_many(keys)
+    pantry_embs = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype="float32")
 
-    return results[['Name', 'similarity']]
+    misses = {}
+    for i, (key, emb) in enumerate(zip(keys, cached)):
+        if emb is not None:
+            pantry_embs[i] = emb
+        else:
+            # identical pantries in the same batch are only encoded once
+            misses.setdefault(key, []).append(i)
+
+    if misses:
+        miss_keys = list(misses)
+        start = time.perf_counter()
+        encoded = model.encode(
+            [texts[misses[key][0]] for key in miss_keys],
+            batch_size=64,
+            normalize_embeddings=True
+        ).astype("float32")
+        _record_stage("encode", start)
+        for key, emb in zip(miss_keys, encoded):
+            pantry_embs[misses[key]] = emb
+        pantry_cache.put_many(miss_keys, encoded)
+
+    return pantry_embs
+
+def require_ingredient_index(snap):
+    if snap.ingredients is None:
+        raise ValueError("This index artifact has no ingredient index, rebuild it with build_recipe_index.py")
+    return snap.ingredients
+
+def rerank_by_coverage(snap, pantry_items, similarities, hit_ids, top_n=10, alpha=HYBRID_ALPHA):
+    """
+    Re-ranks FAISS candidates by a blend of similarity and how much of each
+    recipe the pantry already covers
+    """
+    ingredients = require_ingredient_index(snap)
+    coverage, missing = ingredients.score_rows(ingredients.term_ids(pantry_items), snap.rows(hit_ids))
+    score = alpha * similarities + (1 - alpha) * coverage
+    order = np.argsort(-score, kind="stable")[:top_n]
+    return to_records(
+        snap, hit_ids[order], similarities[order],
+        coverage=coverage[order], missing_ingredients=missing[order], score=score[order]
+    )
+
+def recommend_recipes_batch(pantries, top_n=10, user_ids=None, mode="dense",
+                            candidates=HYBRID_CANDIDATES, alpha=HYBRID_ALPHA, filters=None):
+    """
+    Recommend top N recipes for many pantries at once with one encode and one
+    index.search call.
+
+    mode="dense" ranks by embedding similarity only, mode="hybrid" fetches
+    `candidates` hits and re-ranks them by pantry coverage.
+    filters apply to every pantry in the batch, e.g.
+    {"max_minutes": 30, "categories": ["chicken"], "min_rating": 4, "exclude_allergens": ["peanut"]}
+    Unfiltered queries with a user_id are answered from the precomputed
+    results when that user's pantry hasn't changed, the rest are searched live
+    """
+    if mode not in RECOMMEND_MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {RECOMMEND_MODES}")
+
+    snap = reload_if_changed()
+    selection = select_recipes(snap, filters)
+    results = [None] * len(pantries)
+    if user_ids is not None and selection is None:
+        keys = [pantry_key(pantry_to_text(pantry_items)) for pantry_items in pantries]
+        hits = precomputed.lookup(snap.version, encoder_backend(model), list(user_ids), keys, top_n, mode)
+        for i, hit in enumerate(hits):
+            if hit is not None:
+                results[i] = to_records(snap, hit[0], hit[1])
+
+    live = [i for i, result in enumerate(results) if result is None]
+    if not live:
+        return results
+    pantries = [pantries[i] for i in live]
+    pantry_embs = embed_pantries(pantries)
+    if mode == "dense":
+        hits = search_recipes(snap, pantry_embs, top_n, selection)
+        found = [to_records(snap, hit_ids, sims) for sims, hit_ids in hits]
+    else:
+        hits = search_recipes(snap, pantry_embs, max(candidates, top_n), selection)
+        found = [
+            rerank_by_coverage(snap, pantry_items, sims, hit_ids, top_n, alpha)
+            for pantry_items, (sims, hit_ids) in zip(pantries, hits)
+        ]
+    for i, records in zip(live, found):
+        results[i] = records
+    return results
+
+def cookable_recipes(pantry_items, min_coverage=0.8, top_n=10, filters=None):
+    """
+    Recipes where the pantry has at least `min_coverage` of the ingredients,
+    straight from the ingredient index without touching the model
+    """
+    snap = reload_if_changed()
+    ingredients = require_ingredient_index(snap)
+    selection = select_recipes(snap, filters)
+    allowed = None if selection is None else (lambda rows: selection.contains(snap.recipe_ids[rows]))
+    rows, coverage, missing = ingredients.cookable(ingredients.term_ids(pantry_items), min_coverage, top_n, allowed)
+    return to_records(snap, snap.recipe_ids[rows], coverage=coverage, missing_ingredients=missing)
+
+def recommend_recipes(pantry_items, top_n=10, user_id=None, filters=None):
+    """
+    Recommend top N recipes based on a user's pantry ingredients.
+    Returns records like {"recipe_id", "name", "similarity"}
+    """
+    return recommend_recipes_batch([pantry_items], top_n, [user_id], filters=filters)[0]
 
 if __name__ == "__main__":
     test_pantry = ["chicken breast", "wholewheat noodles", "oriental vegetables"]
@@ -75,4 +275,17 @@ if __name__ == "__main__":
 
     recommendations = recommend_recipes(test_pantry, 10)
     print("\nTop Recipe Recommendations:")
-    print(recommendations)
\ No newline at end of file
+    for record in recommendations:
+        print(f"{record['recipe_id']:>8}  {record['similarity']:.3f}  {record['name']}")
+
+    # same pantry in a different order and casing is a cache hit
+    recommend_recipes(["Oriental Vegetables", "chicken breast", "WHOLEWHEAT NOODLES"], 10)
+    print("\nPantry cache:", pantry_cache.stats())
+
+    if snapshot.ingredients is not None:
+        print("\nHybrid:", recommend_recipes_batch([test_pantry], 5, mode="hybrid")[0])
+        print("\nCookable with 80% of ingredients:", cookable_recipes(test_pantry, 0.8, 5))
+
+    if snapshot.filters is not None:
+        quick = {"max_minutes": 30, "exclude_allergens": ["gluten", "dairy"]}
+        print("\nUnder 30 minutes, no gluten or dairy:", recommend_recipes(test_pantry, 5, filters=quick))
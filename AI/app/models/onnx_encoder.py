@@ -0,0 +1,259 @@
+"""
+ONNX Runtime encoder for CPU query embedding, a drop-in for the
+SentenceTransformer the recommender uses (encode + get_sentence_embedding_dimension).
+
+Export once, with the model the index was built with:
+    python onnx_encoder.py export                      # int8 + fp32 into onnx/<model>/
+    python onnx_encoder.py check --tolerance 0.97      # cosine vs the stored index embeddings
+
+then serve with RECIPE_ENCODER=onnx. Serving only needs onnxruntime and
+tokenizers, not torch or sentence-transformers. An export whose recorded
+check didn't pass is refused and the recommender stays on PyTorch.
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from recipe_index import BASE_DIR, MODEL_NAME, ingredients_to_text
+
+ONNX_DIR = os.path.normpath(os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "onnx")))
+ONNX_VARIANT = os.getenv("ONNX_VARIANT", "int8")
+# 0 lets onnxruntime pick (one per physical core), set it to cores / RECOMMENDER_WORKERS when serving
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+# 1st percentile cosine to the PyTorch embeddings an export has to reach
+ONNX_MIN_COSINE = float(os.getenv("ONNX_MIN_COSINE", "0.97"))
+
+CONFIG_FILE = "encoder.json"
+VARIANT_FILES = {"fp32": "model.onnx", "int8": "model.int8.onnx"}
+
+
+def model_dir(model_name: str, onnx_dir: str = ONNX_DIR) -> str:
+    return os.path.join(onnx_dir, os.path.basename(model_name.rstrip("/")))
+
+
+class OnnxEncoder:
+    """
+    Tokenizes with the model's fast tokenizer and runs the exported
+    transformer + mean pooling graph, then L2 normalises like
+    SentenceTransformer.encode(normalize_embeddings=True)
+    """
+
+    def __init__(self, path: str, variant: str = ONNX_VARIANT, threads: int = ONNX_INTRA_OP_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.variant = variant
+        self.model_name = self.config["model_name"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        # batches already keep every core busy, parallel graph branches just add contention
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(path, VARIANT_FILES[variant]), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @classmethod
+    def load(cls, model_name: str, onnx_dir: str = ONNX_DIR, variant: str = ONNX_VARIANT,
+             min_cosine: float = ONNX_MIN_COSINE):
+        """
+        Loads the export for model_name, refusing one that was exported from a
+        different model or hasn't passed the cosine check
+        """
+        encoder = cls(model_dir(model_name, onnx_dir), variant)
+        if encoder.model_name != model_name:
+            raise ValueError(f"ONNX export is for {encoder.model_name!r}, the index was built with {model_name!r}")
+        check = encoder.config.get("checks", {}).get(variant)
+        if not check or check["p01_cosine"] < min_cosine:
+            raise ValueError(
+                f"ONNX {variant} export has no passing cosine check (needs p01 >= {min_cosine}), "
+                f"run: python onnx_encoder.py check --variant {variant}"
+            )
+        return encoder
+
+    @property
+    def cache_namespace(self) -> str:
+        # quantized embeddings are close to the PyTorch ones but not equal, keep them apart in the cache
+        return f"{self.model_name}:onnx-{self.variant}"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dim"]
+
+    def encode(self, texts: list, batch_size: int = 64, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.config["dim"]), dtype="float32")
+        # longest first so each batch pads to about the same length
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in rows])
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            }
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            embeddings[rows] = self.session.run(None, feeds)[0]
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+def export(model_name: str, out_dir: str, opset: int = 17, quantize: bool = True):
+    """
+    Exports the SentenceTransformer's transformer with mean pooling folded
+    into the graph, plus a dynamically int8 quantized copy
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st_model[0], st_model[1]
+    # sentence-transformers 6 keeps the mode as a string, older versions as flags
+    pooling_mode = getattr(pooling, "pooling_mode", None) or pooling.get_pooling_mode_str()
+    if pooling_mode != "mean":
+        raise ValueError(f"only mean pooling is supported, {model_name} uses {pooling_mode}")
+    tokenizer = transformer.tokenizer
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in tokenizer.model_input_names]
+
+    class MeanPooled(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            features = dict(zip(input_names, inputs))
+            hidden = self.model(**features).last_hidden_state
+            mask = features["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            return (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(["chicken breast rice garlic", "eggs"], padding=True, return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in input_names}
+    dynamic_axes["embedding"] = {0: "batch"}
+    fp32_path = os.path.join(out_dir, VARIANT_FILES["fp32"])
+    export_kwargs = {"dynamo": False} if "dynamo" in torch.onnx.export.__code__.co_varnames else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            MeanPooled(transformer.auto_model.eval()), tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["embedding"], dynamic_axes=dynamic_axes,
+            opset_version=opset, **export_kwargs
+        )
+    tokenizer.save_pretrained(out_dir)
+
+    variants = ["fp32"]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(out_dir, VARIANT_FILES["int8"]), weight_type=QuantType.QInt8)
+        variants.append("int8")
+
+    config = {
+        "model_name": model_name,
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "variants": {v: os.path.getsize(os.path.join(out_dir, VARIANT_FILES[v])) for v in variants},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "checks": {},
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+
+def stored_embeddings(snap, recipe_ids: np.ndarray):
+    """
+    The index's own vectors for these recipes. None for ivfpq (lossy, and
+    no direct map), the caller re-encodes with PyTorch instead
+    """
+    if snap.manifest.get("index_type", "flat") == "ivfpq":
+        return None
+    return np.vstack([snap.index.reconstruct(int(recipe_id)) for recipe_id in recipe_ids]).astype("float32")
+
+
+def check(model_name: str, out_dir: str, variant: str, samples: int, tolerance: float, seed: int = 0) -> dict:
+    """
+    Cosine between this export's embeddings and the stored index embeddings
+    for a sample of recipes, recorded in encoder.json for load() to enforce
+    """
+    from recipe_index import IndexSnapshot
+
+    snap = IndexSnapshot()
+    if snap.manifest["model_name"] != model_name:
+        raise SystemExit(f"the current index was built with {snap.manifest['model_name']!r}, not {model_name!r}")
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(snap.recipes.num_rows, min(samples, snap.recipes.num_rows), replace=False))
+    recipe_ids = snap.recipe_ids[rows]
+    texts = [ingredients_to_text(parts) for parts in snap.recipes.column("RecipeIngredientParts").take(rows).to_pylist()]
+
+    reference = stored_embeddings(snap, recipe_ids)
+    source = "index"
+    if reference is None:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+        source = "pytorch"
+
+    encoder = OnnxEncoder(out_dir, variant)
+    cosine = np.sum(encoder.encode(texts) * reference, axis=1)
+    result = {
+        "samples": len(texts),
+        "reference": source,
+        "index_version": snap.version,
+        "mean_cosine": round(float(cosine.mean()), 5),
+        "p01_cosine": round(float(np.percentile(cosine, 1)), 5),
+        "min_cosine": round(float(cosine.min()), 5),
+        "tolerance": tolerance,
+        "passed": bool(np.percentile(cosine, 1) >= tolerance),
+    }
+
+    config_path = os.path.join(out_dir, CONFIG_FILE)
+    with open(config_path) as f:
+        config = json.load(f)
+    # a failed check is recorded without the p01 load() looks for, so it can't be served by accident
+    config["checks"][variant] = result if result["passed"] else None
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / check the ONNX query encoder")
+    parser.add_argument("command", choices=("export", "check"))
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--out", default=None, help=f"default {ONNX_DIR}/<model>")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="fp32 only")
+    parser.add_argument("--variant", choices=tuple(VARIANT_FILES), default=None, help="check one variant (default all)")
+    parser.add_argument("--samples", type=int, default=1000, help="recipes to compare in the check")
+    parser.add_argument("--tolerance", type=float, default=ONNX_MIN_COSINE)
+    args = parser.parse_args()
+    out_dir = args.out or model_dir(args.model)
+
+    if args.command == "export":
+        config = export(args.model, out_dir, args.opset, not args.no_quantize)
+        for variant, size in config["variants"].items():
+            print(f"wrote {variant} to {os.path.join(out_dir, VARIANT_FILES[variant])} ({size / 1e6:.1f} MB)")
+        print("now run: python onnx_encoder.py check")
+        return
+
+    with open(os.path.join(out_dir, CONFIG_FILE)) as f:
+        variants = [args.variant] if args.variant else list(json.load(f)["variants"])
+    for variant in variants:
+        result = check(args.model, out_dir, variant, args.samples, args.tolerance)
+        print(f"{variant}: cosine to {result['reference']} embeddings over {result['samples']} recipes "
+              f"mean {result['mean_cosine']:.4f} p01 {result['p01_cosine']:.4f} min {result['min_cosine']:.4f} "
+              f"-> {'PASS' if result['passed'] else 'FAIL'} (tolerance {args.tolerance})")
+
+
+if __name__ == "__main__":
+    main()
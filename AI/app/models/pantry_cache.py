@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# rough per-entry overhead on top of the embedding itself (key, tuple, dict slot)
+ENTRY_OVERHEAD_BYTES = 200
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalise_item(name) -> str:
+    """
+    Lowercases an item name and collapses punctuation/whitespace into single spaces
+    """
+    return _NON_WORD.sub(" ", str(name).lower()).strip()
+
+
+def canonical_pantry(pantry_items) -> list:
+    """
+    Sorted, de-duplicated, normalised item names. Two pantries with the same
+    items in any order or casing give the same list
+    """
+    return sorted({name for name in (normalise_item(item) for item in pantry_items) if name})
+
+
+def pantry_to_text(pantry_items) -> str:
+    """
+    The text that gets encoded for a pantry
+    """
+    return " ".join(canonical_pantry(pantry_items))
+
+
+def pantry_key(pantry_text: str) -> str:
+    """
+    Cache key for the canonical pantry text that actually gets encoded
+    """
+    return hashlib.sha1(pantry_text.encode()).hexdigest()
+
+
+class PantryEmbeddingCache:
+    """
+    LRU + TTL cache of pantry embeddings keyed by the canonical pantry, so
+    identical pantries share an entry no matter which user (if any) sent them.
+
+    Bounded by `max_bytes`; least recently used entries are evicted first.
+    With a shared backend (redis) it also acts as an L1 in front of a cache
+    every worker can read.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600,
+                 shared=None, namespace: str = ""):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        # keeps embeddings from different models apart in the shared cache
+        self.namespace = namespace
+
+        self._entries = OrderedDict()  # key -> (expires_at, embedding)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls, namespace: str = ""):
+        """
+        PANTRY_CACHE_MAX_MB, PANTRY_CACHE_TTL_SECONDS and optional PANTRY_CACHE_REDIS_URL
+        """
+        shared = None
+        redis_url = os.getenv("PANTRY_CACHE_REDIS_URL")
+        if redis_url:
+            import redis  # only needed when a shared cache is configured
+            shared = redis.Redis.from_url(redis_url)
+        return cls(
+            max_bytes=int(float(os.getenv("PANTRY_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("PANTRY_CACHE_TTL_SECONDS", "3600")),
+            shared=shared,
+            namespace=namespace,
+        )
+
+    def get_many(self, keys: list) -> list:
+        """
+        Returns an embedding or None for each key
+        """
+        now = time.monotonic()
+        found = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] < now:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                found[i] = entry[1]
+                self.hits += 1
+
+        if missing and self.shared is not None:
+            values = self.shared.mget([self._shared_key(keys[i]) for i in missing])
+            still_missing = []
+            for i, value in zip(missing, values):
+                if value is None:
+                    still_missing.append(i)
+                    continue
+                found[i] = np.frombuffer(value, dtype="float32")
+                self._put_local(keys[i], found[i])
+            with self._lock:
+                self.shared_hits += len(missing) - len(still_missing)
+            missing = still_missing
+
+        with self._lock:
+            self.misses += len(missing)
+        return found
+
+    def put_many(self, keys: list, embeddings: list):
+        for key, embedding in zip(keys, embeddings):
+            self._put_local(key, embedding)
+
+        if self.shared is not None:
+            pipe = self.shared.pipeline()
+            for key, embedding in zip(keys, embeddings):
+                pipe.set(self._shared_key(key), np.asarray(embedding, dtype="float32").tobytes(),
+                         ex=int(self.ttl_seconds))
+            pipe.execute()
+
+    def get(self, key: str):
+        return self.get_many([key])[0]
+
+    def put(self, key: str, embedding):
+        self.put_many([key], [embedding])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put_local(self, key: str, embedding):
+        # copy so a cached row never keeps a whole batch array alive
+        embedding = np.array(embedding, dtype="float32")
+        size = embedding.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, embedding = self._entries.pop(key)
+        self._bytes -= embedding.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def _shared_key(self, key: str) -> str:
+        return f"stockd:pantry-emb:{self.namespace}:{key}"
@@ -0,0 +1,230 @@
+"""
+Batch precompute of every user's top-N recipes from their saved pantry.
+
+Compares each user's PantryItems signature (latest added_on, item count)
+with the last run and only recomputes users whose pantry changed, plus
+everyone when the index version, model, encoder (backend and variant) or
+top-N changed. Changed pantries are read in chunks of users, embedded in
+large batches, and searched against the mmapped index on a process pool
+while the next chunk encodes.
+The result is published as a new version of the precomputed store, which
+the recommender serves for unchanged pantries before falling back to a
+live search.
+
+Run it from cron after pantry-heavy periods, and after update_recipe_index.py
+(a new index version invalidates every row).
+
+Usage:
+    python precompute_recommendations.py                  # changed users only
+    python precompute_recommendations.py --full --top-n 50
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+from sqlalchemy import DateTime, create_engine, text, bindparam
+
+from recipe_index import load_artifact, current_version
+from pantry_cache import pantry_key, pantry_to_text
+from recommendation_store import PRECOMPUTED_DIR, RecommendationStore, short_key
+
+load_dotenv()
+
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_NAME = os.getenv("DB_NAME", "stockd_db")
+DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
+
+# each search worker maps the index once
+_worker_index = None
+
+
+def _init_worker(version: int, threads: int):
+    global _worker_index
+    faiss.omp_set_num_threads(threads)
+    _worker_index = load_artifact(version)[0]
+
+
+def _search_chunk(chunk_no: int, embeddings: np.ndarray, top_n: int):
+    similarities, ids = _worker_index.search(embeddings, top_n)
+    return chunk_no, ids.astype("int32"), np.where(ids >= 0, similarities, 0).astype("float32")
+
+
+def pantry_signatures(engine, chunk_size: int):
+    """
+    (user_ids, latest added_on as epoch seconds, item counts) for every user with a pantry
+    """
+    user_ids, last_added, counts = [], [], []
+    query = text(
+        "SELECT user_id, MAX(added_on) AS last_added, COUNT(*) AS items FROM PantryItems GROUP BY user_id"
+    ).columns(last_added=DateTime)
+    with engine.connect() as conn:
+        for row in conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query):
+            user_ids.append(row.user_id)
+            last_added.append(int(row.last_added.timestamp()) if row.last_added else 0)
+            counts.append(row.items)
+    order = np.argsort(np.array(user_ids, dtype="int64"), kind="stable")
+    return (np.array(user_ids, dtype="int64")[order], np.array(last_added, dtype="int64")[order],
+            np.array(counts, dtype="int32")[order])
+
+
+def changed_users(previous, user_ids: np.ndarray, last_added: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Positions (into user_ids) of users that are new or whose signature moved
+    """
+    if previous is None or len(previous.user_ids) == 0:
+        return np.arange(len(user_ids))
+    rows = previous.rows(user_ids)
+    known = rows >= 0
+    same = np.zeros(len(user_ids), dtype=bool)
+    same[known] = (previous.last_added[rows[known]] == last_added[known]) & \
+        (previous.item_counts[rows[known]] == counts[known])
+    return np.flatnonzero(~same)
+
+
+def iter_pantries(engine, user_ids: np.ndarray, chunk_users: int):
+    """
+    Streams (user_ids, pantries) for the given users, chunk_users at a time
+    """
+    query = text(
+        "SELECT user_id, item_name FROM PantryItems WHERE user_id IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+    with engine.connect() as conn:
+        for start in range(0, len(user_ids), chunk_users):
+            chunk = user_ids[start:start + chunk_users]
+            pantries = {int(user_id): [] for user_id in chunk}
+            for user_id, item_name in conn.execute(query, {"ids": chunk.tolist()}):
+                pantries[user_id].append(item_name)
+            yield chunk, [pantries[int(user_id)] for user_id in chunk]
+
+
+def load_encoder(model_name: str, encoder: str, variant: str, threads: int):
+    if encoder == "onnx":
+        from onnx_encoder import OnnxEncoder
+        return OnnxEncoder.load(model_name, variant=variant)
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-N recipes for users whose pantry changed")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--out", default=PRECOMPUTED_DIR)
+    parser.add_argument("--top-n", type=int, default=20, help="requests for more than this go live")
+    parser.add_argument("--full", action="store_true", help="recompute every user")
+    parser.add_argument("--chunk-users", type=int, default=5000, help="users read and searched together")
+    parser.add_argument("--batch-size", type=int, default=256, help="encode batch size")
+    parser.add_argument("--encoder", choices=("torch", "onnx"), default=os.getenv("RECIPE_ENCODER", "torch"),
+                        help="use what serving uses, rows from another encoder aren't served")
+    parser.add_argument("--onnx-variant", choices=("int8", "fp32"), default=os.getenv("ONNX_VARIANT", "int8"))
+    parser.add_argument("--encode-threads", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--workers", type=int, default=2, help="FAISS search processes")
+    parser.add_argument("--threads-per-worker", type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    args = parser.parse_args()
+
+    version = current_version()
+    if version is None:
+        raise SystemExit("No recipe index found. Run build_recipe_index.py first")
+    manifest = load_artifact(version)[2]
+    model_name = manifest["model_name"]
+    # anything that changes the embeddings or the results invalidates every row
+    encoder_name = "torch" if args.encoder == "torch" else f"onnx-{args.onnx_variant}"
+    settings = {
+        "index_version": version, "model_name": model_name, "encoder": encoder_name,
+        "top_n": args.top_n, "mode": "dense",
+    }
+
+    previous = RecommendationStore.load(args.out, mmap=False)
+    if previous is not None and any(previous.manifest.get(k) != v for k, v in settings.items()):
+        print(f"last run used {({k: previous.manifest.get(k) for k in settings})}, recomputing everyone")
+        previous = None
+    if args.full:
+        previous = None
+
+    start = time.perf_counter()
+    engine = create_engine(args.database_url)
+    user_ids, last_added, counts = pantry_signatures(engine, args.chunk_users)
+    todo = changed_users(previous, user_ids, last_added, counts)
+    removed = np.empty(0, dtype="int64") if previous is None else np.setdiff1d(previous.user_ids, user_ids)
+    print(f"index v{version}: {len(user_ids)} users with a pantry, {len(todo)} to recompute, {len(removed)} removed")
+
+    if previous is not None and len(todo) == 0 and len(removed) == 0:
+        print("precomputed recommendations are up to date")
+        return
+
+    encoder = load_encoder(model_name, args.encoder, args.onnx_variant, args.encode_threads) if len(todo) else None
+    new = {
+        "user_ids": user_ids[todo], "last_added": last_added[todo], "item_counts": counts[todo],
+        "pantry_keys": np.empty(len(todo), dtype="uint64"),
+        "recipe_ids": np.empty((len(todo), args.top_n), dtype="int32"),
+        "scores": np.empty((len(todo), args.top_n), dtype="float32"),
+    }
+    encode_seconds = 0.0
+    offsets = {}
+    pending = set()
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(version, args.threads_per_worker)
+    ) as pool:
+        offset = 0
+        for chunk_no, (chunk, pantries) in enumerate(iter_pantries(engine, user_ids[todo], args.chunk_users)):
+            texts = [pantry_to_text(pantry_items) for pantry_items in pantries]
+            keys = [pantry_key(t) for t in texts]
+            new["pantry_keys"][offset:offset + len(chunk)] = [short_key(k) for k in keys]
+
+            # users with the same pantry are encoded once
+            unique = {}
+            for t in texts:
+                unique.setdefault(t, len(unique))
+            encode_start = time.perf_counter()
+            embeddings = np.asarray(
+                encoder.encode(list(unique), batch_size=args.batch_size, normalize_embeddings=True), dtype="float32"
+            )
+            encode_seconds += time.perf_counter() - encode_start
+
+            # the search runs on the pool while this process encodes the next chunk
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, offsets, new)
+            offsets[chunk_no] = (offset, np.array([unique[t] for t in texts]))
+            pending.add(pool.submit(_search_chunk, chunk_no, embeddings, args.top_n))
+            offset += len(chunk)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done, offsets, new)
+
+    if previous is None:
+        previous = RecommendationStore.empty(args.top_n, {})
+    store = previous.merge(np.union1d(new["user_ids"], removed), new)
+    store.manifest = dict(settings, last_run={
+        "recomputed": int(len(todo)),
+        "removed": int(len(removed)),
+        "encode_seconds": round(encode_seconds, 2),
+        "total_seconds": round(time.perf_counter() - start, 2),
+    })
+    out_dir = store.save(args.out)
+    elapsed = time.perf_counter() - start
+    print(f"recomputed {len(todo)} users in {elapsed:.1f}s ({len(todo) / max(elapsed, 1e-9):.0f} users/sec, "
+          f"{encode_seconds:.1f}s encoding), wrote {len(store.user_ids)} users to {out_dir}")
+
+
+def _collect(done, offsets: dict, new: dict):
+    for future in done:
+        chunk_no, ids, scores = future.result()
+        offset, rows = offsets.pop(chunk_no)
+        new["recipe_ids"][offset:offset + len(rows)] = ids[rows]
+        new["scores"][offset:offset + len(rows)] = scores[rows]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import faiss
+
+from pantry_cache import normalise_item
+from ingredient_index import normalise_ingredient
+
+FILTERS_DIR = "filters"
+_ARRAYS = ("total_minutes", "rating", "category_codes", "categories", "allergens")
+
+# distinct filter combinations whose selections are kept per snapshot
+FILTER_CACHE_SIZE = int(os.getenv("RECIPE_FILTER_CACHE_SIZE", "128"))
+
+FILTER_FIELDS = ("max_minutes", "categories", "min_rating", "exclude_allergens")
+
+# keyword matching on the normalised ingredient names, so treat it as a guide
+# rather than a guarantee. (contains any of, unless it contains any of)
+ALLERGENS = {
+    "dairy": (
+        ("milk", "butter", "buttermilk", "cheese", "cream", "yogurt", "yoghurt", "ghee", "whey", "kefir",
+         "parmesan", "mozzarella", "cheddar", "ricotta", "feta", "mascarpone", "custard", "half and half"),
+        ("coconut milk", "coconut cream", "almond milk", "soy milk", "oat milk", "rice milk", "peanut butter",
+         "almond butter", "cocoa butter", "cream of tartar", "dairy free", "non dairy", "vegan"),
+    ),
+    "egg": (("egg", "egg white", "egg yolk", "mayonnaise", "mayo", "meringue"), ("egg free", "vegan")),
+    "gluten": (
+        ("flour", "wheat", "bread", "breadcrumb", "crouton", "pasta", "spaghetti", "macaroni", "noodle", "couscous",
+         "barley", "rye", "semolina", "bulgur", "tortilla", "pita", "soy sauce", "beer", "cracker", "panko",
+         "pastry", "biscuit", "bun", "lasagna", "penne", "fettuccine", "linguine", "orzo", "seitan"),
+        ("rice flour", "almond flour", "coconut flour", "corn flour", "potato flour", "chickpea flour",
+         "corn tortilla", "rice noodle", "gluten free", "tamari"),
+    ),
+    "peanut": (("peanut", "groundnut"), ()),
+    "tree_nut": (
+        ("almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "pine nut", "brazil nut",
+         "chestnut", "praline", "marzipan", "nutella"),
+        ("water chestnut",),
+    ),
+    "soy": (("soy", "soya", "soy sauce", "soybean", "tofu", "edamame", "miso", "tempeh", "tamari"), ()),
+    "fish": (
+        ("fish", "fish sauce", "salmon", "tuna", "cod", "anchovy", "sardine", "mackerel", "trout", "tilapia",
+         "halibut", "haddock", "snapper", "bass", "catfish", "swordfish", "worcestershire sauce"),
+        (),
+    ),
+    "shellfish": (
+        ("shrimp", "prawn", "crab", "lobster", "crawfish", "crayfish", "clam", "mussel", "oyster", "scallop",
+         "squid", "calamari", "octopus"),
+        (),
+    ),
+    "sesame": (("sesame", "tahini", "sesame oil", "sesame seed"), ()),
+}
+ALLERGEN_BITS = {name: 1 << bit for bit, name in enumerate(ALLERGENS)}
+
+# ISO 8601 durations as the parquet has them, e.g. PT24H45M or P1DT2H
+_DURATION = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def duration_minutes(value) -> float:
+    """
+    Minutes in an ISO 8601 duration, or in a plain number of minutes (the
+    Recipes table). NaN when missing or unreadable
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    match = _DURATION.match(str(value).strip())
+    if match is None or not any(match.groups()):
+        return np.nan
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return days * 1440 + hours * 60 + minutes + seconds / 60
+
+
+def total_minutes(df) -> np.ndarray:
+    """
+    Prep + cook time per row. TotalTime wins when the source has it, a
+    recipe with only one of prep / cook counts just that one
+    """
+    def column(name):
+        if name not in df:
+            return np.full(len(df), np.nan)
+        return np.array([duration_minutes(v) for v in df[name]], dtype="float64")
+
+    prep, cook = column("PrepTime"), column("CookTime")
+    both_missing = np.isnan(prep) & np.isnan(cook)
+    summed = np.where(both_missing, np.nan, np.nan_to_num(prep) + np.nan_to_num(cook))
+    total = column("TotalTime")
+    return np.where(np.isnan(total), summed, total)
+
+
+def _matcher(phrases):
+    phrases = [normalise_ingredient(p) for p in phrases]
+    return lambda padded: any(f" {p} " in padded for p in phrases)
+
+
+_ALLERGEN_MATCHERS = [
+    (ALLERGEN_BITS[name], _matcher(include), _matcher(exclude)) for name, (include, exclude) in ALLERGENS.items()
+]
+
+
+def allergen_mask(term: str) -> int:
+    """
+    Allergen bits for one normalised ingredient
+    """
+    padded = f" {term} "
+    mask = 0
+    for bit, contains, unless in _ALLERGEN_MATCHERS:
+        if contains(padded) and not unless(padded):
+            mask |= bit
+    return mask
+
+
+class Selection:
+    """
+    The recipes that pass one set of filters, as a bitmap over the RecipeId
+    space that FAISS checks during the search (IDSelectorBitmap)
+    """
+
+    def __init__(self, bitmap: np.ndarray, count: int, total: int):
+        self.bitmap = bitmap  # keeps the buffer the selector points at alive
+        self.selector = faiss.IDSelectorBitmap(bitmap)
+        self.count = count
+        self.fraction = count / max(total, 1)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        inside = (ids >= 0) & ((ids >> 3) < len(self.bitmap))
+        found = np.zeros(len(ids), dtype=bool)
+        found[inside] = (self.bitmap[ids[inside] >> 3] >> (ids[inside] & 7)) & 1 == 1
+        return found
+
+
+class RecipeFilters:
+    """
+    Per-row filter columns for an artifact, rows line up with the metadata
+    table like the ingredient index. total_minutes and rating are NaN when
+    unknown, category_codes index into the sorted categories (-1 for none)
+    and allergens holds ALLERGEN_BITS.
+
+    A recipe with an unknown time or rating never passes a filter on it
+    """
+
+    def __init__(self, total_minutes, rating, category_codes, categories, allergens):
+        self.total_minutes = total_minutes
+        self.rating = rating
+        self.category_codes = category_codes
+        self.categories = categories
+        self.allergens = allergens
+        self._lock = threading.Lock()
+        self._selections = OrderedDict()
+
+    @classmethod
+    def build(cls, metadata, ingredients):
+        """
+        Builds the columns from a metadata DataFrame (TotalMinutes,
+        RecipeCategory and AggregatedRating if it has them) and the
+        artifact's IngredientIndex for allergens
+        """
+        n = len(metadata)
+        minutes = metadata["TotalMinutes"].to_numpy("float32", na_value=np.nan) if "TotalMinutes" in metadata \
+            else np.full(n, np.nan, dtype="float32")
+        rating = metadata["AggregatedRating"].to_numpy("float32", na_value=np.nan) if "AggregatedRating" in metadata \
+            else np.full(n, np.nan, dtype="float32")
+
+        names = [normalise_item(c) if isinstance(c, str) else "" for c in metadata.get("RecipeCategory", [None] * n)]
+        categories = np.array(sorted({c for c in names if c}), dtype=str)
+        lookup = {c: code for code, c in enumerate(categories)}
+        category_codes = np.array([lookup.get(c, -1) for c in names], dtype="int32")
+
+        # one check per distinct ingredient, spread to the recipes using it through the postings
+        allergens = np.zeros(n, dtype="uint16")
+        for term_id, term in enumerate(ingredients.vocab):
+            mask = allergen_mask(str(term))
+            if mask:
+                allergens[ingredients.postings[ingredients.indptr[term_id]:ingredients.indptr[term_id + 1]]] |= mask
+        return cls(minutes, rating, category_codes, categories, allergens)
+
+    def save(self, artifact_dir: str):
+        out_dir = os.path.join(artifact_dir, FILTERS_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(out_dir, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, artifact_dir: str, mmap: bool = True):
+        in_dir = os.path.join(artifact_dir, FILTERS_DIR)
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(in_dir, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS))
+
+    @staticmethod
+    def key(filters: dict) -> tuple:
+        """
+        Canonical, hashable form of a filters dict. Empty / None fields are
+        dropped, so {} and {"categories": []} both mean no filter
+        """
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown recipe filters {sorted(unknown)}, expected some of {FILTER_FIELDS}")
+        allergens = sorted(set(filters.get("exclude_allergens") or ()))
+        bad = [a for a in allergens if a not in ALLERGEN_BITS]
+        if bad:
+            raise ValueError(f"Unknown allergens {bad}, expected some of {tuple(ALLERGENS)}")
+        return (
+            ("max_minutes", filters.get("max_minutes")),
+            ("categories", tuple(sorted({normalise_item(c) for c in filters.get("categories") or ()}))),
+            ("min_rating", filters.get("min_rating")),
+            ("exclude_allergens", tuple(allergens)),
+        )
+
+    def row_mask(self, key: tuple) -> np.ndarray:
+        options = dict(key)
+        keep = np.ones(len(self.allergens), dtype=bool)
+        if options["max_minutes"] is not None:
+            keep &= self.total_minutes <= options["max_minutes"]  # NaN compares False
+        if options["min_rating"] is not None:
+            keep &= self.rating >= options["min_rating"]
+        if options["categories"]:
+            codes = [int(np.searchsorted(self.categories, c)) for c in options["categories"]]
+            codes = [code for code, c in zip(codes, options["categories"])
+                     if code < len(self.categories) and self.categories[code] == c]
+            keep &= np.isin(self.category_codes, codes)
+        if options["exclude_allergens"]:
+            excluded = sum(ALLERGEN_BITS[a] for a in options["exclude_allergens"])
+            keep &= (self.allergens & excluded) == 0
+        return keep
+
+    def select(self, filters: dict, recipe_ids: np.ndarray):
+        """
+        The Selection for a filters dict, None if it doesn't filter anything.
+        Cached since the same few combinations come up again and again.
+        recipe_ids is the sorted RecipeId column of the metadata table
+        """
+        key = self.key(filters)
+        if all(value in (None, ()) for _, value in key):
+            return None
+        with self._lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        ids = recipe_ids[self.row_mask(key)]
+        allowed = np.zeros(int(recipe_ids[-1]) + 1 if len(recipe_ids) else 1, dtype=bool)
+        allowed[ids] = True
+        selection = Selection(np.packbits(allowed, bitorder="little"), len(ids), len(recipe_ids))
+
+        with self._lock:
+            self._selections[key] = selection
+            while len(self._selections) > FILTER_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import faiss
+
+from ingredient_index import IngredientIndex, INGREDIENTS_DIR
+from recipe_filters import RecipeFilters, FILTERS_DIR
+
+# build paths from this file since relative paths can be unreliable
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.normpath(os.path.join(BASE_DIR, "../data/recipes.parquet"))
+ARTIFACTS_DIR = os.path.normpath(os.getenv("RECIPE_ARTIFACTS_DIR", os.path.join(BASE_DIR, "artifacts")))
+BUILD_DIR = os.path.normpath(os.getenv("RECIPE_BUILD_DIR", os.path.join(BASE_DIR, "index_build")))
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# columns kept from the recipes parquet. RecipeId is used as the FAISS id so
+# results can be mapped back to metadata no matter what order shards finish in
+METADATA_COLUMNS = ["RecipeId", "Name", "RecipeIngredientParts"]
+# read when the parquet has them, the times end up as a single TotalMinutes
+# column. they feed the search filters (recipe_filters.py)
+FILTER_SOURCE_COLUMNS = ["PrepTime", "CookTime", "TotalTime", "RecipeCategory", "AggregatedRating"]
+
+INDEX_FILE = "index.faiss"
+# uncompressed feather (arrow ipc) so workers can memory map it instead of
+# deserialising their own copy
+METADATA_FILE = "recipes.feather"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+# flat is an exact brute force scan, ivfpq and hnsw trade a little recall for
+# much less memory (ivfpq) or much faster queries (hnsw)
+INDEX_TYPES = ("flat", "ivfpq", "hnsw")
+
+# search time knobs, can be overridden per process without rebuilding
+# IO_FLAG_MMAP_IFC maps the vectors straight from the file (faiss >= 1.9), plain
+# IO_FLAG_MMAP still copies flat codes into memory on older builds
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+SEARCH_PARAM_ENV = {
+    "nprobe": "RECIPE_INDEX_NPROBE",
+    "efSearch": "RECIPE_INDEX_EF_SEARCH",
+}
+
+
+def ingredients_to_text(parts) -> str:
+    """
+    Joins a RecipeIngredientParts value into a single lowercase string
+    """
+    # parquet list columns come back as numpy arrays, not python lists
+    if isinstance(parts, (list, tuple, np.ndarray)):
+        return " ".join(str(p) for p in parts).lower()
+    if parts is None:
+        return ""
+    return str(parts).lower()
+
+
+def index_factory_string(index_type: str, nlist: int = 1024, pq_m: int = 48, hnsw_m: int = 32) -> str:
+    """
+    Returns the faiss index_factory description for an index type.
+    Everything is wrapped in IDMap2 so ids are RecipeIds, not row positions
+    """
+    if index_type == "flat":
+        return "IDMap2,Flat"
+    if index_type == "ivfpq":
+        return f"IDMap2,IVF{nlist},PQ{pq_m}"
+    if index_type == "hnsw":
+        return f"IDMap2,HNSW{hnsw_m}"
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def make_index(index_type: str, dim: int, nlist: int = 1024, pq_m: int = 48,
+               hnsw_m: int = 32, ef_construction: int = 200):
+    """
+    Creates an empty inner product index. ivfpq still needs train() before add
+    """
+    index = faiss.index_factory(
+        dim, index_factory_string(index_type, nlist, pq_m, hnsw_m), faiss.METRIC_INNER_PRODUCT
+    )
+    if index_type == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = ef_construction
+    return index
+
+
+def apply_search_params(index, params: dict):
+    """
+    Sets nprobe / efSearch on an index. Env vars win over the manifest so a
+    box can be tuned without rebuilding
+    """
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        value = os.getenv(SEARCH_PARAM_ENV.get(name, ""), value)
+        space.set_index_parameter(index, name, int(value))
+
+
+def filtered_search_params(index, selector, widen: float = 1.0):
+    """
+    SearchParameters that restrict a search to the ids in `selector`. Passing
+    params replaces the index's own nprobe / efSearch, so those are carried
+    over, multiplied by `widen` to make up for candidates the filter drops
+    """
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(inner.nlist, int(np.ceil(inner.nprobe * widen))))
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(np.ceil(inner.hnsw.efSearch * widen)))
+    return faiss.SearchParameters(sel=selector)
+
+
+def version_dir(version: int) -> str:
+    return os.path.join(ARTIFACTS_DIR, f"v{version:04d}")
+
+
+def current_version():
+    """
+    Returns the version number CURRENT points at, or None if nothing has been built
+    """
+    path = os.path.join(ARTIFACTS_DIR, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return int(f.read().strip())
+
+
+def next_version() -> int:
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    versions = [
+        int(name[1:]) for name in os.listdir(ARTIFACTS_DIR)
+        if name.startswith("v") and name[1:].isdigit()
+    ]
+    return max(versions, default=0) + 1
+
+
+def publish_version(version: int):
+    """
+    Points CURRENT at a finished version. os.replace is atomic so readers
+    either see the old version or the new one, never a half written file
+    """
+    tmp_path = os.path.join(ARTIFACTS_DIR, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(str(version))
+    os.replace(tmp_path, os.path.join(ARTIFACTS_DIR, CURRENT_FILE))
+
+
+def write_artifact(index, metadata: pd.DataFrame, manifest: dict, version: int = None,
+                   extra_arrays: dict = None) -> str:
+    """
+    Writes index, metadata and manifest into a new version directory and publishes it.
+    extra_arrays are saved next to them as <name>.npy before the version goes live
+    """
+    if version is None:
+        version = next_version()
+    out_dir = version_dir(version)
+    os.makedirs(out_dir, exist_ok=True)
+
+    faiss.write_index(index, os.path.join(out_dir, INDEX_FILE))
+
+    # sorted by RecipeId so ids can be looked up with searchsorted, and written
+    # as a single chunk so the id column maps to numpy without a copy
+    metadata = metadata.sort_values("RecipeId").reset_index(drop=True)
+    feather.write_feather(
+        metadata,
+        os.path.join(out_dir, METADATA_FILE),
+        compression="uncompressed",
+        chunksize=max(1, len(metadata))
+    )
+    ingredients = IngredientIndex.build(metadata["RecipeIngredientParts"].tolist())
+    ingredients.save(out_dir)
+    RecipeFilters.build(metadata, ingredients).save(out_dir)
+    for name, array in (extra_arrays or {}).items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+
+    manifest = dict(manifest)
+    manifest["version"] = version
+    manifest["count"] = int(index.ntotal)
+    manifest["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    publish_version(version)
+    return out_dir
+
+
+def load_artifact(version: int = None, mmap: bool = True):
+    """
+    Loads a built index artifact (CURRENT by default).
+    Returns (index, metadata, manifest) where metadata is a pyarrow Table.
+
+    With mmap the index vectors and metadata are mapped from the page cache, so
+    every worker on the box shares one copy and startup doesn't deserialise
+    anything. Mapped indexes are read only
+    """
+    if version is None:
+        version = current_version()
+    if version is None:
+        raise FileNotFoundError(
+            f"No recipe index found in {ARTIFACTS_DIR}. Run build_recipe_index.py first"
+        )
+
+    art_dir = version_dir(version)
+    with open(os.path.join(art_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    index = faiss.read_index(os.path.join(art_dir, INDEX_FILE), MMAP_FLAG if mmap else 0)
+    apply_search_params(index, manifest.get("search_params", {}))
+    metadata = feather.read_table(os.path.join(art_dir, METADATA_FILE), memory_map=mmap)
+    return index, metadata, manifest
+
+
+def lookup_rows(recipe_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    Maps FAISS result ids to metadata row numbers. recipe_ids is the sorted
+    RecipeId column of the metadata table
+    """
+    return np.searchsorted(recipe_ids, ids)
+
+
+class IndexSnapshot:
+    """
+    Everything search needs from one artifact version, loaded together.
+
+    Searches grab a reference to one snapshot and use it throughout, so
+    swapping in a newer version never mixes an old index with new metadata
+    and never pulls the index out from under an in-flight query
+    """
+
+    def __init__(self, version: int = None, mmap: bool = True):
+        self.index, self.recipes, self.manifest = load_artifact(version, mmap)
+        self.version = self.manifest["version"]
+        self.recipe_ids = self.recipes.column("RecipeId").to_numpy()
+
+        # artifacts built before the ingredient index existed only support dense mode
+        self.ingredients = None
+        art_dir = version_dir(self.version)
+        if os.path.isdir(os.path.join(art_dir, INGREDIENTS_DIR)):
+            self.ingredients = IngredientIndex.load(art_dir, mmap)
+        # same for the filter columns, those only support unfiltered search
+        self.filters = None
+        if os.path.isdir(os.path.join(art_dir, FILTERS_DIR)):
+            self.filters = RecipeFilters.load(art_dir, mmap)
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        return lookup_rows(self.recipe_ids, ids)
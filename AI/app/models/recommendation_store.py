@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+
+from recipe_index import BASE_DIR
+
+# written by precompute_recommendations.py, versioned like the index artifacts
+PRECOMPUTED_DIR = os.path.normpath(os.getenv("PRECOMPUTED_DIR", os.path.join(BASE_DIR, "precomputed")))
+# how often (seconds) serving checks CURRENT for a newer run, 0 turns it off
+PRECOMPUTED_RELOAD_SECONDS = float(os.getenv("PRECOMPUTED_RELOAD_SECONDS", "60"))
+KEEP_VERSIONS = 2
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+# one row per user sorted by user_id, recipe_ids / scores are (users, top_n) padded with -1 / 0
+_ARRAYS = ("user_ids", "pantry_keys", "last_added", "item_counts", "recipe_ids", "scores")
+
+
+def short_key(pantry_key: str) -> int:
+    """
+    The first 64 bits of a pantry_key() digest, plenty to tell pantries apart
+    """
+    return int(pantry_key[:16], 16)
+
+
+def encoder_backend(encoder) -> str:
+    """
+    How the query encoder is recorded in the store: "torch", or "onnx-int8" /
+    "onnx-fp32" for an OnnxEncoder. Rows from a different encoder are not served
+    """
+    variant = getattr(encoder, "variant", None)
+    return f"onnx-{variant}" if variant else "torch"
+
+
+def _version_dir(store_dir: str, version: int) -> str:
+    return os.path.join(store_dir, f"v{version:04d}")
+
+
+def _current_version(store_dir: str):
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class RecommendationStore:
+    """
+    Top-N recipes per user from the last batch run, as plain sorted arrays
+    so a lookup is one searchsorted. Each row keeps the pantry it was
+    computed for (pantry_keys) and the PantryItems signature the job
+    compares against to find changed users (latest added_on, item count)
+    """
+
+    def __init__(self, arrays: dict, manifest: dict):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.manifest = manifest
+        self.version = manifest.get("version")
+
+    @classmethod
+    def empty(cls, top_n: int, manifest: dict):
+        return cls({
+            "user_ids": np.empty(0, dtype="int64"),
+            "pantry_keys": np.empty(0, dtype="uint64"),
+            "last_added": np.empty(0, dtype="int64"),
+            "item_counts": np.empty(0, dtype="int32"),
+            "recipe_ids": np.empty((0, top_n), dtype="int32"),
+            "scores": np.empty((0, top_n), dtype="float32"),
+        }, manifest)
+
+    @classmethod
+    def load(cls, store_dir: str = PRECOMPUTED_DIR, version: int = None, mmap: bool = True):
+        """
+        The CURRENT run (or a given version), None if the job hasn't run yet
+        """
+        if version is None:
+            version = _current_version(store_dir)
+        if version is None:
+            return None
+        in_dir = _version_dir(store_dir, version)
+        with open(os.path.join(in_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        mode = "r" if mmap else None
+        return cls({name: np.load(os.path.join(in_dir, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS}, manifest)
+
+    def save(self, store_dir: str = PRECOMPUTED_DIR) -> str:
+        """
+        Writes a new version, points CURRENT at it and drops all but the last
+        KEEP_VERSIONS (serving processes may still have the previous one mapped)
+        """
+        version = (_current_version(store_dir) or 0) + 1
+        out_dir = _version_dir(store_dir, version)
+        os.makedirs(out_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(out_dir, f"{name}.npy"), getattr(self, name))
+        self.manifest = dict(self.manifest, version=version, users=len(self.user_ids),
+                             created_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        self.version = version
+        with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+            json.dump(self.manifest, f, indent=2)
+
+        tmp_path = os.path.join(store_dir, CURRENT_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_path, os.path.join(store_dir, CURRENT_FILE))
+
+        for old in range(version - KEEP_VERSIONS, 0, -1):
+            old_dir = _version_dir(store_dir, old)
+            if not os.path.isdir(old_dir):
+                break
+            shutil.rmtree(old_dir)
+        return out_dir
+
+    def rows(self, user_ids: np.ndarray) -> np.ndarray:
+        """
+        Row of each user, -1 for users without precomputed results
+        """
+        user_ids = np.asarray(user_ids, dtype="int64")
+        pos = np.minimum(np.searchsorted(self.user_ids, user_ids), max(len(self.user_ids) - 1, 0))
+        found = (pos < len(self.user_ids)) & (self.user_ids[pos] == user_ids) if len(self.user_ids) else \
+            np.zeros(len(user_ids), dtype=bool)
+        return np.where(found, pos, -1)
+
+    def merge(self, drop_user_ids: np.ndarray, new: dict):
+        """
+        A new store with drop_user_ids removed and the `new` rows added
+        """
+        keep = ~np.isin(self.user_ids, drop_user_ids)
+        arrays = {name: np.concatenate([np.asarray(getattr(self, name))[keep], new[name]]) for name in _ARRAYS}
+        order = np.argsort(arrays["user_ids"], kind="stable")
+        return RecommendationStore({name: array[order] for name, array in arrays.items()}, dict(self.manifest))
+
+
+class PrecomputedRecommendations:
+    """
+    What serving holds: the current store, swapped for a newer run every
+    PRECOMPUTED_RELOAD_SECONDS like the index. A hit needs the same index
+    version, encoder and mode, enough results for top_n and the same pantry
+    the row was computed for, anything else is left to the live search.
+    Only lookups for a user_id are counted
+    """
+
+    def __init__(self, store_dir: str = PRECOMPUTED_DIR, reload_seconds: float = PRECOMPUTED_RELOAD_SECONDS):
+        self.store_dir = store_dir
+        self.reload_seconds = reload_seconds
+        self.store = RecommendationStore.load(store_dir)
+        self._reload_lock = threading.Lock()
+        self._lock = threading.Lock()  # guards the counters, lookups run on several threads
+        self._last_check = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # user has a row but their pantry changed since the run
+
+    def current(self):
+        if self.reload_seconds <= 0 or time.monotonic() - self._last_check < self.reload_seconds:
+            return self.store
+        if not self._reload_lock.acquire(blocking=False):
+            return self.store
+        try:
+            self._last_check = time.monotonic()
+            version = _current_version(self.store_dir)
+            if version is not None and (self.store is None or version != self.store.version):
+                self.store = RecommendationStore.load(self.store_dir, version)
+                print(f"switched to precomputed recommendations v{version} ({self.store.manifest['users']} users)")
+        finally:
+            self._reload_lock.release()
+        return self.store
+
+    def lookup(self, index_version: int, encoder: str, user_ids: list, pantry_keys: list, top_n: int,
+               mode: str) -> list:
+        """
+        (recipe_ids, scores) per user, None where the live search has to
+        answer. encoder is encoder_backend() of the serving encoder
+        """
+        results = [None] * len(user_ids)
+        known = [i for i, user_id in enumerate(user_ids) if user_id is not None]
+        if not known:
+            return results
+        store = self.current()
+        if (store is None or store.manifest["index_version"] != index_version
+                or store.manifest.get("encoder") != encoder
+                or store.manifest["mode"] != mode or store.manifest["top_n"] < top_n):
+            with self._lock:
+                self.misses += len(known)
+            return results
+
+        stale = 0
+        rows = store.rows([user_ids[i] for i in known])
+        for i, row in zip(known, rows):
+            if row < 0:
+                continue
+            if store.pantry_keys[row] != short_key(pantry_keys[i]):
+                stale += 1
+                continue
+            ids = np.asarray(store.recipe_ids[row, :top_n])
+            found = ids >= 0
+            results[i] = (ids[found].astype("int64"), np.asarray(store.scores[row, :top_n])[found])
+        hits = sum(r is not None for r in results)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(known) - hits
+            self.stale += stale
+        return results
+
+    def stats(self) -> dict:
+        store = self.store
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "version": store.version if store is not None else 0,
+                "users": len(store.user_ids) if store is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
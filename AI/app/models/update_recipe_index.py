@@ -0,0 +1,175 @@
+"""
+Applies changes from the Recipes / RecipeIngredients tables to the recipe index.
+
+Only recipes whose `updated_at` is at or after the last run's watermark are
+read from the database and encoded, which is the part that scales with the
+number of changes. Their old vectors are removed from the ID-mapped index and
+the new ones added under the same RecipeId, recipes deleted from the table are
+removed, and the result is published as a new artifact version. Serving
+processes pick it up on their next reload check without a restart.
+
+Publishing is a full rewrite of the artifact though: the whole index is read
+into memory (mapped indexes are read only), the metadata table is rewritten,
+and the ingredient index and filter arrays are rebuilt from every recipe. So
+beyond the encoding, each run costs about as much memory and time as writing
+the corpus out again, and it suits small batches of edits on a schedule, not
+per-recipe updates.
+
+Recipes.id is expected to share the RecipeId id space of the corpus, so a
+table row with the same id replaces the corpus recipe. Anything that edits a
+recipe's ingredients must also bump Recipes.updated_at.
+
+Usage:
+    python update_recipe_index.py
+"""
+import os
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import faiss
+from dotenv import load_dotenv
+from sqlalchemy import DateTime, create_engine, text, bindparam
+
+from recipe_index import (
+    MODEL_NAME, current_version, ingredients_to_text, load_artifact, version_dir, write_artifact,
+)
+from recipe_filters import total_minutes
+
+load_dotenv()
+
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_NAME = os.getenv("DB_NAME", "stockd_db")
+DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
+
+# recipe ids that came from the database rather than the parquet corpus, kept
+# per version so deletions can be detected without touching corpus recipes
+DB_IDS_FILE = "db_ids.npy"
+EPOCH = datetime(1970, 1, 1)
+
+
+def fetch_changes(engine, since: datetime, seen_at_since: set, chunk_size: int = 1000):
+    """
+    Returns (changed recipes DataFrame, every id currently in Recipes, new
+    watermark, ids stamped exactly at the new watermark).
+
+    updated_at only has second precision, so rows stamped at the watermark are
+    re-read and skipped if the last run already indexed them
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT id, recipe_name, prep_time, cook_time, updated_at FROM Recipes WHERE updated_at >= :since")
+            .columns(updated_at=DateTime),
+            {"since": since}
+        ).all()
+        changed = [row for row in rows if not (row.updated_at == since and row.id in seen_at_since)]
+        all_ids = np.array(conn.execute(text("SELECT id FROM Recipes")).scalars().all(), dtype="int64")
+
+        parts = {row.id: [] for row in changed}
+        ingredients_query = text(
+            "SELECT recipe_id, ingredient_name FROM RecipeIngredients WHERE recipe_id IN :ids ORDER BY id"
+        ).bindparams(bindparam("ids", expanding=True))
+        ids = list(parts)
+        for start in range(0, len(ids), chunk_size):
+            for recipe_id, ingredient_name in conn.execute(ingredients_query, {"ids": ids[start:start + chunk_size]}):
+                parts[recipe_id].append(ingredient_name)
+
+    df = pd.DataFrame({
+        "RecipeId": np.array([row.id for row in changed], dtype="int64"),
+        "Name": [row.recipe_name for row in changed],
+        "RecipeIngredientParts": [parts[row.id] for row in changed],
+        # the table keeps minutes, no category or rating
+        "PrepTime": [row.prep_time for row in changed],
+        "CookTime": [row.cook_time for row in changed],
+    })
+    df["TotalMinutes"] = total_minutes(df).astype("float32")
+    df = df.drop(columns=["PrepTime", "CookTime"])
+    watermark = max((row.updated_at for row in changed if row.updated_at), default=since)
+    at_watermark = {row.id for row in rows if row.updated_at == watermark}
+    return df, all_ids, watermark, at_watermark
+
+
+def encode(model_name: str, texts: list, batch_size: int) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    return model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=False,
+        normalize_embeddings=True
+    ).astype("float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply new/changed/deleted Recipes rows to the index")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    base_version = current_version()
+    if base_version is None:
+        raise SystemExit("No recipe index to update. Run build_recipe_index.py first")
+
+    # a plain load, mapped indexes are read only. this and write_artifact below
+    # are O(corpus), only the encoding is O(changes)
+    index, metadata, manifest = load_artifact(base_version, mmap=False)
+    db_ids_path = os.path.join(version_dir(base_version), DB_IDS_FILE)
+    db_ids = np.load(db_ids_path) if os.path.exists(db_ids_path) else np.empty(0, dtype="int64")
+    since = datetime.fromisoformat(manifest["db_watermark"]) if manifest.get("db_watermark") else EPOCH
+
+    start = time.perf_counter()
+    engine = create_engine(args.database_url)
+    changed, all_db_ids, watermark, at_watermark = fetch_changes(
+        engine, since, set(manifest.get("db_watermark_ids", []))
+    )
+    deleted = np.setdiff1d(db_ids, all_db_ids)
+    changed_ids = changed["RecipeId"].to_numpy()
+    print(f"v{base_version}: {len(changed)} new/changed and {len(deleted)} deleted recipes since {since}")
+
+    if len(changed) == 0 and len(deleted) == 0:
+        print("index is up to date")
+        return
+
+    existing = metadata.column("RecipeId").to_numpy()
+    to_remove = np.intersect1d(np.union1d(changed_ids, deleted), existing)
+    if len(to_remove) and manifest.get("index_type") == "hnsw":
+        raise SystemExit("HNSW indexes can't remove vectors, run build_recipe_index.py for a full rebuild")
+
+    encode_start = time.perf_counter()
+    embeddings = encode(
+        manifest.get("model_name", MODEL_NAME),
+        [ingredients_to_text(parts) for parts in changed["RecipeIngredientParts"]],
+        args.batch_size
+    )
+    encode_seconds = time.perf_counter() - encode_start
+
+    if len(to_remove):
+        index.remove_ids(faiss.IDSelectorBatch(to_remove))
+    if len(changed_ids):
+        index.add_with_ids(embeddings, changed_ids)
+
+    metadata = metadata.to_pandas()
+    metadata = pd.concat([metadata[~metadata["RecipeId"].isin(to_remove)], changed], ignore_index=True)
+    db_ids = np.union1d(np.setdiff1d(db_ids, deleted), changed_ids)
+
+    manifest.update({
+        "parent_version": base_version,
+        "db_watermark": watermark.isoformat(),
+        "db_watermark_ids": sorted(int(i) for i in at_watermark),
+        "last_update": {
+            "changed": int(len(changed)),
+            "deleted": int(len(deleted)),
+            "encode_seconds": round(encode_seconds, 2),
+            "total_seconds": round(time.perf_counter() - start, 2),
+        },
+    })
+    out_dir = write_artifact(index, metadata, manifest, extra_arrays={"db_ids": db_ids})
+    print(f"encoded {len(changed)} recipes in {encode_seconds:.1f}s, wrote {index.ntotal} recipes to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
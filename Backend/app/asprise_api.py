@@ -1,4 +1,6 @@
-import requests
+import asyncio
+import random
+import httpx
 from dotenv import load_dotenv
 import os
 
@@ -7,10 +9,49 @@ load_dotenv()
 ASPRISE_API_URL = os.getenv("ASPRISE_API_URL")
 ASPRISE_CLIENT_ID = os.getenv("ASPRISE_CLIENT_ID")
 
-def send_receipt_to_asprise(image_bytes: bytes, filename: str) -> dict:
+ASPRISE_TIMEOUT_SECONDS = float(os.getenv("ASPRISE_TIMEOUT_SECONDS", "30"))
+ASPRISE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("ASPRISE_CONNECT_TIMEOUT_SECONDS", "5"))
+ASPRISE_MAX_CONCURRENCY = int(os.getenv("ASPRISE_MAX_CONCURRENCY", "8"))
+ASPRISE_MAX_RETRIES = int(os.getenv("ASPRISE_MAX_RETRIES", "2"))
+
+# status codes worth trying again, anything else is the caller's problem
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client = None
+_semaphore = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    One pooled client per process so connections to Asprise are reused
+    """
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(ASPRISE_TIMEOUT_SECONDS, connect=ASPRISE_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=ASPRISE_MAX_CONCURRENCY,
+                max_keepalive_connections=ASPRISE_MAX_CONCURRENCY,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(ASPRISE_MAX_CONCURRENCY)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def send_receipt_to_asprise(image_bytes: bytes, filename: str) -> dict:
     """
-    Sends the image to Asprise OCR API and returns the JSON response
+    Sends the image to Asprise OCR API and returns the JSON response.
+    Retries timeouts, connection errors and 429/5xx with exponential backoff
     """
+    client = get_client()
+
     # File payload
     files = {
         "file": (filename, image_bytes),
@@ -18,12 +59,25 @@ def send_receipt_to_asprise(image_bytes: bytes, filename: str) -> dict:
 
     # Data payload
     data = {
-        "client_id": ASPRISE_CLIENT_ID,   # Using "TEST" for testing purposes 
+        "client_id": ASPRISE_CLIENT_ID,   # Using "TEST" for testing purposes
         "recognizer": "auto",           # Using "auto" for automatic recognition
         "ref_no": "receipt-ocr",        # Reference number for tracking
     }
 
-    response = requests.post(ASPRISE_API_URL, files=files, data=data)
+    attempt = 0
+    while True:
+        try:
+            # bounded so a burst of uploads can't open unlimited OCR calls
+            async with _semaphore:
+                response = await client.post(ASPRISE_API_URL, files=files, data=data)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= ASPRISE_MAX_RETRIES:
+                break
+        except (httpx.TimeoutException, httpx.TransportError):
+            if attempt >= ASPRISE_MAX_RETRIES:
+                raise
+
+        attempt += 1
+        await asyncio.sleep(0.5 * 2 ** (attempt - 1) + random.uniform(0, 0.25))
 
     # Error handling
     response.raise_for_status()
@@ -0,0 +1,293 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.orm import Session
+from app.database.database import async_engine, DB_USER
+from app.database.models import AuditLog, PantryItem, User
+
+load_dotenv()
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "1") == "1"
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+# past this many unwritten events (database down) the oldest go to the spill file
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "100000"))
+# optional append-only JSON lines copy of every event
+AUDIT_LOG_FILE = os.getenv("AUDIT_LOG_FILE")
+# events that couldn't reach the database, replayed on the next start
+AUDIT_SPILL_FILE = os.getenv("AUDIT_SPILL_FILE", "audit_spill.jsonl")
+# how long shutdown waits for the writer to finish its last flush
+AUDIT_STOP_TIMEOUT_SECONDS = float(os.getenv("AUDIT_STOP_TIMEOUT_SECONDS", "10"))
+
+# the columns the old MySQL triggers recorded, per table
+AUDITED_COLUMNS = {
+    User: ("name", "email", "picture", "client_id", "role"),
+    PantryItem: ("item_name", "category", "storage", "quantity_value", "quantity_unit"),
+}
+PENDING_KEY = "audit_pending"
+
+
+def audit_event(action: str, table_name: str, record_id, user_id, changes: dict) -> dict:
+    return {
+        "timestamp": datetime.utcnow(),
+        "db_user": DB_USER,
+        "user_id": None if user_id is None else str(user_id),
+        "action": action,
+        "table_name": table_name,
+        "record_id": None if record_id is None else str(record_id),
+        "changes": changes,
+    }
+
+
+def _owner_id(obj):
+    # Users rows are their own user, pantry rows belong to user_id
+    return obj.id if isinstance(obj, User) else obj.user_id
+
+
+def record_audit_events(db, events: list):
+    """
+    Queues events on a session (sync or async) for anything written with Core
+    statements the ORM doesn't see. They're kept only if the session commits
+    """
+    if not AUDIT_ENABLED or not events:
+        return
+    session = getattr(db, "sync_session", db)
+    session.info.setdefault(PENDING_KEY, []).extend(events)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flush(session, flush_context):
+    if not AUDIT_ENABLED:
+        return
+    events = []
+    for obj in session.new:
+        columns = AUDITED_COLUMNS.get(type(obj))
+        if columns:
+            values = {col: getattr(obj, col) for col in columns}
+            events.append(audit_event("INSERT", obj.__tablename__, obj.id, _owner_id(obj), values))
+
+    for obj in session.dirty:
+        columns = AUDITED_COLUMNS.get(type(obj))
+        if not columns or not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        old, new = {}, {}
+        for col in columns:
+            history = state.attrs[col].history
+            new[col] = getattr(obj, col)
+            old[col] = history.deleted[0] if history.deleted else new[col]
+        if old != new:
+            events.append(audit_event("UPDATE", obj.__tablename__, obj.id, _owner_id(obj), {"old": old, "new": new}))
+
+    for obj in session.deleted:
+        columns = AUDITED_COLUMNS.get(type(obj))
+        if columns:
+            values = {col: getattr(obj, col) for col in columns}
+            events.append(audit_event("DELETE", obj.__tablename__, obj.id, _owner_id(obj), values))
+
+    if events:
+        session.info.setdefault(PENDING_KEY, []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_commit(session):
+    events = session.info.pop(PENDING_KEY, None)
+    if events:
+        audit_writer.add(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def _to_json(event_row: dict) -> str:
+    return json.dumps({**event_row, "timestamp": event_row["timestamp"].isoformat()}, default=str)
+
+
+def _from_json(line: str) -> dict:
+    event_row = json.loads(line)
+    event_row["timestamp"] = datetime.fromisoformat(event_row["timestamp"])
+    return event_row
+
+
+def _append_lines(path: str, events: list):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(_to_json(e) + "\n" for e in events))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class AuditWriter:
+    """
+    Buffers committed audit events in memory and writes them to audit_logs
+    in multi-row inserts from a background task, so writers never wait on
+    the audit table. Anything it can't write is spilled to AUDIT_SPILL_FILE
+    and replayed on the next start instead of being lost
+    """
+
+    def __init__(self):
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._task = None
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+        self.written = 0
+        self.spilled = 0
+        self.failed_writes = 0
+
+    def add(self, events: list):
+        if AUDIT_LOG_FILE:
+            try:
+                _append_lines(AUDIT_LOG_FILE, events)
+            except OSError:
+                print("Audit file sink error traceback:", traceback.format_exc())
+        with self._lock:
+            self._buffer.extend(events)
+            overflow = [self._buffer.popleft() for _ in range(max(0, len(self._buffer) - AUDIT_MAX_BUFFER))]
+            full = len(self._buffer) >= AUDIT_BATCH_SIZE
+        if overflow:
+            self._spill(overflow)
+        if full and self._wakeup is not None:
+            # after_commit can run outside the loop's thread (sync sessions in a threadpool)
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take(self, limit: int) -> list:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(limit, len(self._buffer)))]
+
+    def _put_back(self, events: list):
+        with self._lock:
+            self._buffer.extendleft(reversed(events))
+
+    def _spill(self, events: list):
+        try:
+            _append_lines(AUDIT_SPILL_FILE, events)
+            self.spilled += len(events)
+        except OSError:
+            print("Audit spill error traceback:", traceback.format_exc())
+
+    async def _write(self, events: list):
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(AuditLog).values(events))
+
+    async def flush(self) -> int:
+        """
+        Writes everything buffered so far. On a database error the batch goes
+        back to the front of the buffer for the next attempt
+        """
+        written = 0
+        while True:
+            batch = self._take(AUDIT_BATCH_SIZE)
+            if not batch:
+                return written
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.failed_writes += 1
+                # no traceback, it would dump every parameter of the batch each retry
+                print(f"Audit write failed, keeping {len(batch)} events for retry:", str(e).splitlines()[0])
+                self._put_back(batch)
+                return written
+            except BaseException:
+                # cancelled mid write, the batch may not have landed so keep it
+                self._put_back(batch)
+                raise
+            written += len(batch)
+            self.written += len(batch)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        await self._replay_spill()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), AUDIT_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+    async def stop(self):
+        """
+        Shutdown: the writer finishes the batch it's on and does one last
+        flush, whatever still can't be written is spilled to disk. It's only
+        cancelled if that takes longer than AUDIT_STOP_TIMEOUT_SECONDS, and a
+        cancelled batch goes back to the buffer first
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            done, _ = await asyncio.wait({self._task}, timeout=AUDIT_STOP_TIMEOUT_SECONDS)
+            if not done:
+                print(f"Audit writer still busy after {AUDIT_STOP_TIMEOUT_SECONDS}s, spilling the rest")
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        self.spill_remaining()
+
+    def spill_remaining(self):
+        remaining = self._take(len(self._buffer))
+        if remaining:
+            self._spill(remaining)
+
+    async def _replay_spill(self):
+        if not os.path.exists(AUDIT_SPILL_FILE):
+            return
+        # claim the file first so several workers starting together don't replay it twice
+        claimed = f"{AUDIT_SPILL_FILE}.{os.getpid()}.replay"
+        try:
+            os.replace(AUDIT_SPILL_FILE, claimed)
+        except OSError:
+            return
+        with open(claimed, encoding="utf-8") as f:
+            events = [_from_json(line) for line in f if line.strip()]
+        print(f"Replaying {len(events)} spilled audit events")
+        start = 0
+        try:
+            for start in range(0, len(events), AUDIT_BATCH_SIZE):
+                await self._write(events[start:start + AUDIT_BATCH_SIZE])
+                self.written += len(events[start:start + AUDIT_BATCH_SIZE])
+        except Exception as e:
+            # database still unreachable, keep the rest for the next start
+            print("Audit replay failed:", str(e).splitlines()[0])
+            _append_lines(AUDIT_SPILL_FILE, events[start:])
+        except BaseException:
+            # shut down mid replay, same thing
+            _append_lines(AUDIT_SPILL_FILE, events[start:])
+            os.remove(claimed)
+            raise
+        os.remove(claimed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "buffered": buffered,
+            "written": self.written,
+            "spilled": self.spilled,
+            "failed_writes": self.failed_writes,
+        }
+
+
+audit_writer = AuditWriter()
+
+# last resort for hard exits and scripts that never start the writer
+atexit.register(audit_writer.spill_remaining)
@@ -1,17 +1,140 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
+from app.utils.metrics import instrument_engine
 
 load_dotenv()
 
 DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME", "stockd_db")
 
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# full URLs override the DB_* parts, e.g. sqlite+aiosqlite:///stockd.db for a local stand-in
+DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
-engine = create_engine(DATABASE_URL, echo=True) 
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# MySQL drops idle connections after wait_timeout (8h by default), recycle well before that
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# a checkout slower than this waited for a free connection rather than just taking one
+DB_CHECKOUT_WAIT_THRESHOLD = float(os.getenv("DB_CHECKOUT_WAIT_THRESHOLD", "0.005"))
+
+
+class DatabaseBusyError(Exception):
+    """
+    No pooled connection came free within DB_POOL_TIMEOUT, the API answers 503
+    """
+
+
+def pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # in-memory sqlite is a single connection, a queue pool makes no sense there
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+# sync engine for scripts and one-off jobs, the API uses the async one below
+engine = create_engine(DATABASE_URL, echo=DB_ECHO, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=DB_ECHO, **pool_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+# query count and time per request, shown in /metrics and the Server-Timing header
+instrument_engine(async_engine.sync_engine)
+
+_pool_lock = threading.Lock()
+_pool_metrics = {
+    "checkouts": 0,
+    "in_use": 0,
+    "max_in_use": 0,
+    "checkout_waits": 0,
+    "checkout_timeouts": 0,
+    "checkout_wait_seconds_total": 0.0,
+    "checkout_wait_seconds_max": 0.0,
+}
+
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(*_):
+    with _pool_lock:
+        _pool_metrics["checkouts"] += 1
+        _pool_metrics["in_use"] += 1
+        _pool_metrics["max_in_use"] = max(_pool_metrics["max_in_use"], _pool_metrics["in_use"])
+
+
+@event.listens_for(async_engine.sync_engine, "checkin")
+def _on_checkin(*_):
+    with _pool_lock:
+        _pool_metrics["in_use"] -= 1
+
+
+def _record_wait(seconds: float, timed_out: bool = False):
+    # only checkouts that blocked on a full pool, a free connection (or a new
+    # one under the overflow limit) isn't a wait
+    if seconds < DB_CHECKOUT_WAIT_THRESHOLD and not timed_out:
+        return
+    with _pool_lock:
+        _pool_metrics["checkout_waits"] += 1
+        _pool_metrics["checkout_wait_seconds_total"] += seconds
+        _pool_metrics["checkout_wait_seconds_max"] = max(_pool_metrics["checkout_wait_seconds_max"], seconds)
+        if timed_out:
+            _pool_metrics["checkout_timeouts"] += 1
+
+
+def pool_stats() -> dict:
+    """
+    Connection pool saturation: connections in use, checkouts that had to wait
+    for a free connection (and how long) and timeouts
+    """
+    with _pool_lock:
+        stats = dict(_pool_metrics)
+    pool = async_engine.pool
+    stats["pool_status"] = pool.status()
+    stats["pool_size"] = getattr(pool, "size", lambda: None)()
+    stats["avg_checkout_wait_seconds"] = (
+        stats["checkout_wait_seconds_total"] / stats["checkout_waits"] if stats["checkout_waits"] else 0.0
+    )
+    return stats
+
+
+@asynccontextmanager
+async def db_session():
+    """
+    An AsyncSession with its connection already checked out, so the wait for
+    a free pool slot is measured here. A pool that stays exhausted for
+    DB_POOL_TIMEOUT seconds raises DatabaseBusyError (a 503, see main.py)
+    rather than hanging the request
+    """
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError as e:
+            _record_wait(time.perf_counter() - start, timed_out=True)
+            # not a SQLAlchemyError, so the routes' database error handling leaves it alone
+            raise DatabaseBusyError("Database busy, try again shortly") from e
+        _record_wait(time.perf_counter() - start)
+        yield db
+
+
+async def get_db():
+    """
+    FastAPI dependency version of db_session()
+    """
+    async with db_session() as db:
+        yield db
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Enum, DateTime, ForeignKey, Text, UniqueConstraint, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.database import Base
@@ -19,6 +19,7 @@ class User(Base):
 
 class PantryItem(Base):
     __tablename__ = "PantryItems"
+    __table_args__ = (UniqueConstraint("user_id", "item_name", name="uq_pantry_user_item"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("Users.id", ondelete="CASCADE"))
     item_name = Column(String(255), nullable=False)
@@ -42,6 +43,25 @@ class PantryItemsRequest(BaseModel):
     user_id: int
     items: List[PantryItemInput]
 
+class RecommendationFilters(BaseModel):
+    max_minutes: Optional[float] = None  # prep + cook time
+    categories: Optional[List[str]] = None
+    min_rating: Optional[float] = None
+    exclude_allergens: Optional[List[str]] = None
+
+class RecommendationRequest(BaseModel):
+    user_id: Optional[int] = None
+    pantry_items: Optional[List[str]] = None
+    top_n: int = 10
+    mode: str = "dense"  # "dense" or "hybrid" (re-ranked by pantry coverage)
+    filters: Optional[RecommendationFilters] = None
+
+class BulkRecommendationRequest(BaseModel):
+    user_ids: List[int]
+    top_n: int = 10
+    mode: str = "dense"
+    filters: Optional[RecommendationFilters] = None
+
 class Recipe(Base):
     __tablename__ = "Recipes"
     id = Column(Integer, primary_key=True, index=True)
@@ -50,6 +70,7 @@ class Recipe(Base):
     steps = Column(Text)
     prep_time = Column(Integer)
     cook_time = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # rows changed since the last update_recipe_index.py run are re-encoded
 
     ingredients = relationship("RecipeIngredient", back_populates="recipe")
 
@@ -63,3 +84,15 @@ class RecipeIngredient(Base):
 
     recipe = relationship("Recipe", back_populates="ingredients")
     pantry_item = relationship("PantryItem", back_populates="recipe_ingredients")
+
+class AuditLog(Base):
+    __tablename__ = "audit_logs"
+    # schema.sql keys this on (id, timestamp) so it can be partitioned by month
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    db_user = Column(String(100))
+    user_id = Column(String(50))
+    action = Column(Enum("INSERT", "UPDATE", "DELETE"), nullable=False)
+    table_name = Column(String(64))
+    record_id = Column(String(100))
+    changes = Column(JSON)
@@ -0,0 +1,118 @@
+import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects import mysql, sqlite
+from app.database.audit import AUDITED_COLUMNS, audit_event, record_audit_events
+from app.database.models import PantryItem
+
+# rows per INSERT statement, keeps big receipts well under max_allowed_packet
+UPSERT_CHUNK_ROWS = 500
+
+UPDATE_COLUMNS = ("quantity_value", "quantity_unit", "category", "storage", "added_on")
+
+
+def clean_pantry_item(item) -> dict:
+    """
+    Replace blanks or None with default values
+    """
+    return {
+        "item_name": item.item_name.strip() if item.item_name else "Unnamed Item",
+        "quantity_value": item.quantity_value if item.quantity_value not in [None, ""] else 0,
+        "quantity_unit": item.quantity_unit.strip() if item.quantity_unit else "pcs",
+        "category": item.category.strip() if item.category else "Uncategorized",
+        "storage": item.storage.strip() if item.storage else "Pantry",
+    }
+
+
+def pantry_name_key(name: str) -> str:
+    """
+    What makes two item names the same pantry item, case and surrounding
+    spaces don't count, like MySQL's default collation on the unique key
+    """
+    return name.strip().lower()
+
+
+def _upsert_statement(dialect: str, rows: list):
+    # relies on the unique (user_id, item_name) key on PantryItems
+    if dialect == "mysql":
+        stmt = mysql.insert(PantryItem).values(rows)
+        return stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in UPDATE_COLUMNS})
+    if dialect == "sqlite":
+        stmt = sqlite.insert(PantryItem).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=["user_id", "item_name"],
+            set_={col: stmt.excluded[col] for col in UPDATE_COLUMNS},
+        )
+    raise ValueError(f"Bulk pantry upsert is not supported on {dialect}")
+
+
+async def upsert_pantry_items(db, user_id: int, items: list) -> dict:
+    """
+    Adds or updates a user's pantry items with one SELECT ... IN to see which
+    already exist and one multi-row INSERT ... ON DUPLICATE KEY UPDATE per
+    UPSERT_CHUNK_ROWS items (plus one SELECT for the ids of new rows, for the
+    audit log). The caller commits.
+    Items are matched by pantry_name_key(), so "Milk" and "milk" are one item.
+    Returns {"items": [one name per item, request order], "created": n, "updated": n}
+    """
+    now = datetime.datetime.utcnow()
+    rows = {}
+    for item in items:
+        row = clean_pantry_item(item)
+        row["user_id"] = user_id
+        row["added_on"] = now
+        # the same item twice in one request, whatever the case: the last one wins
+        rows[pantry_name_key(row["item_name"])] = row
+    if not rows:
+        return {"items": [], "created": 0, "updated": 0}
+
+    keys = list(rows)
+    audited = AUDITED_COLUMNS[PantryItem]
+    # full rows rather than just names, the audit log wants the old values of updated items
+    existing_rows = (await db.execute(
+        select(PantryItem.id, PantryItem.item_name, *(getattr(PantryItem, col) for col in audited))
+        .where(PantryItem.user_id == user_id)
+        .where(func.lower(PantryItem.item_name).in_(keys))
+    )).all()
+    existing = {pantry_name_key(row.item_name): row for row in existing_rows}
+    for key, row in rows.items():
+        if key in existing:
+            # write under the stored spelling so the upsert conflicts on SQLite
+            # too, its unique key is case sensitive
+            row["item_name"] = existing[key].item_name
+    created_keys = [key for key in keys if key not in existing]
+
+    dialect = db.bind.dialect.name
+    values = list(rows.values())
+    for start in range(0, len(values), UPSERT_CHUNK_ROWS):
+        await db.execute(_upsert_statement(dialect, values[start:start + UPSERT_CHUNK_ROWS]))
+
+    await _audit_upsert(db, user_id, rows, existing, created_keys)
+    return {
+        "items": [row["item_name"] for row in values],
+        "created": len(created_keys),
+        "updated": len(keys) - len(created_keys),
+    }
+
+
+async def _audit_upsert(db, user_id: int, rows: dict, existing: dict, created_keys: list):
+    # the ORM flush hook never sees Core upserts, so record them here
+    audited = AUDITED_COLUMNS[PantryItem]
+    created_ids = {}
+    if created_keys:
+        created_ids = {pantry_name_key(name): row_id for name, row_id in (await db.execute(
+            select(PantryItem.item_name, PantryItem.id)
+            .where(PantryItem.user_id == user_id)
+            .where(PantryItem.item_name.in_([rows[key]["item_name"] for key in created_keys]))
+        )).all()}
+
+    events = []
+    for key, row in rows.items():
+        new = {col: row[col] for col in audited}
+        old_row = existing.get(key)
+        if old_row is None:
+            events.append(audit_event("INSERT", PantryItem.__tablename__, created_ids.get(key), user_id, new))
+        else:
+            old = {col: getattr(old_row, col) for col in audited}
+            if old != new:
+                events.append(audit_event("UPDATE", PantryItem.__tablename__, old_row.id, user_id, {"old": old, "new": new}))
+    record_audit_events(db, events)
@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+GOOGLE_TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+# seconds of leeway on iat/exp, covers our clock being behind Google's
+GOOGLE_CLOCK_SKEW = int(os.getenv("GOOGLE_CLOCK_SKEW", "10"))
+GOOGLE_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_TIMEOUT_SECONDS", "10"))
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+if not SESSION_SECRET:
+    # fine for local dev, but tokens won't survive a restart or work across workers
+    print("SESSION_SECRET is not set, using a random one for this process")
+    SESSION_SECRET = secrets.token_hex(32)
+
+# used when Google sends no usable Cache-Control (it normally sends several hours)
+DEFAULT_CERTS_MAX_AGE = 3600
+# an unknown key id forces a refetch at most this often, so tokens with made
+# up key ids can't make us call Google on every request
+GOOGLE_CERTS_MIN_REFRESH_SECONDS = float(os.getenv("GOOGLE_CERTS_MIN_REFRESH_SECONDS", "60"))
+
+_client = None
+
+
+class GoogleAuthError(Exception):
+    """
+    Raised with the status code and error code the route should answer with
+    """
+
+    def __init__(self, status_code: int, error_code: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_code = error_code
+        self.message = message
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    One pooled client per process so logins reuse connections to Google
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=GOOGLE_TIMEOUT_SECONDS)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def cache_max_age(headers) -> int:
+    """
+    Seconds the certs stay fresh, from Cache-Control max-age minus Age
+    """
+    match = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+    if not match:
+        return DEFAULT_CERTS_MAX_AGE
+    age = int(headers.get("age", "0") or 0)
+    return max(0, int(match.group(1)) - age)
+
+
+class CertCache:
+    """
+    Google's signing certs, kept until their Cache-Control max-age runs out.
+    One refresh at a time, everyone else waits for it rather than piling on.
+    Forced refreshes (unknown key id) are ignored within min_refresh_seconds
+    of the last fetch, the caller just gets the certs it already had
+    """
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, min_refresh_seconds: float = GOOGLE_CERTS_MIN_REFRESH_SECONDS):
+        self.url = url
+        self.min_refresh_seconds = min_refresh_seconds
+        self.certs = {}
+        self.expires_at = 0.0
+        self.last_attempt = 0.0
+        self.fetches = 0
+        self.throttled_refreshes = 0
+        self._lock = None
+
+    def _fresh(self, force_refresh: bool) -> bool:
+        if not self.certs:
+            return False
+        if force_refresh:
+            if time.time() - self.last_attempt >= self.min_refresh_seconds:
+                return False
+            self.throttled_refreshes += 1
+            return True
+        return time.time() < self.expires_at
+
+    async def get(self, force_refresh: bool = False) -> dict:
+        if self._fresh(force_refresh):
+            return self.certs
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # someone else may have refreshed while we waited
+            if self._fresh(force_refresh):
+                return self.certs
+            self.last_attempt = time.time()
+            try:
+                response = await get_client().get(self.url)
+                response.raise_for_status()
+                certs = response.json()
+            except (httpx.HTTPError, ValueError):
+                if self.certs:
+                    # keep serving the old certs, Google rotates them with plenty of overlap
+                    return self.certs
+                raise GoogleAuthError(503, "GOOGLE_CERTS_UNREACHABLE", "Failed to fetch Google signing certificates")
+            self.fetches += 1
+            self.certs = certs
+            self.expires_at = time.time() + cache_max_age(response.headers)
+            return self.certs
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.certs),
+            "fetches": self.fetches,
+            "throttled_refreshes": self.throttled_refreshes,
+            "expires_in": max(0.0, self.expires_at - time.time()),
+        }
+
+
+cert_cache = CertCache()
+
+
+async def exchange_code(auth_code: str) -> str:
+    """
+    Swaps the temporary auth code from the frontend for a Google ID token
+    """
+    payload = {
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "code": auth_code,
+        "grant_type": "authorization_code",
+        "redirect_uri": "postmessage",
+    }
+    try:
+        token_response = await get_client().post(GOOGLE_TOKEN_URI, data=payload)
+    except httpx.HTTPError:
+        raise GoogleAuthError(503, "GOOGLE_TOKEN_ENDPOINT_UNREACHABLE", "Failed to reach Google token endpoint")
+
+    if token_response.status_code != 200:
+        raise GoogleAuthError(401, "GOOGLE_TOKEN_EXCHANGE_FAILED", f"Google token exchange failed: {token_response.text}")
+
+    try:
+        token_data = token_response.json()
+    except ValueError:
+        raise GoogleAuthError(500, "INVALID_GOOGLE_RESPONSE", "Invalid response from Google token endpoint")
+
+    if "id_token" not in token_data:
+        raise GoogleAuthError(400, "NO_ID_TOKEN_FROM_GOOGLE", "Google did not return an ID token during exchange")
+    return token_data["id_token"]
+
+
+def _decode(token: str, certs: dict) -> dict:
+    # google.auth pulls in cryptography, only import it once someone logs in
+    from google.auth import jwt
+    return jwt.decode(token, certs=certs, audience=GOOGLE_CLIENT_ID, clock_skew_in_seconds=GOOGLE_CLOCK_SKEW)
+
+
+async def verify_id_token(token: str) -> dict:
+    """
+    Checks the ID token's signature against the cached certs, plus audience,
+    issuer and expiry (with GOOGLE_CLOCK_SKEW seconds of leeway)
+    """
+    from google.auth.exceptions import InvalidValue
+
+    certs = await cert_cache.get()
+    try:
+        try:
+            idinfo = _decode(token, certs)
+        except ValueError as e:
+            # a key we haven't seen means Google rotated, refetch once (rate
+            # limited, in between an unknown key id is simply rejected)
+            if "Certificate for key id" not in str(e):
+                raise
+            certs = await cert_cache.get(force_refresh=True)
+            idinfo = _decode(token, certs)
+    except InvalidValue as e:
+        if "Token used too early" not in str(e):
+            raise GoogleAuthError(401, "INVALID_GOOGLE_ID_TOKEN", "Invalid Google ID Token")
+        # still early after the leeway, wait without blocking the worker and try once more
+        await asyncio.sleep(2)
+        try:
+            idinfo = _decode(token, certs)
+        except ValueError:
+            raise GoogleAuthError(401, "TOKEN_USED_TOO_EARLY", "Google ID token was used too early and is still invalid")
+    except ValueError:
+        raise GoogleAuthError(401, "ID_TOKEN_VERIFICATION_FAILED", "Google ID token verification failed")
+
+    if idinfo.get("iss") not in GOOGLE_ISSUERS:
+        raise GoogleAuthError(401, "INVALID_GOOGLE_ID_TOKEN", "Invalid Google ID Token")
+    return idinfo
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_session_token(user: dict) -> str:
+    """
+    Signed session token so the frontend can skip Google on later requests.
+    `user` is the {"id", "email", "name", "picture"} the login returned
+    """
+    claims = {**user, "exp": int(time.time()) + SESSION_TTL_SECONDS}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str):
+    """
+    Returns the token's claims, or None if it's forged, malformed or expired
+    """
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
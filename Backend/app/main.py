@@ -1,30 +1,50 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from dotenv import load_dotenv
 import os
+from app.utils.static_files import PrecompressedStaticFiles, CachedIndexHtml
+from app.utils.metrics import MetricsMiddleware
 
 load_dotenv()
 
 HOST_IP = os.getenv("HOST_IP", "127.0.0.1")
+FRONTEND_DIR = os.path.join("app", "static", "frontend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.database.audit import audit_writer
+    from app.recommender import recommender_service, RECOMMENDER_WARMUP
+    audit_writer.start()
+    if RECOMMENDER_WARMUP:
+        # loads in a background thread, startup doesn't wait for it (see /health/ready)
+        recommender_service.warmup()
+    yield
+    # stop OCR workers and close pooled connections on shutdown
+    from app.ocr_jobs import ocr_jobs
+    from app.asprise_api import close_client
+    from app.google_auth import close_client as close_google_client
+    from app.database.database import async_engine
+    await ocr_jobs.stop()
+    await close_client()
+    await close_google_client()
+    # flush audit events before the engine they're written with goes away
+    await audit_writer.stop()
+    await async_engine.dispose()
 
 app = FastAPI(
     title="Stockd Backend",
     version="1.0.0",
-    description="A simple backend powered by FastAPI with Swagger UI"
+    description="A simple backend powered by FastAPI with Swagger UI",
+    lifespan=lifespan
 )
 
-# Serve built React frontend
-app.mount("/assets", StaticFiles(directory="app/static/frontend/assets"), name="assets")
-
-@app.get("/{full_path:path}")
-async def serve_react_app(full_path: str):
-    """Catch-all route for React Router paths"""
-    index_path = os.path.join("app", "static", "frontend", "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
-    return {"error": "index.html not found"}
+# Serve built React frontend, precompressed and with immutable caching for hashed files
+app.mount("/assets", PrecompressedStaticFiles(directory=os.path.join(FRONTEND_DIR, "assets")), name="assets")
+frontend_files = PrecompressedStaticFiles(directory=FRONTEND_DIR)
+index_html = CachedIndexHtml(os.path.join(FRONTEND_DIR, "index.html"))
 
 # CORS setup (everything under same ngrok domain now)
 app.add_middleware(
@@ -61,6 +81,40 @@ else:
         allow_headers=["*"],
     )
 
+# added last so it's the outermost layer and times everything below it
+app.add_middleware(MetricsMiddleware)
+
 # Include all routes
 from app.routes import router
 app.include_router(router)
+
+from app.database.database import DatabaseBusyError
+
+@app.exception_handler(DatabaseBusyError)
+async def database_busy(request: Request, e: DatabaseBusyError):
+    """Connection pool exhausted for DB_POOL_TIMEOUT seconds"""
+    return JSONResponse(status_code=503, content={"detail": str(e)})
+
+# first path segments that belong to the API, unknown paths under them are a
+# real 404 rather than the React app
+API_PREFIXES = {route.path.strip("/").split("/")[0] for route in router.routes} | {"assets", "docs", "redoc", "openapi.json"}
+
+# registered after the API routes so it doesn't shadow GET endpoints
+@app.get("/{full_path:path}", include_in_schema=False)
+async def serve_react_app(full_path: str, request: Request):
+    """Catch-all route for React Router paths"""
+    first_segment = full_path.split("/", 1)[0]
+    if first_segment in API_PREFIXES:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+
+    # files at the root of the build (favicon, vite.svg, ...)
+    if "." in full_path.rsplit("/", 1)[-1]:
+        try:
+            return await frontend_files.get_response(full_path, request.scope)
+        except StarletteHTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+    response = index_html.response(request.headers)
+    if response is None:
+        return JSONResponse(status_code=404, content={"error": "index.html not found"})
+    return response
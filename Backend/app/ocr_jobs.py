@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dotenv import load_dotenv
+from app.receipt_ocr import ocr_receipt
+from app.utils.receipt_parser import parse_asprise_response
+from app.utils.metrics import observe_stage
+
+load_dotenv()
+
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "4"))
+OCR_JOB_QUEUE_SIZE = int(os.getenv("OCR_JOB_QUEUE_SIZE", "100"))
+OCR_JOB_TTL_SECONDS = float(os.getenv("OCR_JOB_TTL_SECONDS", "900"))
+OCR_JOB_MAX_KEPT = int(os.getenv("OCR_JOB_MAX_KEPT", "1000"))
+# job status shared by every worker process, without it a job can only be
+# polled on the worker that accepted the upload
+OCR_JOB_REDIS_URL = os.getenv("OCR_JOB_REDIS_URL")
+# a queued / processing job nobody has touched for this long belongs to a worker that died
+OCR_JOB_STALE_SECONDS = float(os.getenv("OCR_JOB_STALE_SECONDS", "600"))
+# how often ?wait= re-reads a job another worker is running
+OCR_JOB_POLL_SECONDS = 0.25
+SHARED_KEY_PREFIX = "stockd:ocr_job:"
+FINISHED = ("done", "failed")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class OcrJob:
+    def __init__(self, receipt):
+        self.id = uuid.uuid4().hex
+        self.receipt = receipt
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "response": self.result,
+            "error": self.error,
+        }
+
+
+class OcrJobQueue:
+    """
+    In-process receipt OCR queue. Uploads are queued and return straight
+    away, a fixed pool of worker tasks sends them to Asprise and keeps the
+    parsed result around for OCR_JOB_TTL_SECONDS so the client can poll for it.
+
+    The queue and the images stay in the process that accepted the upload.
+    With `shared` (a redis.asyncio client, OCR_JOB_REDIS_URL) every status
+    change is also written there, so a poll can land on any worker and jobs
+    cut short by a shutdown or crash show up as failed. Without it the
+    backend has to run as a single worker, or with sticky routing per client
+    """
+
+    def __init__(self, workers: int = OCR_JOB_WORKERS, max_queued: int = OCR_JOB_QUEUE_SIZE, shared=None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.shared = shared
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls):
+        shared = None
+        if OCR_JOB_REDIS_URL:
+            import redis.asyncio  # only needed when job status is shared
+            shared = redis.asyncio.Redis.from_url(OCR_JOB_REDIS_URL)
+        return cls(shared=shared)
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            # started from inside whichever request submits first, so give the
+            # workers an empty context or every job's stages would be timed
+            # against that request
+            self._tasks = [
+                contextvars.Context().run(asyncio.create_task, self._worker()) for _ in range(self.workers)
+            ]
+
+    async def submit(self, receipt) -> OcrJob:
+        self._ensure_started()
+        self._expire()
+        if self._queue.full():
+            raise QueueFullError("OCR queue is full, try again shortly")
+        job = OcrJob(receipt)
+        # shared first, a client may poll another worker as soon as it has the id
+        await self._publish(job)
+        self._queue.put_nowait(job)
+        self.jobs[job.id] = job
+        return job
+
+    async def status(self, job_id: str, wait: float = 0):
+        """
+        The job's to_dict(), from this process or the shared store, None if
+        it's unknown or expired. With wait > 0 it long polls: returns once
+        the job finishes or after `wait` seconds
+        """
+        self._expire()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            if wait > 0 and not job.done.is_set():
+                try:
+                    await asyncio.wait_for(job.done.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            return job.to_dict()
+
+        if self.shared is None:
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            record = await self._read(job_id)
+            remaining = deadline - time.monotonic()
+            if record is None or record["status"] in FINISHED or remaining <= 0:
+                return record
+            await asyncio.sleep(min(OCR_JOB_POLL_SECONDS, remaining))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        # the images go with this process, tell whoever polls rather than leave them waiting
+        for job in self.jobs.values():
+            if job.status not in FINISHED:
+                job.status = "failed"
+                job.error = "The server restarted before this receipt was processed, please upload it again"
+                job.receipt = None
+                job.finished_at = time.time()
+                job.done.set()
+                await self._publish_quietly(job)
+
+    async def _publish(self, job: OcrJob):
+        if self.shared is None:
+            return
+        record = dict(job.to_dict(), updated_at=time.time())
+        # unfinished jobs may sit in the queue a while, finished ones live OCR_JOB_TTL_SECONDS
+        ttl = OCR_JOB_TTL_SECONDS if job.status in FINISHED else OCR_JOB_STALE_SECONDS + OCR_JOB_TTL_SECONDS
+        await self.shared.set(SHARED_KEY_PREFIX + job.id, json.dumps(record), ex=int(ttl))
+
+    async def _publish_quietly(self, job: OcrJob):
+        # a status update that can't be shared doesn't fail the job, polls
+        # reaching this worker still see it
+        try:
+            await self._publish(job)
+        except Exception:
+            print("OCR job status publish error traceback:", traceback.format_exc())
+
+    async def _read(self, job_id: str):
+        value = await self.shared.get(SHARED_KEY_PREFIX + job_id)
+        if value is None:
+            return None
+        record = json.loads(value)
+        updated_at = record.pop("updated_at", 0)
+        if record["status"] not in FINISHED and time.time() - updated_at > OCR_JOB_STALE_SECONDS:
+            # the worker holding it died without getting to stop()
+            record.update(status="failed", error="This receipt was lost by a server restart, please upload it again")
+        return record
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "processing"
+            observe_stage("ocr_job_wait", time.time() - job.created_at)
+            await self._publish_quietly(job)
+            try:
+                asprise_data = await ocr_receipt(job.receipt)
+                job.result = parse_asprise_response(asprise_data)
+                job.status = "done"
+            except Exception as e:
+                print("OCR job error traceback:", traceback.format_exc())
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.receipt = None  # don't hold images once they're processed
+                job.finished_at = time.time()
+                job.done.set()
+                self._queue.task_done()
+            await self._publish_quietly(job)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "tracked_jobs": len(self.jobs),
+            "shared": self.shared is not None,
+        }
+
+    def _expire(self):
+        # drop finished jobs past their TTL, and the oldest ones if there are too many
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            expired = job.finished_at is not None and now - job.finished_at > OCR_JOB_TTL_SECONDS
+            if expired or (len(self.jobs) > OCR_JOB_MAX_KEPT and job.finished_at is not None):
+                del self.jobs[job_id]
+
+
+ocr_jobs = OcrJobQueue.from_env()
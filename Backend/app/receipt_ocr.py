@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from fastapi import UploadFile
+from app.asprise_api import send_receipt_to_asprise
+from app.utils.image_preprocess import spool_upload, prepare_image
+from app.utils.ocr_cache import OcrResultCache
+from app.utils.metrics import span
+
+ocr_cache = OcrResultCache()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "uploads": 0,
+    "hits": 0,
+    "misses": 0,
+    "bytes_received": 0,
+    "bytes_sent": 0,
+    "bytes_saved": 0,
+}
+
+
+def _count(**amounts):
+    with _metrics_lock:
+        for name, amount in amounts.items():
+            _metrics[name] += amount
+
+
+def ocr_stats() -> dict:
+    with _metrics_lock:
+        stats = dict(_metrics)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["cache"] = ocr_cache.stats()
+    return stats
+
+
+class ReceiptUpload:
+    """
+    An uploaded receipt after hashing, cache lookup and (on a miss) pre-processing.
+    Either cached_response is set, or image_bytes is ready to send to Asprise
+    """
+
+    def __init__(self, filename: str, content_hash: str, size: int):
+        self.filename = filename
+        self.content_hash = content_hash
+        self.size = size
+        self.image_bytes = None
+        self.cached_response = None
+
+
+async def read_receipt(file: UploadFile) -> ReceiptUpload:
+    """
+    Streams the upload to a spooled temp file, answers from the cache when
+    the same image was seen before and otherwise shrinks it for OCR
+    """
+    spooled, content_hash, size = await spool_upload(file)
+    try:
+        receipt = ReceiptUpload(file.filename, content_hash, size)
+        _count(uploads=1, bytes_received=size)
+
+        cached = ocr_cache.get(content_hash)
+        if cached is not None:
+            _count(hits=1, bytes_saved=size)
+            receipt.cached_response = cached
+            return receipt
+
+        # decoding and re-encoding is CPU work, keep it off the event loop
+        with span("ocr_prepare"):
+            receipt.image_bytes = await asyncio.to_thread(prepare_image, spooled)
+        return receipt
+    finally:
+        spooled.close()
+
+
+async def ocr_receipt(receipt: ReceiptUpload) -> dict:
+    """
+    Returns the Asprise response for a receipt, from the cache if we have it
+    """
+    if receipt.cached_response is not None:
+        return receipt.cached_response
+
+    # a job may have queued behind an identical upload that has finished since
+    cached = ocr_cache.get(receipt.content_hash)
+    if cached is not None:
+        _count(hits=1, bytes_saved=receipt.size)
+        return cached
+
+    _count(misses=1, bytes_sent=len(receipt.image_bytes),
+           bytes_saved=receipt.size - len(receipt.image_bytes))
+    with span("ocr_request"):
+        asprise_data = await send_receipt_to_asprise(receipt.image_bytes, receipt.filename)
+    # only cache answers that actually read a receipt, a failed read is worth retrying
+    if asprise_data.get("success", True) and asprise_data.get("receipts"):
+        ocr_cache.put(receipt.content_hash, asprise_data)
+    return asprise_data
@@ -0,0 +1,181 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from app.utils.micro_batcher import MicroBatcher
+from app.utils.metrics import registry, observe_stage, span, current_timings, timings_for
+
+load_dotenv()
+
+# the recommender lives in the AI folder, not in this package
+AI_MODELS_DIR = os.getenv(
+    "AI_MODELS_DIR",
+    os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../AI/app/models"))
+)
+RECOMMENDER_WORKERS = int(os.getenv("RECOMMENDER_WORKERS", "2"))
+RECOMMENDER_MAX_BATCH = int(os.getenv("RECOMMENDER_MAX_BATCH", "64"))
+RECOMMENDER_BATCH_WAIT_MS = float(os.getenv("RECOMMENDER_BATCH_WAIT_MS", "5"))
+# load the model in the background at startup, turn off for workers that only
+# serve OCR / auth (and in tests) so they never pay for torch and the index
+RECOMMENDER_WARMUP = os.getenv("RECOMMENDER_WARMUP", "1") == "1"
+
+# mirrors RECOMMEND_MODES in the AI module, kept here so validating a request
+# doesn't import the model
+RECOMMEND_MODES = ("dense", "hybrid")
+# and ALLERGENS in recipe_filters.py
+ALLERGENS = ("dairy", "egg", "gluten", "peanut", "tree_nut", "soy", "fish", "shellfish", "sesame")
+
+class RecommenderService:
+    """
+    Owns the AI recommender module. Importing it pulls in torch,
+    sentence-transformers, pandas and FAISS and loads the model and index, so
+    nothing happens until the first recommendation or warmup() asks for it.
+
+    state goes cold -> loading -> ready, or failed (the next call tries again)
+    """
+
+    def __init__(self, models_dir: str = AI_MODELS_DIR):
+        self.models_dir = models_dir
+        self.state = "cold"
+        self.error = None
+        self.load_seconds = None
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Blocking. Imports the module and runs one throwaway query so lazy
+        init in torch / faiss isn't paid by a real request. Concurrent callers
+        wait for the one doing the work
+        """
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is not None:
+                return self._module
+            self.state, self.error = "loading", None
+            start = time.perf_counter()
+            try:
+                if self.models_dir not in sys.path:
+                    sys.path.insert(0, self.models_dir)
+                import model2_recipe_recommender
+                model2_recipe_recommender.recommend_recipes_batch([["salt"]], 1)
+            except Exception as e:
+                self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+                raise
+            # encode / FAISS search timings, the pantry cache and precomputed hits go into /metrics
+            model2_recipe_recommender.on_stage = observe_stage
+            registry.register_stats("pantry_cache", lambda: model2_recipe_recommender.pantry_cache.stats())
+            registry.register_stats("precomputed", lambda: model2_recipe_recommender.precomputed.stats())
+            self.load_seconds = round(time.perf_counter() - start, 2)
+            self._module = model2_recipe_recommender
+            self.state = "ready"
+            print(f"recommender ready in {self.load_seconds}s")
+        return self._module
+
+    def warmup(self):
+        """
+        Starts load() on a background thread and returns straight away
+        """
+        if self.state in ("cold", "failed"):
+            threading.Thread(target=self._warmup, name="recommender-warmup", daemon=True).start()
+
+    def _warmup(self):
+        try:
+            self.load()
+        except Exception:
+            print("Recommender warmup failed:", traceback.format_exc())
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        status = {"state": self.state, "error": self.error, "load_seconds": self.load_seconds}
+        if self._module is not None:
+            snapshot = self._module.snapshot
+            status.update(
+                index_version=snapshot.version,
+                recipes=snapshot.manifest["count"],
+                encoder=getattr(self._module.model, "cache_namespace", snapshot.manifest["model_name"]),
+            )
+        return status
+
+
+recommender_service = RecommenderService()
+
+
+def get_recommender():
+    """
+    The AI recommender module, loaded on first use
+    """
+    return recommender_service.load()
+
+
+def filters_key(filters: dict):
+    """
+    Hashable form of a filters dict so queries with the same filters share a search
+    """
+    if not filters:
+        return None
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in filters.items()))
+
+
+def _recommend_batch(entries: list) -> list:
+    """
+    Runs in the worker pool. entries is a list of (query, request timings),
+    a query being (pantry_items, top_n, user_id, mode, filters)
+    """
+    # the pool thread doesn't see the request contexts, so the encode / search
+    # stages are handed to every request that shared the batch
+    with timings_for([timings for _, timings in entries]):
+        return _recommend_queries([query for query, _ in entries])
+
+
+def _recommend_queries(queries: list) -> list:
+    recommender = get_recommender()
+    results = [None] * len(queries)
+
+    # one encode + search per mode and filter set in the batch, usually just one
+    groups = {}
+    for i, q in enumerate(queries):
+        groups.setdefault((q[3], filters_key(q[4])), []).append(i)
+    for (mode, _), positions in groups.items():
+        top_n = max(queries[i][1] for i in positions)
+        batch_results = recommender.recommend_recipes_batch(
+            [queries[i][0] for i in positions], top_n, [queries[i][2] for i in positions], mode=mode,
+            filters=queries[positions[0]][4]
+        )
+        for i, result in zip(positions, batch_results):
+            results[i] = result[:queries[i][1]]
+    return results
+
+
+# encode and faiss search both release the GIL, so threads share one copy of
+# the model instead of each process loading its own
+executor = ThreadPoolExecutor(max_workers=RECOMMENDER_WORKERS, thread_name_prefix="recommender")
+batcher = MicroBatcher(
+    _recommend_batch,
+    max_batch_size=RECOMMENDER_MAX_BATCH,
+    max_wait_ms=RECOMMENDER_BATCH_WAIT_MS,
+    executor=executor,
+    max_concurrent_batches=RECOMMENDER_WORKERS,
+)
+
+
+async def recommend(pantry_items: list, top_n: int = 10, user_id: int = None, mode: str = "dense",
+                    filters: dict = None) -> list:
+    with span("recommend"):
+        return await batcher.submit(((pantry_items, top_n, user_id, mode, filters), current_timings()))
+
+
+async def recommend_many(queries: list) -> list:
+    """
+    queries is a list of (pantry_items, top_n, user_id, mode, filters), results come back in the same order
+    """
+    with span("recommend"):
+        timings = current_timings()
+        return await batcher.submit_many([(query, timings) for query in queries])
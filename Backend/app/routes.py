@@ -1,43 +1,64 @@
-import datetime
 import time
 import traceback
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests # for token verification
-from google.auth.exceptions import InvalidValue
-from pymysql import IntegrityError
-from app.database.database import SessionLocal
-from app.database.models import PantryItemsRequest, User, PantryItem
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request # incoming requests from frontend
-import requests as httpx # for outgoing API requests (e.g., Google OAuth token exchange)
-import os
-from sqlalchemy.exc import SQLAlchemyError
-from dotenv import load_dotenv
-from app.asprise_api import send_receipt_to_asprise
+from app.database.database import get_db, db_session, pool_stats, DatabaseBusyError
+from app.database.audit import audit_writer
+from app.database.pantry import upsert_pantry_items
+from app.database.models import PantryItemsRequest, User, PantryItem, RecommendationRequest, BulkRecommendationRequest
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request # incoming requests from frontend
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.google_auth import (
+    GoogleAuthError, SESSION_TTL_SECONDS, exchange_code, verify_id_token,
+    issue_session_token, verify_session_token, cert_cache,
+)
+from app.receipt_ocr import read_receipt, ocr_receipt, ocr_stats
 from app.utils.receipt_parser import parse_asprise_response
+from app.recommender import recommend, recommend_many, recommender_service, ALLERGENS, RECOMMEND_MODES, RECOMMENDER_WARMUP
+from app.ocr_jobs import ocr_jobs, QueueFullError
+from app.utils.metrics import registry, profiles
 
-load_dotenv()
-
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_CLIENT_URI = os.getenv("GOOGLE_TOKEN_URI")
+MAX_RECOMMENDATIONS = 50
 
 router = APIRouter()
 
+# existing stats() show up in /metrics as gauges, the recommender adds its
+# pantry cache once the model is loaded
+registry.register_stats("ocr", ocr_stats)
+registry.register_stats("db_pool", pool_stats)
+registry.register_stats("audit", audit_writer.stats)
+registry.register_stats("google_certs", cert_cache.stats)
+registry.register_stats("ocr_jobs", ocr_jobs.stats)
+
 @router.get("/hello/{name}", tags=["Test"])
 async def say_hello(name: str):
     return {"message": f"Hello {name} from Stockd!"}
 
 
 @router.post("/upload-receipt", tags=["OCR"])
-async def upload_receipt(file: UploadFile = File(...)):
+async def upload_receipt(file: UploadFile = File(...), mode: str = "sync"):
     """
     Upload an image of a receipt and send it to Asprise OCR API
+
+    With `?mode=job` the receipt is queued and a `job_id` is returned straight
+    away (202). Poll `GET /receipts/jobs/{job_id}` for the result.
+
+    Images are downscaled and greyscaled before upload, and a receipt seen
+    before (byte for byte the same file) is answered from the cache.
     """
+    if mode not in ("sync", "job"):
+        raise HTTPException(status_code=400, detail="mode must be sync or job")
+
     try:
-        image_bytes = await file.read()
+        receipt = await read_receipt(file)
+
+        if mode == "job":
+            job = await ocr_jobs.submit(receipt)
+            return JSONResponse(status_code=202, content={"status": "queued", "job_id": job.id})
 
-        # Send to Asprise API
-        asprise_data = send_receipt_to_asprise(image_bytes, file.filename)
+        # Send to Asprise API (or take it from the cache)
+        asprise_data = await ocr_receipt(receipt)
         parsed = parse_asprise_response(asprise_data)
 
         return {
@@ -45,24 +66,108 @@ async def upload_receipt(file: UploadFile = File(...)):
             "response": parsed
         }
 
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+
+@router.get("/receipts/jobs/{job_id}", tags=["OCR"])
+async def get_receipt_job(job_id: str, wait: float = 0):
+    """
+    Status of a queued receipt: `queued`, `processing`, `done` or `failed`.
+    `response` holds the parsed receipt once it is done.
+
+    Pass `?wait=<seconds>` (max 30) to hold the request open until the job
+    finishes instead of polling repeatedly.
+
+    Any worker can answer when OCR_JOB_REDIS_URL is set, otherwise only the
+    one that accepted the upload knows the job (run a single worker or route
+    clients stickily).
+    """
+    job = await ocr_jobs.status(job_id, min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.get("/receipts/stats", tags=["OCR"])
+async def get_receipt_stats():
+    """
+    OCR cache hits / misses and upload bytes received, sent and saved
+    """
+    return ocr_stats()
+
+@router.get("/db/stats", tags=["Database"])
+async def get_db_stats():
+    """
+    Connection pool usage: connections in use, checkouts that waited for a
+    free connection and timeouts, plus the audit log writer's backlog
+    """
+    return {**pool_stats(), "audit": audit_writer.stats()}
+
+@router.get("/health", tags=["Monitoring"])
+async def health():
+    """
+    Liveness, the process is up and answering
+    """
+    return {"status": "ok"}
+
+@router.get("/health/ready", tags=["Monitoring"])
+async def readiness():
+    """
+    Readiness. With RECOMMENDER_WARMUP=1 this is 503 until the model and
+    index have loaded in the background, so a load balancer holds traffic
+    back meanwhile. Workers with warmup off are ready straight away, and a
+    failed load reports `degraded` rather than keeping OCR and auth down
+    """
+    recommender = recommender_service.status()
+    if recommender["state"] == "failed":
+        status = "degraded"
+    elif recommender_service.ready or not RECOMMENDER_WARMUP:
+        status = "ready"
+    else:
+        status = "starting"
+    return JSONResponse(status_code=503 if status == "starting" else 200,
+                        content={"status": status, "recommender": recommender})
+
+@router.get("/metrics", tags=["Monitoring"], response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text format: per-route latency histograms
+    (`stockd_request_seconds`), per-stage timings (`stockd_stage_seconds`:
+    OCR, parsing, DB queries, embedding encode, FAISS search) and the cache,
+    pool and queue stats as gauges
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/profiles/{profile_id}", tags=["Monitoring"], response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """
+    Stack samples of a request sent with `X-Profile: 1` (needs PROFILE_ENABLED=1),
+    the id comes back in its `X-Profile-Id` header. Collapsed stack format,
+    feed it to flamegraph.pl or speedscope
+    """
+    folded = profiles.get(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found or expired")
+    return PlainTextResponse(folded)
+
 @router.post("/auth/google", tags=["Google OAuth"])
 async def verify_google_token(request: Request):
     """
     - Exchanges temporary auth code for Google ID token
-    - Verifies ID token authenticity and audience
+    - Verifies ID token authenticity and audience against cached Google certs
     - Safely inserts user into DB if new
-    - Handles clock-skew errors (Token used too early)
+    - Tolerates clock skew (GOOGLE_CLOCK_SKEW seconds of leeway)
+    - Returns a `session_token` for `GET /auth/session`, so the app doesn't go back to Google
     - Returns detailed, frontend-friendly error responses
     - Possible errors:
     - 400 - Bad Request
     - 401 - Unauthorized
     - 500 - Internal server error
-    - 504 - Unable to handle request
+    - 503 - Google unreachable
     """
-    db = SessionLocal()
     try:
         # 1. Validate incoming request
         try:
@@ -75,58 +180,13 @@ async def verify_google_token(request: Request):
         if not auth_code:
             raise HTTPException(status_code=400, detail={"error_code": "MISSING_AUTH_CODE", "message": "Missing Google authorization code"})
 
-        # 2. Exchange the authorisation code for Google ID token
+        # 2. Exchange the authorisation code for Google ID token, then verify it
         try:
-            token_url = GOOGLE_CLIENT_URI
-            payload = {
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "code": auth_code,
-                "grant_type": "authorization_code",
-                "redirect_uri": "postmessage",
-            }
-
-            # Send the temporary auth code to Google token endpoint 
-            # to check if the auth code is designated for our app + 
-            # user verification
-            token_response = httpx.post(token_url, data=payload)
-        except Exception as e:
-            raise HTTPException(status_code=503, detail={"error_code": "GOOGLE_TOKEN_ENDPOINT_UNREACHABLE", "message": "Failed to reach Google token endpoint"})
-
-        if token_response.status_code != 200:
-            raise HTTPException(status_code=401, detail={"error_code": "GOOGLE_TOKEN_EXCHANGE_FAILED", "message": f"Google token exchange failed: {token_response.text}"})
-
-        try:
-            token_data = token_response.json()
-        except Exception:
-            raise HTTPException(status_code=500, detail={"error_code": "INVALID_GOOGLE_RESPONSE", "message": "Invalid response from Google token endpoint"})
+            google_id_token = await exchange_code(auth_code)
+            idinfo = await verify_id_token(google_id_token)
+        except GoogleAuthError as e:
+            raise HTTPException(status_code=e.status_code, detail={"error_code": e.error_code, "message": e.message})
 
-        if "id_token" not in token_data:
-            raise HTTPException(status_code=400, detail={"error_code": "NO_ID_TOKEN_FROM_GOOGLE", "message": "Google did not return an ID token during exchange"})
-
-        # 3. Verify the ID token
-        try:
-            idinfo = id_token.verify_oauth2_token(
-                token_data["id_token"], google_requests.Request(), GOOGLE_CLIENT_ID
-            )
-        except InvalidValue as e:
-            # Clock-skew safety
-            if "Token used too early" in str(e):
-                # Wait 2 second and retry — Google's token clock skew safety
-                time.sleep(2)
-                try:
-                    idinfo = id_token.verify_oauth2_token(
-                        token_data["id_token"],
-                        google_requests.Request(),
-                        GOOGLE_CLIENT_ID
-                    )
-                except Exception:
-                    raise HTTPException(status_code=401, detail={"error_code": "TOKEN_USED_TOO_EARLY", "message": "Google ID token was used too early and is still invalid"})
-            else:
-                raise HTTPException(status_code=401, detail={"error_code": "INVALID_GOOGLE_ID_TOKEN", "message": "Invalid Google ID Token"})
-        except Exception:
-            raise HTTPException(status_code=401, detail={"error_code": "ID_TOKEN_VERIFICATION_FAILED", "message": "Google ID token verification failed"})
-    
         # Extract user info
         user_info = {
             "email": idinfo.get("email"),
@@ -138,39 +198,57 @@ async def verify_google_token(request: Request):
             raise HTTPException(status_code=400, detail={"error_code": "EMAIL_NOT_FOUND", "message": "Google account email missing from ID token"})
 
         
-        # 4. Save or update user in DB
+        # 3. Save or update user in DB (only now, no pooled connection is held while we wait on Google)
         try:
-            existing_user = db.query(User).filter(User.email == user_info["email"]).first()
-
-            if not existing_user:
-                new_user = User(
-                    email=user_info["email"],
-                    name=user_info["name"],
-                    picture=user_info["picture"],
-                    client_id=idinfo.get("sub"),
-                    role="user"
-                )
-                db.add(new_user)
-                db.commit()
-                db.refresh(new_user)
+            async with db_session() as db:
+                existing_user = (await db.scalars(select(User).where(User.email == user_info["email"]))).first()
+
+                if not existing_user:
+                    existing_user = User(
+                        email=user_info["email"],
+                        name=user_info["name"],
+                        picture=user_info["picture"],
+                        client_id=idinfo.get("sub"),
+                        role="user"
+                    )
+                    db.add(existing_user)
+                    await db.commit()
+                    await db.refresh(existing_user)
 
         except SQLAlchemyError as e:
-            db.rollback()
             raise HTTPException(status_code=500, detail={"error_code": "DATABASE_ERROR", "message": f"Database error: {str(e)}"})
 
-        # 5. Return success response
-        return {"status": "success", "user": user_info}
+        # 4. Return success response
+        user_info["id"] = existing_user.id
+        return {
+            "status": "success",
+            "user": user_info,
+            "session_token": issue_session_token(user_info),
+            "expires_in": SESSION_TTL_SECONDS,
+        }
 
     # Top-level exception handling for safe & clear responses
-    except HTTPException:
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error_code": "OAUTH_EXCHANGE_FAILED", "message": f"OAuth exchange failed: {str(e)}"})
-    finally:
-        db.close()
+
+
+@router.get("/auth/session", tags=["Google OAuth"])
+async def get_session(request: Request):
+    """
+    Checks a session token from `POST /auth/google` (sent as
+    `Authorization: Bearer <token>`) and returns its user, no Google call needed
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    claims = verify_session_token(token) if scheme.lower() == "bearer" else None
+    if not claims:
+        raise HTTPException(status_code=401, detail={"error_code": "INVALID_SESSION", "message": "Missing, invalid or expired session token"})
+    user = {key: claims.get(key) for key in ("id", "email", "name", "picture")}
+    return {"status": "success", "user": user, "expires_in": max(0, claims["exp"] - int(time.time()))}
 
 @router.post("/pantry_items", tags=["Pantry"])
-async def add_update_pantry_items(request_data: PantryItemsRequest):
+async def add_update_pantry_items(request_data: PantryItemsRequest, db: AsyncSession = Depends(get_db)):
     """
     Add or update pantry items in the database for a specific user.
 
@@ -191,74 +269,153 @@ async def add_update_pantry_items(request_data: PantryItemsRequest):
     }
     ```
     If an item with the same `item_name` already exists for the user, it will be updated.
+    All items are written in one multi-row upsert rather than a query per item.
     """
-    db = SessionLocal()
     try:
-        user = db.query(User).filter(User.id == request_data.user_id).first()
+        user = await db.get(User, request_data.user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        processed_items = []
-        for item in request_data.items:
-            # Replace blanks or None with default values
-            item_name = item.item_name.strip() if item.item_name else "Unnamed Item"
-            quantity_value = item.quantity_value if item.quantity_value not in [None, ""] else 0
-            quantity_unit = item.quantity_unit.strip() if item.quantity_unit else "pcs"
-            category = item.category.strip() if item.category else "Uncategorized"
-            storage = item.storage.strip() if item.storage else "Pantry"
-
-            # Check if item already exists for this user
-            existing_item = (
-                db.query(PantryItem)
-                .filter(PantryItem.user_id == request_data.user_id)
-                .filter(PantryItem.item_name == item_name)
-                .first()
-            )
-
-            if existing_item:
-                # Update existing item
-                existing_item.quantity_value = quantity_value
-                existing_item.quantity_unit = quantity_unit
-                existing_item.category = category
-                existing_item.storage = storage
-                existing_item.added_on = datetime.datetime.utcnow()
-                processed_items.append(existing_item)
-            else:
-                # Add new item
-                new_item = PantryItem(
-                    user_id=request_data.user_id,
-                    item_name=item_name,
-                    quantity_value=quantity_value,
-                    quantity_unit=quantity_unit,
-                    category=category,
-                    storage=storage,
-                    added_on=datetime.datetime.utcnow()
-                )
-                db.add(new_item)
-                processed_items.append(new_item)
-
-        db.commit()
+        result = await upsert_pantry_items(db, request_data.user_id, request_data.items)
+        await db.commit()
 
         return {
             "status": "success",
-            "processed_items": len(processed_items),
-            "items": [item.item_name for item in processed_items]
+            "processed_items": len(result["items"]),
+            "items": result["items"],
+            "created": result["created"],
+            "updated": result["updated"],
         }
 
+    except HTTPException:
+        raise
+
     except IntegrityError as ie:
-        db.rollback()
+        await db.rollback()
         print("IntegrityError traceback:", traceback.format_exc())
         raise HTTPException(status_code=400, detail=f"Database integrity error: {str(ie.orig)}")
     
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         print("SQLAlchemyError traceback:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print("Unexpected error traceback:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
-    
-    finally:
-        db.close()
\ No newline at end of file
+
+async def load_pantries(db, user_ids: list) -> dict:
+    """
+    Returns {user_id: [item_name, ...]} for all users in a single query
+    """
+    rows = await db.execute(
+        select(PantryItem.user_id, PantryItem.item_name)
+        .where(PantryItem.user_id.in_(user_ids))
+    )
+    pantries = {}
+    for user_id, item_name in rows:
+        pantries.setdefault(user_id, []).append(item_name)
+    return pantries
+
+
+def validate_recommendation_options(top_n: int, mode: str, filters=None) -> dict:
+    """
+    Checks the options and returns the filters as a plain dict (None when unset)
+    """
+    if not 1 <= top_n <= MAX_RECOMMENDATIONS:
+        raise HTTPException(status_code=400, detail=f"top_n must be between 1 and {MAX_RECOMMENDATIONS}")
+    if mode not in RECOMMEND_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RECOMMEND_MODES)}")
+    if filters is None:
+        return None
+    unknown = [a for a in filters.exclude_allergens or [] if a not in ALLERGENS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"exclude_allergens must be some of {', '.join(ALLERGENS)}")
+    return filters.model_dump(exclude_none=True) or None
+
+
+@router.post("/recommendations", tags=["Recommendations"])
+async def get_recommendations(request_data: RecommendationRequest):
+    """
+    Recommend recipes for a pantry.
+
+    Send the pantry directly or a `user_id` to use their saved pantry items:
+    ```
+    {
+        "user_id": 1,
+        "pantry_items": ["chicken breast", "noodles"],
+        "top_n": 10,
+        "mode": "dense",
+        "filters": {"max_minutes": 30, "categories": ["Chicken"], "min_rating": 4, "exclude_allergens": ["peanut"]}
+    }
+    ```
+    `mode` is `dense` (embedding similarity) or `hybrid` (similarity re-ranked
+    by how many of each recipe's ingredients are already in the pantry).
+    `filters` are all optional and applied inside the search, so a strict
+    filter still returns `top_n` recipes if that many match. Recipes with an
+    unknown time or rating never pass those filters, and allergens are
+    matched on ingredient names, so they're a guide, not a guarantee.
+    Concurrent requests are batched together into one encode and one search.
+    """
+    filters = validate_recommendation_options(request_data.top_n, request_data.mode, request_data.filters)
+
+    pantry_items = request_data.pantry_items
+    if not pantry_items:
+        if request_data.user_id is None:
+            raise HTTPException(status_code=400, detail="Send pantry_items or a user_id")
+        try:
+            # only this path needs the database, so no connection is held for inline pantries
+            async with db_session() as db:
+                pantry_items = (await load_pantries(db, [request_data.user_id])).get(request_data.user_id)
+        except SQLAlchemyError as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        if not pantry_items:
+            raise HTTPException(status_code=404, detail="No pantry items found for user")
+
+    try:
+        results = await recommend(pantry_items, request_data.top_n, request_data.user_id, request_data.mode, filters)
+    except (FileNotFoundError, ValueError) as e:
+        # no index artifact has been built on this box, or it has no ingredient index / filter columns
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print("Recommendation error traceback:", traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Recommendation failed: {str(e)}")
+
+    return {"status": "success", "recommendations": results}
+
+
+@router.post("/recommendations/bulk", tags=["Recommendations"])
+async def get_bulk_recommendations(request_data: BulkRecommendationRequest):
+    """
+    Recommend recipes for many users at once using their saved pantries.
+
+    Expects JSON like `{"user_ids": [1, 2, 3], "top_n": 10, "mode": "dense"}`,
+    plus optional `filters` as for `/recommendations`.
+    Users without pantry items are listed in `missing_users`.
+    """
+    filters = validate_recommendation_options(request_data.top_n, request_data.mode, request_data.filters)
+
+    user_ids = list(dict.fromkeys(request_data.user_ids))
+    try:
+        async with db_session() as db:
+            pantries = await load_pantries(db, user_ids)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    found_users = [user_id for user_id in user_ids if pantries.get(user_id)]
+    try:
+        results = await recommend_many([
+            (pantries[user_id], request_data.top_n, user_id, request_data.mode, filters) for user_id in found_users
+        ])
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print("Recommendation error traceback:", traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Recommendation failed: {str(e)}")
+
+    return {
+        "status": "success",
+        "recommendations": dict(zip(found_users, results)),
+        "missing_users": [user_id for user_id in user_ids if user_id not in pantries],
+    }
@@ -0,0 +1,73 @@
+import hashlib
+import io
+import os
+import tempfile
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# receipts are long and narrow, so the short side is what limits text size
+OCR_MAX_SHORT_SIDE = int(os.getenv("OCR_MAX_SHORT_SIDE", "1200"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "80"))
+OCR_GREYSCALE = os.getenv("OCR_GREYSCALE", "1") == "1"
+
+# uploads bigger than this spill from memory to a temp file on disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+async def spool_upload(upload):
+    """
+    Streams an UploadFile into a spooled temp file, hashing as it goes.
+    Returns (spooled file rewound to the start, sha256 hex, size in bytes)
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spooled.write(chunk)
+        size += len(chunk)
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size
+
+
+def prepare_image(spooled) -> bytes:
+    """
+    Downscales, greyscales and recompresses a receipt photo for OCR.
+    Anything Pillow can't read (e.g. a PDF) or fails to decode part way
+    (a truncated upload) is sent unchanged.
+    CPU bound, run it off the event loop
+    """
+    spooled.seek(0)
+    original = spooled.read()
+    try:
+        # Image.open only parses the header, the pixels are decoded by the
+        # first operation that needs them, so all of it stays inside the try
+        image = Image.open(io.BytesIO(original))
+        # let the JPEG decoder downscale while decoding, much cheaper than a full decode
+        image.draft("L" if OCR_GREYSCALE else "RGB", (OCR_MAX_SHORT_SIDE, OCR_MAX_SHORT_SIDE))
+        image = ImageOps.exif_transpose(image)
+
+        image = image.convert("L" if OCR_GREYSCALE else "RGB")
+        short_side = min(image.size)
+        if short_side > OCR_MAX_SHORT_SIDE:
+            ratio = OCR_MAX_SHORT_SIDE / short_side
+            image = image.resize(
+                (round(image.width * ratio), round(image.height * ratio)), Image.Resampling.LANCZOS
+            )
+
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+        prepared = out.getvalue()
+    except Exception:
+        return original
+
+    # never send something bigger than what we were given
+    if len(prepared) >= len(original):
+        return original
+    return prepared
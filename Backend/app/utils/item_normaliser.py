@@ -0,0 +1,215 @@
+import csv
+import os
+import re
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRODUCTS_PATH = os.getenv(
+    "PRODUCTS_PATH",
+    os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/products.csv"))
+)
+# trigram dice score a receipt line needs to be mapped onto a product
+ITEM_MATCH_THRESHOLD = float(os.getenv("ITEM_MATCH_THRESHOLD", "0.6"))
+
+# to the base unit of each family, totals are summed in g / ml
+UNITS = {
+    "mg": ("g", 0.001), "g": ("g", 1), "gr": ("g", 1), "gm": ("g", 1), "gms": ("g", 1),
+    "gram": ("g", 1), "grams": ("g", 1), "kg": ("g", 1000), "kgs": ("g", 1000),
+    "oz": ("g", 28.35), "lb": ("g", 453.6), "lbs": ("g", 453.6),
+    "ml": ("ml", 1), "cl": ("ml", 10), "l": ("ml", 1000), "lt": ("ml", 1000), "ltr": ("ml", 1000),
+    "litre": ("ml", 1000), "litres": ("ml", 1000), "liter": ("ml", 1000), "liters": ("ml", 1000),
+    "pt": ("ml", 568), "pint": ("ml", 568), "pints": ("ml", 568),
+}
+# shown as kg / l once a total gets to 1000 g / ml
+LARGE_UNITS = {"g": "kg", "ml": "l"}
+
+_SIZE = re.compile(r"(?<![\d.])(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")(?![a-z])")
+_MULTIPACK = re.compile(r"(?<![\d.])(\d+)\s*(?:x|pk|pck|pack)(?![a-z])|(?<![a-z])x\s*(\d+)(?![\d.])")
+_LEADING_COUNT = re.compile(r"^(\d+)\s+(?=[a-z])")
+_NON_WORD = re.compile(r"[^a-z]+")
+
+# supermarket names and own-brand ranges that get printed in front of the product
+STORE_WORDS = {
+    "tesco", "sainsburys", "sainsbury", "asda", "morrisons", "aldi", "lidl", "coop", "waitrose",
+    "ms", "iceland", "ocado", "finest", "taste", "difference", "value", "essentials", "everyday",
+    "smart", "price", "basics", "own", "brand",
+}
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def clean_description(text: str, store_words=frozenset()) -> str:
+    """
+    Lowercase words of a receipt line with sizes, counts, store names and
+    single letter own-brand prefixes ("T BLUEBERRY") taken out
+    """
+    text = _MULTIPACK.sub(" ", _SIZE.sub(" ", text.lower().replace("&", "")))
+    words = [w for w in _NON_WORD.sub(" ", text).split() if w not in STORE_WORDS and w not in store_words]
+    while words and len(words[0]) == 1:
+        words.pop(0)
+    return " ".join(words)
+
+
+def parse_quantity(text: str):
+    """
+    (packs, size, family) from a receipt line, e.g. "4 X 500ML" -> (4, 500, "ml"),
+    "MILK 2L" -> (1, 2000, "ml") and "12 EGGS" -> (12, None, None)
+    """
+    text = text.lower()
+    packs = 1
+    multipack = _MULTIPACK.search(text)
+    size = _SIZE.search(text)
+    if multipack:
+        packs = int(multipack.group(1) or multipack.group(2))
+    elif not size:
+        leading = _LEADING_COUNT.match(text)
+        if leading:
+            packs = int(leading.group(1))
+    if not size:
+        return packs, None, None
+    family, factor = UNITS[size.group(2)]
+    return packs, float(size.group(1).replace(",", ".")) * factor, family
+
+
+class ProductIndex:
+    """
+    Trigram inverted index over the product vocabulary (names and their
+    aliases). A lookup only scores entries sharing a trigram with the query,
+    so it stays well under a millisecond however big the vocabulary gets
+    """
+
+    def __init__(self, products: list):
+        # products: [{"name", "category", "storage", "aliases": [...]}]
+        self.products = products
+        self.entry_product = []
+        self.entry_sizes = []
+        self.postings = {}
+        for product_id, product in enumerate(products):
+            for text in [product["name"], *product["aliases"]]:
+                grams = trigrams(clean_description(text))
+                entry_id = len(self.entry_product)
+                self.entry_product.append(product_id)
+                self.entry_sizes.append(len(grams))
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(entry_id)
+
+    @classmethod
+    def from_csv(cls, path: str = PRODUCTS_PATH):
+        products = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                products.append({
+                    "name": row["name"],
+                    "category": row.get("category") or "Uncategorized",
+                    "storage": row.get("storage") or "Pantry",
+                    "aliases": [a for a in (row.get("aliases") or "").split("|") if a],
+                })
+        return cls(products)
+
+    def match(self, cleaned: str, threshold: float = ITEM_MATCH_THRESHOLD):
+        """
+        Best product for an already cleaned description, or None below the threshold
+        """
+        if not cleaned:
+            return None
+        grams = trigrams(cleaned)
+        shared = {}
+        for gram in grams:
+            for entry_id in self.postings.get(gram, ()):
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+        best, best_score = None, threshold
+        for entry_id, count in shared.items():
+            score = 2 * count / (len(grams) + self.entry_sizes[entry_id])
+            if score > best_score or (score == best_score and best is not None
+                                      and self.entry_sizes[entry_id] < self.entry_sizes[best]):
+                best, best_score = entry_id, score
+        return None if best is None else self.products[self.entry_product[best]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> ProductIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ProductIndex.from_csv()
+    return _index
+
+
+@lru_cache(maxsize=4096)
+def _match(cleaned: str):
+    return get_index().match(cleaned)
+
+
+def _merge(rows: dict, item_name: str, product, packs: float, size, family):
+    row = rows.get(item_name)
+    if row is None:
+        row = rows[item_name] = {
+            "product": product, "lines": 0, "packs": 0.0, "family": None,
+            "measured_total": 0.0, "measured_packs": 0.0,
+        }
+    row["lines"] += 1
+    if size is not None and row["family"] in (None, family):
+        row["family"] = family
+        row["measured_total"] += packs * size
+        row["measured_packs"] += packs
+    else:
+        row["packs"] += packs
+
+
+def _pantry_item(item_name: str, row: dict) -> dict:
+    product = row["product"]
+    if row["family"]:
+        # lines with no size on them count as the average size seen for this product
+        total = row["measured_total"] + row["packs"] * row["measured_total"] / row["measured_packs"]
+        unit = row["family"]
+        if total >= 1000:
+            total, unit = total / 1000, LARGE_UNITS[unit]
+    else:
+        total, unit = row["packs"], "pcs"
+    return {
+        "item_name": item_name,
+        "quantity_value": round(total, 3),
+        "quantity_unit": unit,
+        "category": product["category"] if product else "Uncategorized",
+        "storage": product["storage"] if product else "Pantry",
+    }
+
+
+def normalise_receipt_items(lines: list, merchant_name: str = None) -> tuple:
+    """
+    Maps Asprise receipt lines onto canonical products and merges lines for
+    the same product, so "MILK 2L", "Milk 2 L" and "TESCO MILK" become one row.
+
+    Returns (line counts per item name, PantryItemInput-shaped dicts)
+    """
+    store_words = frozenset(_NON_WORD.sub(" ", (merchant_name or "").lower()).split())
+    rows = {}
+    for line in lines:
+        description = (line.get("description") or "").strip()
+        if not description:
+            continue
+        cleaned = clean_description(description, store_words)
+        product = _match(cleaned)
+        if product:
+            item_name = product["name"]
+        else:
+            item_name = cleaned.title() or description.title()
+
+        packs, size, family = parse_quantity(description)
+        try:
+            qty = float(line.get("qty") or 1)
+        except (TypeError, ValueError):
+            qty = 1.0
+        _merge(rows, item_name, product, packs * (qty if qty > 0 else 1.0), size, family)
+
+    counts = {name: row["lines"] for name, row in rows.items()}
+    return counts, [_pantry_item(name, row) for name, row in rows.items()]
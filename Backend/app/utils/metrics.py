@@ -0,0 +1,348 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# lets a client profile its own request with `X-Profile: 1`, keep it off in production
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_HEADER = "x-profile"
+
+# seconds, from a cache hit up to a slow OCR call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label_text(labels: tuple, **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in pairs) + "}"
+
+
+def _flatten(prefix: str, stats: dict, out: dict):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            _flatten(name, value, out)
+        elif isinstance(value, (int, float)):
+            # bools count as 0 / 1, strings (like the pool status line) are skipped
+            out[name] = float(value)
+
+
+class MetricsRegistry:
+    """
+    Latency histograms for the whole process, plus the stats()
+    functions the caches and pools already have, rendered in the Prometheus
+    text format
+    """
+
+    def __init__(self, namespace: str = "stockd"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.collectors = {}  # name -> function returning a stats dict
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_stats(self, name: str, collect):
+        """
+        `collect()` returns a (possibly nested) dict, every number in it becomes a gauge
+        """
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = [(key, h.buckets, list(h.counts), h.sum, h.count) for key, h in sorted(self.histograms.items())]
+
+        typed = set()
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+
+        for source, collect in list(self.collectors.items()):
+            try:
+                stats = collect()
+            except Exception as e:
+                # one broken collector shouldn't take the whole endpoint down
+                print(f"metrics collector {source} failed:", e)
+                continue
+            gauges = {}
+            _flatten(f"{self.namespace}_{source}", stats, gauges)
+            for name, value in gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestTimings:
+    """
+    Stage timings of the request being handled, sent back as Server-Timing
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage -> [seconds, count]
+
+    def add(self, stage: str, seconds: float):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total_seconds: float) -> str:
+        parts = [f'{stage};dur={seconds * 1000:.1f};desc="{count}x"' for stage, (seconds, count) in self.stages.items()]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("stockd_request_timings", default=None)
+
+
+class _SharedTimings:
+    """
+    Stands in for RequestTimings while one piece of work (a micro-batch)
+    serves several requests, every one of them gets its stages
+    """
+
+    def __init__(self, targets: list):
+        self.targets = targets
+
+    def add(self, stage: str, seconds: float):
+        for timings in self.targets:
+            timings.add(stage, seconds)
+
+
+def current_timings():
+    """
+    The current request's RequestTimings, None outside a request. Grab it
+    before handing work to another thread, which won't see the request context
+    """
+    return _current.get()
+
+
+@contextmanager
+def timings_for(targets: list):
+    """
+    Stages observed inside the block count against every RequestTimings in
+    `targets`, e.g. in an executor thread running a batch for those requests
+    """
+    # one request can have several queries in the batch, count it once
+    targets = list({id(timings): timings for timings in targets if timings is not None}.values())
+    token = _current.set(_SharedTimings(targets) if targets else None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def observe_stage(stage: str, seconds: float):
+    """
+    Records one stage run, also against the current request if there is one.
+    Safe to call from worker threads (the recommender reports encode / search here)
+    """
+    if not METRICS_ENABLED:
+        return
+    registry.observe("stockd_stage_seconds", seconds, stage=stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """
+    Decorator version of span() for sync and async functions
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """
+    Times every statement the engine runs as the `db_query` stage, so each
+    request gets a query count and total DB time. Pass async_engine.sync_engine
+    for an async engine
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        observe_stage("db_query", time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every PROFILE_INTERVAL_MS from a side
+    thread and counts identical stacks, in the collapsed format flamegraph
+    tools read. On the event loop thread this includes whatever else the
+    loop ran meanwhile
+    """
+
+    _running = threading.Lock()  # one profile at a time keeps the cost bounded
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.id = uuid.uuid4().hex[:12]
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def try_start(cls, thread_id: int):
+        if not cls._running.acquire(blocking=False):
+            return None
+        profiler = cls(thread_id)
+        profiler._thread = threading.Thread(target=profiler._run, name="sampling-profiler", daemon=True)
+        profiler._thread.start()
+        return profiler
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        SamplingProfiler._running.release()
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items(), key=lambda s: -s[1]))
+
+
+# the last few profiles, fetched with GET /metrics/profiles/{id}
+profiles = OrderedDict()
+
+
+def save_profile(profile_id: str, folded: str):
+    profiles[profile_id] = folded
+    while len(profiles) > PROFILE_KEEP:
+        profiles.popitem(last=False)
+
+
+class MetricsMiddleware:
+    """
+    Per-route latency histograms and a Server-Timing header with the stages
+    the request went through. A plain ASGI middleware rather than
+    BaseHTTPMiddleware, which would add a task and a stream copy per request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = [500]
+        profiler = None
+        if PROFILE_ENABLED and Headers(scope=scope).get(PROFILE_HEADER) == "1":
+            profiler = SamplingProfiler.try_start(threading.get_ident())
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("server-timing", timings.header(time.perf_counter() - start))
+                if profiler is not None:
+                    headers.append("x-profile-id", profiler.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            seconds = time.perf_counter() - start
+            _current.reset(token)
+            # the route template, not the raw path, so ids in paths don't explode the label count
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            registry.observe("stockd_request_seconds", seconds,
+                             method=scope["method"], route=route, status=f"{status[0] // 100}xx")
+            if profiler is not None:
+                save_profile(profiler.id, profiler.stop())
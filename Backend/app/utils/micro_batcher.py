@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Coalesces items submitted concurrently into batches.
+
+    The first item waits up to `max_wait_ms` for others to arrive (or until
+    `max_batch_size` is reached), then the whole batch is handed to
+    `process_batch` in one call on `executor`, off the event loop.
+    `process_batch` takes a list of items and returns a list of results in
+    the same order. If a batch raises, its items are retried one at a time so
+    only the callers whose own item fails get the exception.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        max_concurrent_batches: int = 1,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._loop = None
+        self._queue = None
+        self._collector = None
+        self._slots = None
+        self._running = set()
+
+    def _ensure_started(self):
+        # the queue and tasks belong to whichever loop is running, so start
+        # lazily from inside it rather than at import time
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            # an empty context, not the one of the request that happened to start it
+            self._collector = contextvars.Context().run(loop.create_task, self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queues one item and waits for its result
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """
+        Queues many items at once (they will share batches) and waits for all results
+        """
+        self._ensure_started()
+        futures = []
+        for item in items:
+            future = self._loop.create_future()
+            self._queue.put_nowait((item, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # while every worker is busy more requests pile up, so top the
+            # batch up with them once a slot frees
+            await self._slots.acquire()
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = self._loop.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            items = [item for item, _ in batch]
+            results = await self._loop.run_in_executor(self.executor, self.process_batch, items)
+        except Exception as e:
+            if len(batch) == 1:
+                outcomes = [(e, None)]
+            else:
+                # one bad item shouldn't fail everyone who shared the batch
+                # window, so find out which items actually raise
+                outcomes = await self._loop.run_in_executor(self.executor, self._process_each, items)
+            for (_, future), (error, result) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _process_each(self, items: List[Any]) -> List[tuple]:
+        """
+        Runs items one at a time after a failed batch, (error, result) per item
+        """
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append((None, self.process_batch([item])[0]))
+            except Exception as e:
+                outcomes.append((e, None))
+        return outcomes
@@ -1,28 +1,31 @@
+from app.utils.item_normaliser import normalise_receipt_items
+from app.utils.metrics import timed
+
+
+@timed("receipt_parse")
 def parse_asprise_response(asprise_response: dict) -> dict:
     """
     Takes the Asprise OCR API response and extracts the store name
     and items with their counts
+
+    Lines are matched to canonical products first, so the same product
+    printed differently is counted once. `pantry_items` has one entry per
+    product in the PantryItemInput shape, ready to POST to /pantry_items
     """
     receipts = asprise_response.get("receipts", [])
-    
+
     # Handle no receipts found
-    if not receipts:                     
-        return {"merchant_name": None, "items": {}}
+    if not receipts:
+        return {"merchant_name": None, "items": {}, "pantry_items": []}
 
     # One receipt per image
     receipt = receipts[0]
     store_name = receipt.get("merchant_name", "Unknown")
 
-    items = receipt.get("items", [])
-    item_counts = {}
-
-    for item in items:
-        name = item.get("description", "").strip().title()
-        if not name:
-            continue
-        item_counts[name] = item_counts.get(name, 0) + 1
+    item_counts, pantry_items = normalise_receipt_items(receipt.get("items", []), store_name)
 
     return {
         "store": store_name,
-        "items": item_counts
+        "items": item_counts,
+        "pantry_items": pantry_items
     }
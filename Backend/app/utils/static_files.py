@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import threading
+import time
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # gzip only then, brotli variants come from the deploy step
+    brotli = None
+
+# Vite names build output like index-B3xk9_aQ.js, those never change once built
+HASHED_NAME = re.compile(r"-(?=[A-Za-z0-9_-]{0,7}[A-Z0-9])[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# anything else (favicon, index.html) can change on deploy, browsers must revalidate
+REVALIDATE_CACHE = "no-cache"
+
+# preferred order, brotli first since it's ~15-20% smaller than gzip for JS
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(headers: Headers) -> set:
+    accepted = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") != "q=0":
+            accepted.add(name.lower())
+    return accepted
+
+
+def cache_control_for(path: str) -> str:
+    return IMMUTABLE_CACHE if HASHED_NAME.search(os.path.basename(path)) else REVALIDATE_CACHE
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that sends the .br / .gz file next to an asset when the
+    client accepts it (written by the frontend deploy step), and sets
+    long-lived immutable caching on hashed filenames
+    """
+
+    def __init__(self, *args, check_dir: bool = False, **kwargs):
+        # the frontend build may not exist (API-only dev), that's just 404s
+        super().__init__(*args, check_dir=check_dir, **kwargs)
+
+    async def get_response(self, path: str, scope) -> Response:
+        # same as the base class, checked before the .br / .gz lookup can answer
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers)
+        if not path.endswith((".br", ".gz")) and "range" not in request_headers:
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                full_path, stat_result = self.lookup_path(path + suffix)
+                if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                response = self.file_response(full_path, stat_result, scope)
+                if response.status_code == 200:
+                    response.headers["content-type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                    response.headers["content-encoding"] = encoding
+                return self._with_cache_headers(response, path)
+        response = await super().get_response(path, scope)
+        return self._with_cache_headers(response, path)
+
+    def _with_cache_headers(self, response: Response, path: str) -> Response:
+        if response.status_code in (200, 304):
+            response.headers["cache-control"] = cache_control_for(path)
+            response.headers["vary"] = "Accept-Encoding"
+        return response
+
+
+class CachedIndexHtml:
+    """
+    index.html kept in memory with its gzip/brotli versions and an ETag, so
+    every client-side route is answered without touching the disk. Picks up
+    a new build on its own (checks the file's mtime at most once a second)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.bodies = {}
+        self.etag = None
+
+    def _load(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < 1.0:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self._mtime, self.bodies, self.etag = None, {}, None
+                return
+            if mtime == self._mtime:
+                return
+            with open(self.path, "rb") as f:
+                body = f.read()
+            bodies = {"identity": body, "gzip": gzip.compress(body, 9)}
+            if brotli is not None:
+                bodies["br"] = brotli.compress(body)
+            self.bodies = bodies
+            # weak, the same tag covers the identity, gzip and brotli bodies
+            self.etag = 'W/"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+            self._mtime = mtime
+
+    def response(self, request_headers: Headers):
+        """
+        Returns None if there is no build to serve
+        """
+        self._load()
+        if not self.bodies:
+            return None
+        headers = {"etag": self.etag, "cache-control": REVALIDATE_CACHE, "vary": "Accept-Encoding"}
+        if_none_match = request_headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        accepted = accepted_encodings(request_headers)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.bodies:
+                headers["content-encoding"] = encoding
+                return Response(self.bodies[encoding], media_type="text/html", headers=headers)
+        return Response(self.bodies["identity"], media_type="text/html", headers=headers)
+
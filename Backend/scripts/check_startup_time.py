@@ -0,0 +1,138 @@
+"""
+Startup budget check: how long a fresh worker takes to import the app and
+answer its first non-AI request, and that none of the AI stack gets
+imported on the way (the recommender must only load on demand).
+
+Runs each measurement in a new interpreter and keeps the best of --runs,
+then prints where the import time goes (from `python -X importtime`).
+Exits 1 if a budget is blown or a heavy module shows up, so it can run in CI.
+
+Usage (from Backend/):
+    python scripts/check_startup_time.py
+    python scripts/check_startup_time.py --cold-start-budget 0.8 --runs 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# only the recommender may bring these in, and only once it's asked for
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "faiss", "pandas", "pyarrow", "numpy", "sklearn")
+
+# imports the app, runs the lifespan startup and serves GET /health in-process
+COLD_START = """
+import time
+start = time.perf_counter()
+import asyncio, sys, httpx
+from app.main import app
+imported = time.perf_counter()
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/health")
+            response.raise_for_status()
+
+asyncio.run(first_request())
+done = time.perf_counter()
+heavy = [name for name in {heavy} if name in sys.modules]
+print(imported - start, done - start, ",".join(heavy), sep="|")
+"""
+
+
+def child_env(tmp_dir: str) -> dict:
+    # no database or model needed to start, sqlite keeps the engine creation local
+    db_path = os.path.join(tmp_dir, "startup.db")
+    return dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{db_path}",
+        SESSION_SECRET="startup-check",
+        AUDIT_SPILL_FILE=os.path.join(tmp_dir, "audit_spill.jsonl"),
+        RECOMMENDER_WARMUP="0",
+    )
+
+
+def measure(env: dict) -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START.replace("{heavy}", repr(HEAVY_MODULES))],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"startup failed:\n{result.stderr}")
+    import_seconds, first_request_seconds, heavy = result.stdout.strip().splitlines()[-1].split("|")
+    return float(import_seconds), float(first_request_seconds), [name for name in heavy.split(",") if name]
+
+
+def import_profile(env: dict) -> list:
+    """
+    (self us, cumulative us, module) for every import of app.main
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check worker startup time and lazy AI imports")
+    parser.add_argument("--import-budget", type=float, default=1.0, help="seconds to import app.main")
+    parser.add_argument("--cold-start-budget", type=float, default=1.0,
+                        help="seconds from import to the first /health response")
+    parser.add_argument("--runs", type=int, default=3, help="best of this many fresh interpreters")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = child_env(tmp_dir)
+        runs = [measure(env) for _ in range(args.runs)]
+        rows = import_profile(env)
+
+    import_seconds = min(r[0] for r in runs)
+    cold_start_seconds = min(r[1] for r in runs)
+    heavy = sorted({name for r in runs for name in r[2]})
+
+    # each package's time is the cumulative time of its first (top level) import
+    packages = {}
+    for _, cumulative_us, name in rows:
+        top = name.split(".")[0]
+        if top not in packages or name == top:
+            packages[top] = max(packages.get(top, 0), cumulative_us)
+    print("slowest imports by self time (python -X importtime, which inflates everything a little):")
+    for self_us, cumulative_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms total  {name}")
+    print("largest packages:")
+    for name, cumulative_us in sorted(packages.items(), key=lambda p: -p[1])[:8]:
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if import_seconds > args.import_budget:
+        failures.append(f"import took {import_seconds:.3f}s, budget {args.import_budget}s")
+    if cold_start_seconds > args.cold_start_budget:
+        failures.append(f"cold start took {cold_start_seconds:.3f}s, budget {args.cold_start_budget}s")
+    if heavy:
+        failures.append(f"AI modules imported at startup: {', '.join(heavy)}")
+
+    print(f"\nimport app.main   {import_seconds:.3f}s (budget {args.import_budget}s)")
+    print(f"first /health     {cold_start_seconds:.3f}s (budget {args.cold_start_budget}s)")
+    print(f"AI modules loaded {', '.join(heavy) or 'none'}")
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Local stand-in for Google's OAuth token endpoint and signing certs.
+
+Makes its own RSA key and self-signed cert, serves it at /certs with a
+Cache-Control max-age like Google does, and answers /token with an ID token
+signed by that key for whatever auth code it's given. The code becomes the
+email, so each distinct code is a distinct user. --skew issues tokens dated
+in the future to exercise the clock-skew handling.
+
+Usage (from Backend/):
+    python scripts/fake_google_oauth_server.py --port 9002 --client-id test-client
+
+then point the backend at it:
+    GOOGLE_CLIENT_ID=test-client
+    GOOGLE_TOKEN_URI=http://127.0.0.1:9002/token
+    GOOGLE_CERTS_URL=http://127.0.0.1:9002/certs
+"""
+import argparse
+import asyncio
+import datetime
+import time
+import uvicorn
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Form
+from fastapi.responses import JSONResponse
+from google.auth import crypt, jwt
+
+KEY_ID = "fake-key-1"
+
+
+def make_signing_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-google-oauth")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return key_pem.decode(), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def create_app(client_id: str, skew: int = 0, max_age: int = 3600, delay: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake Google OAuth")
+    key_pem, cert_pem = make_signing_cert()
+    signer = crypt.RSASigner.from_string(key_pem, key_id=KEY_ID)
+    app.state.stats = {"token_requests": 0, "cert_requests": 0}
+
+    @app.post("/token")
+    async def token(code: str = Form(...)):
+        app.state.stats["token_requests"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+        if code == "bad-code":
+            return JSONResponse(status_code=400, content={"error": "invalid_grant"})
+        now = int(time.time()) + skew
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": client_id,
+            "sub": f"fake-{code}",
+            "email": f"{code}@example.com",
+            "name": f"Fake User {code}",
+            "picture": None,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        return {"id_token": jwt.encode(signer, claims).decode(), "token_type": "Bearer", "expires_in": 3600}
+
+    @app.get("/certs")
+    async def certs():
+        app.state.stats["cert_requests"] += 1
+        return JSONResponse({KEY_ID: cert_pem}, headers={"Cache-Control": f"public, max-age={max_age}"})
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google OAuth token / cert server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--client-id", default="test-client", help="audience put in issued ID tokens")
+    parser.add_argument("--skew", type=int, default=0, help="seconds to date tokens into the future")
+    parser.add_argument("--max-age", type=int, default=3600, help="Cache-Control max-age on /certs")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering /token")
+    args = parser.parse_args()
+    app = create_app(args.client_id, args.skew, args.max_age, args.delay)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
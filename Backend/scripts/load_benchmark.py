@@ -0,0 +1,365 @@
+"""
+Offline end-to-end load test for the API: throughput, p50/p95/p99 latency
+and memory for each route at increasing concurrency.
+
+Everything it talks to is a local stand-in, so it needs no network, no
+MySQL and no credentials:
+    database - a seeded SQLite file (DATABASE_URL / ASYNC_DATABASE_URL)
+    OCR      - scripts/stub_asprise_server.py in a subprocess
+    Google   - scripts/fake_google_oauth_server.py in a subprocess
+    recipes  - an index built from a small synthetic parquet, needs
+               sentence-transformers and the model in the local HF cache
+               (skipped otherwise, or pass --recipe-artifacts to reuse one)
+
+The app runs in this process behind httpx's ASGI transport, so memory is
+the API's own RSS. Results go to a JSON file, pass an older one as
+--baseline to print the change and exit 1 on a regression.
+
+Usage (from Backend/):
+    python scripts/load_benchmark.py
+    python scripts/load_benchmark.py --concurrency 1,8,32 --requests 300 --out load_benchmark_v2.json
+    python scripts/load_benchmark.py --baseline load_benchmark_v1.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SCRIPTS_DIR = os.path.join(BACKEND_DIR, "scripts")
+AI_MODELS_DIR = os.path.normpath(os.path.join(BACKEND_DIR, "../AI/app/models"))
+sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = ("pantry_items", "upload_receipt", "auth_google", "recommendations")
+CLIENT_ID = "bench-client"
+INGREDIENTS = [
+    "chicken breast", "rice", "onion", "garlic", "tomato", "pasta", "olive oil", "milk", "eggs",
+    "butter", "flour", "sugar", "potato", "carrot", "beef mince", "cheddar cheese", "spinach",
+    "lemon", "salmon", "yogurt", "honey", "ginger", "soy sauce", "mushroom", "peppers",
+]
+
+
+def rss_mb() -> float:
+    """
+    Current resident memory of this process in MB (linux), falls back to peak RSS
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(script: str, *args) -> tuple:
+    """
+    Runs one of the stand-in servers in its own process, returns (process, base url)
+    """
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPTS_DIR, script), "--port", str(port), *args])
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/stats", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit(f"{script} did not start")
+
+
+def make_recipes_parquet(path: str, count: int, seed: int = 0):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rng = random.Random(seed)
+    parts = [rng.sample(INGREDIENTS, rng.randint(3, 9)) for _ in range(count)]
+    pq.write_table(pa.table({
+        "RecipeId": list(range(1, count + 1)),
+        "Name": [f"Recipe {i} with {p[0]}" for i, p in enumerate(parts, 1)],
+        "RecipeIngredientParts": parts,
+    }), path)
+
+
+def build_recipe_index(tmp_dir: str, count: int):
+    """
+    Builds a throwaway index artifact, returns None or why the recommendations scenario is skipped
+    """
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return "sentence-transformers is not installed"
+    data_path = os.path.join(tmp_dir, "recipes.parquet")
+    make_recipes_parquet(data_path, count)
+    env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+    result = subprocess.run(
+        [sys.executable, os.path.join(AI_MODELS_DIR, "build_recipe_index.py"), "--data", data_path,
+         "--build-dir", os.path.join(tmp_dir, "index_build"), "--workers", "1", "--fresh"],
+        cwd=AI_MODELS_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return "could not build the recipe index (is the model in the local HF cache?): " + \
+            (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return None
+
+
+def configure_environment(tmp_dir: str, ocr_url: str, google_url: str):
+    # must happen before anything from app is imported, the modules read these at import time
+    db_path = os.path.join(tmp_dir, "bench.db")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "ASPRISE_API_URL": f"{ocr_url}/receipt",
+        "ASPRISE_CLIENT_ID": "TEST",
+        "GOOGLE_CLIENT_ID": CLIENT_ID,
+        "GOOGLE_CLIENT_SECRET": "bench-secret",
+        "GOOGLE_TOKEN_URI": f"{google_url}/token",
+        "GOOGLE_CERTS_URL": f"{google_url}/certs",
+        "SESSION_SECRET": "bench-session-secret",
+        "AUDIT_SPILL_FILE": os.path.join(tmp_dir, "audit_spill.jsonl"),
+        "AUDIT_LOG_FILE": "",
+        # a background model load would skew the scenarios that run before recommendations,
+        # that scenario's own warmup requests load it instead
+        "RECOMMENDER_WARMUP": "0",
+    })
+
+
+def seed_database(users: int):
+    from app.database.database import engine, Base
+    from app.database.models import User
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"email": f"seed{i}@example.com", "name": f"Seed {i}", "client_id": f"seed-{i}", "role": "user"}
+            for i in range(users)
+        ])
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(User.__table__.select().with_only_columns(User.__table__.c.id))]
+
+
+def make_receipt_image(seed: int) -> bytes:
+    # random blocks so every upload has its own content hash, i.e. an OCR cache miss
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (600, 900), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(560), rng.randrange(860)
+        draw.rectangle((x, y, x + rng.randrange(20, 200), y + rng.randrange(10, 60)), fill=rng.choice(("black", "grey")))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def make_requests(scenario: str, count: int, user_ids: list, offset: int) -> list:
+    """
+    (method, path, kwargs) for each request, built up front so it isn't timed
+    """
+    rng = random.Random(offset)
+    requests = []
+    for i in range(offset, offset + count):
+        if scenario == "pantry_items":
+            items = [{"item_name": name, "quantity_value": rng.randint(1, 5), "quantity_unit": "pcs"}
+                     for name in rng.sample(INGREDIENTS, 20)]
+            requests.append(("POST", "/pantry_items", {"json": {"user_id": rng.choice(user_ids), "items": items}}))
+        elif scenario == "upload_receipt":
+            files = {"file": (f"receipt{i}.jpg", make_receipt_image(i), "image/jpeg")}
+            requests.append(("POST", "/upload-receipt", {"files": files}))
+        elif scenario == "auth_google":
+            # a few hundred distinct accounts, so both the new-user and returning-user paths run
+            requests.append(("POST", "/auth/google", {"json": {"token": f"bench{i % 300}"}}))
+        else:
+            pantry = rng.sample(INGREDIENTS, rng.randint(3, 10))
+            requests.append(("POST", "/recommendations", {"json": {"pantry_items": pantry, "top_n": 10}}))
+    return requests
+
+
+async def run_level(client, requests: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], {}
+
+    async def one(method, path, kwargs):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status not in (200, 202):
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(requests),
+        "errors": errors,
+        "throughput_rps": round(len(requests) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def relative_change(new: float, old: float):
+    """
+    new / old - 1, or None when the baseline is 0 (no throughput, no rss reading)
+    """
+    if not old:
+        return 0.0 if not new else None
+    return new / old - 1
+
+
+def _pct(change) -> str:
+    return f"{'n/a':>10}" if change is None else f"{change:>+10.1%}"
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> int:
+    """
+    Prints the change against an older results file, returns the number of regressions
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r.get("concurrency")): r for r in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path} (regression = {tolerance:.0%} worse)")
+    print(f"{'scenario':<17}{'conc':>6}{'rps':>10}{'p95':>10}{'rss':>10}")
+    regressions = 0
+    for result in results:
+        old = baseline.get((result["scenario"], result.get("concurrency")))
+        if not old or "throughput_rps" not in old or "throughput_rps" not in result:
+            continue
+        rps = relative_change(result["throughput_rps"], old["throughput_rps"])
+        p95 = relative_change(result["p95_ms"], old["p95_ms"])
+        rss = relative_change(result["rss_mb"], old["rss_mb"])
+        flag = (rps is not None and rps < -tolerance) or (p95 is not None and p95 > tolerance) \
+            or (rss is not None and rss > tolerance)
+        regressions += flag
+        note = "  REGRESSION" if flag else "  not comparable (0 in baseline)" if None in (rps, p95, rss) else ""
+        print(f"{result['scenario']:<17}{result['concurrency']:>6}{_pct(rps)}{_pct(p95)}{_pct(rss)}{note}")
+    return regressions
+
+
+async def run(args, user_ids: list, skipped: dict) -> list:
+    from app.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"{'scenario':<17}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>10}  errors")
+        offset = 0
+        for scenario in args.scenarios.split(","):
+            if scenario in skipped:
+                print(f"{scenario:<17}skipped: {skipped[scenario]}")
+                results.append({"scenario": scenario, "skipped": skipped[scenario]})
+                continue
+            # warm up connections, caches and lazy imports before timing anything
+            await run_level(client, make_requests(scenario, args.warmup, user_ids, offset), 1)
+            offset += args.warmup
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                requests = make_requests(scenario, args.requests, user_ids, offset)
+                offset += args.requests
+                result = {"scenario": scenario, **await run_level(client, requests, concurrency)}
+                results.append(result)
+                print(f"{scenario:<17}{concurrency:>6}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}"
+                      f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['rss_mb']:>10.1f}  {result['errors'] or ''}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the backend and AI paths")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16,64", help="levels to run, in order")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario per level")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests before each scenario")
+    parser.add_argument("--users", type=int, default=200, help="users seeded into the database")
+    parser.add_argument("--recipes", type=int, default=5000, help="synthetic recipes to index")
+    parser.add_argument("--recipe-artifacts", default=None, help="use an existing index artifact dir instead")
+    parser.add_argument("--ocr-delay", type=float, default=0.05, help="seconds the stub OCR server takes per receipt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load_benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="older results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    tmp_dir = tempfile.mkdtemp(prefix="stockd_bench_")
+    ocr_server, ocr_url = start_server("stub_asprise_server.py", "--delay", str(args.ocr_delay))
+    google_server, google_url = start_server("fake_google_oauth_server.py", "--client-id", CLIENT_ID)
+    try:
+        configure_environment(tmp_dir, ocr_url, google_url)
+        skipped = {}
+        if "recommendations" in args.scenarios:
+            if args.recipe_artifacts:
+                os.environ["RECIPE_ARTIFACTS_DIR"] = os.path.abspath(args.recipe_artifacts)
+            else:
+                os.environ["RECIPE_ARTIFACTS_DIR"] = os.path.join(tmp_dir, "artifacts")
+                reason = build_recipe_index(tmp_dir, args.recipes)
+                if reason:
+                    skipped["recommendations"] = reason
+
+        start_rss = rss_mb()
+        user_ids = seed_database(args.users)
+        results = asyncio.run(run(args, user_ids, skipped))
+    finally:
+        ocr_server.kill()
+        google_server.kill()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                     capture_output=True, text=True).stdout.strip() or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "start_rss_mb": round(start_rss, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\npeak RSS {output['meta']['peak_rss_mb']:.1f} MB, results written to {args.out}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
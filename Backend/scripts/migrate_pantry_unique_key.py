@@ -0,0 +1,121 @@
+"""
+One-off migration for databases created before PantryItems had the unique
+(user_id, item_name) key that the bulk pantry upsert relies on.
+
+Duplicate items (same user, same name ignoring case and surrounding spaces,
+see pantry_name_key) are collapsed onto the most recently added row, recipe
+ingredients pointing at the dropped rows are moved to the kept one, and names
+are trimmed the way the API writes them. Then the key is added. The deletes
+go through the audit log like any other change.
+
+Usage (from Backend/):
+    python scripts/migrate_pantry_unique_key.py --dry-run
+    python scripts/migrate_pantry_unique_key.py
+"""
+import argparse
+import os
+import sys
+from sqlalchemy import func, inspect, select, text, update
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.database.database import SessionLocal, engine  # noqa: E402
+from app.database.audit import audit_writer  # noqa: E402
+from app.database.models import PantryItem, RecipeIngredient  # noqa: E402
+from app.database.pantry import pantry_name_key  # noqa: E402
+
+UNIQUE_KEY = "uq_pantry_user_item"
+
+
+def has_unique_key() -> bool:
+    inspector = inspect(engine)
+    names = {c["name"] for c in inspector.get_unique_constraints(PantryItem.__tablename__)}
+    names |= {i["name"] for i in inspector.get_indexes(PantryItem.__tablename__) if i.get("unique")}
+    return UNIQUE_KEY in names
+
+
+def users_to_fix(session) -> list:
+    """
+    Users with duplicate item names or names that aren't trimmed
+    """
+    key = func.lower(func.trim(PantryItem.item_name))
+    duplicated = select(PantryItem.user_id).group_by(PantryItem.user_id, key).having(func.count() > 1)
+    untrimmed = select(PantryItem.user_id).where(PantryItem.item_name != func.trim(PantryItem.item_name))
+    return sorted(set(session.execute(duplicated).scalars()) | set(session.execute(untrimmed).scalars()))
+
+
+def plan_user(items: list):
+    """
+    Returns ({dropped row: kept row}, [(kept row, trimmed name)]) for one user's items
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(pantry_name_key(item.item_name), []).append(item)
+
+    replaced, renamed = {}, []
+    for group in groups.values():
+        # the newest one is what the user last told us, like the upsert's last one wins
+        group.sort(key=lambda item: (item.added_on is not None, item.added_on or 0, item.id))
+        kept = group[-1]
+        for item in group[:-1]:
+            replaced[item] = kept
+        if kept.item_name != kept.item_name.strip():
+            renamed.append((kept, kept.item_name.strip()))
+    return replaced, renamed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedupe PantryItems and add the unique (user_id, item_name) key")
+    parser.add_argument("--dry-run", action="store_true", help="print what would change without changing it")
+    args = parser.parse_args()
+
+    if has_unique_key():
+        print(f"{PantryItem.__tablename__} already has {UNIQUE_KEY}")
+        return
+
+    dropped = trimmed = 0
+    with SessionLocal() as session:
+        for user_id in users_to_fix(session):
+            items = session.execute(select(PantryItem).where(PantryItem.user_id == user_id)).scalars().all()
+            replaced, renamed = plan_user(items)
+            for item, kept in replaced.items():
+                print(f"user {user_id}: drop #{item.id} {item.item_name!r}, keep #{kept.id} {kept.item_name!r}")
+            for item, name in renamed:
+                print(f"user {user_id}: rename #{item.id} {item.item_name!r} -> {name!r}")
+            dropped += len(replaced)
+            trimmed += len(renamed)
+            if args.dry_run:
+                continue
+
+            for item, kept in replaced.items():
+                session.execute(
+                    update(RecipeIngredient).where(RecipeIngredient.pantry_item_id == item.id)
+                    .values(pantry_item_id=kept.id)
+                )
+                session.delete(item)
+            for item, name in renamed:
+                item.item_name = name
+            session.flush()
+        # committed before the DDL, which MySQL would commit implicitly anyway
+        if not args.dry_run:
+            session.commit()
+
+    # nothing runs the audit writer in a script, the spill file is replayed into
+    # audit_logs by the next API start
+    audit_writer.spill_remaining()
+
+    statement = (
+        f"CREATE UNIQUE INDEX {UNIQUE_KEY} ON {PantryItem.__tablename__} (user_id, item_name)"
+        if engine.dialect.name == "sqlite" else
+        f"ALTER TABLE {PantryItem.__tablename__} ADD UNIQUE KEY {UNIQUE_KEY} (user_id, item_name)"
+    )
+    print(statement)
+    if args.dry_run:
+        print(f"dry run: would drop {dropped} duplicate items and trim {trimmed} names")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(statement))
+    print(f"dropped {dropped} duplicate items, trimmed {trimmed} names, added {UNIQUE_KEY}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Latency of the /pantry_items write path: the old SELECT-per-item loop against
+the bulk upsert, for 1, 50 and 500-item submissions.
+
+Each run sends a pantry where half the items already exist (updates) and
+half are new (inserts). Defaults to a throwaway SQLite file; pass
+--database-url to run against MySQL (the tables must already exist there,
+e.g. from Database/schema.sql).
+
+Usage (from Backend/):
+    python scripts/pantry_upsert_benchmark.py
+    python scripts/pantry_upsert_benchmark.py --database-url mysql+aiomysql://root:pw@localhost/stockd_db
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.database.database import Base  # noqa: E402
+from app.database.models import User, PantryItem, PantryItemInput  # noqa: E402
+from app.database.pantry import upsert_pantry_items, clean_pantry_item  # noqa: E402
+
+
+async def legacy_upsert(db, user_id: int, items: list):
+    # the original route body: one SELECT per item, then an ORM insert or update
+    for item in items:
+        row = clean_pantry_item(item)
+        existing_item = (await db.scalars(
+            select(PantryItem)
+            .where(PantryItem.user_id == user_id)
+            .where(PantryItem.item_name == row["item_name"])
+        )).first()
+        if existing_item:
+            for key, value in row.items():
+                setattr(existing_item, key, value)
+            existing_item.added_on = datetime.datetime.utcnow()
+        else:
+            db.add(PantryItem(user_id=user_id, added_on=datetime.datetime.utcnow(), **row))
+            await db.flush()
+
+
+def make_items(size: int, run: int) -> list:
+    # first half repeats every run (updates), second half is new each run (inserts)
+    names = [f"item {i}" for i in range(size // 2)]
+    names += [f"item {run}-{i}" for i in range(size - len(names))]
+    return [PantryItemInput(item_name=name, quantity_value=run, quantity_unit="g") for name in names]
+
+
+async def run(session_factory, upsert, user_id: int, size: int, repeats: int, counter: list):
+    latencies, statements = [], []
+    for run_no in range(repeats):
+        items = make_items(size, run_no)
+        async with session_factory() as db:
+            counter[0] = 0
+            start = time.perf_counter()
+            await upsert(db, user_id, items)
+            await db.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+            statements.append(counter[0])
+    return statistics.median(latencies), max(latencies), statistics.median(statements)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pantry upsert")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--sizes", default="1,50,500")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/pantry_benchmark.db"
+    engine = create_async_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[User.__table__, PantryItem.__table__])
+
+    counter = [0]
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statements(*_):
+        counter[0] += 1
+
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    print(f"{engine.dialect.name}, {args.repeats} runs per size\n")
+    print(f"{'items':>6}{'method':>9}{'p50 ms':>10}{'max ms':>10}{'statements':>12}")
+
+    for offset, size in enumerate(int(s) for s in args.sizes.split(",")):
+        for method_no, (name, upsert) in enumerate((("loop", legacy_upsert), ("bulk", upsert_pantry_items))):
+            # a fresh user per size and method so the runs don't see each other's rows
+            async with session_factory() as db:
+                user = User(name="benchmark", email=f"bench-{time.time_ns()}-{offset}-{method_no}@example.com")
+                db.add(user)
+                await db.commit()
+                user_id = user.id
+
+            p50, worst, statements = await run(session_factory, upsert, user_id, size, args.repeats, counter)
+            print(f"{size:>6}{name:>9}{p50:>10.2f}{worst:>10.2f}{statements:>12.0f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Monthly maintenance for the partitioned audit_logs table.
+
+Adds partitions for the coming months (split out of p_future) and drops
+whole months older than the retention window, which is instant compared to
+a DELETE over millions of rows. Safe to run daily from cron.
+
+Usage (from Backend/):
+    python scripts/rotate_audit_partitions.py --retention-months 12 --dry-run
+    python scripts/rotate_audit_partitions.py --retention-months 12 --months-ahead 3
+"""
+import argparse
+import datetime
+import os
+import sys
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.database.database import engine, DB_NAME  # noqa: E402
+
+FUTURE_PARTITION = "p_future"
+
+
+def add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"p{month.year}_{month.month:02d}"
+
+
+def existing_partitions(conn) -> list:
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = 'audit_logs' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"schema": DB_NAME})
+    return [name for (name,) in rows]
+
+
+def plan(partitions: list, today: datetime.date, retention_months: int, months_ahead: int) -> list:
+    """
+    Returns the ALTER TABLE statements needed, oldest drops first
+    """
+    statements = []
+    this_month = today.replace(day=1)
+
+    # a partition named pYYYY_MM holds that month, drop it once the whole month is past retention
+    oldest_kept = add_months(this_month, -retention_months)
+    expired = [
+        name for name in partitions
+        if name != FUTURE_PARTITION and datetime.date(int(name[1:5]), int(name[6:8]), 1) < oldest_kept
+    ]
+    if expired:
+        statements.append(f"ALTER TABLE audit_logs DROP PARTITION {', '.join(expired)}")
+
+    # new months can only be split off p_future, so start right after the newest partition
+    named = [name for name in partitions if name != FUTURE_PARTITION]
+    month = add_months(datetime.date(int(max(named)[1:5]), int(max(named)[6:8]), 1), 1) if named else this_month
+    missing = []
+    while month <= add_months(this_month, months_ahead):
+        missing.append(month)
+        month = add_months(month, 1)
+    if missing:
+        new_parts = ", ".join(
+            f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1).isoformat()}')"
+            for month in missing
+        )
+        statements.append(
+            f"ALTER TABLE audit_logs REORGANIZE PARTITION {FUTURE_PARTITION} INTO "
+            f"({new_parts}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE))"
+        )
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add and drop monthly audit_logs partitions")
+    parser.add_argument("--retention-months", type=int, default=12)
+    parser.add_argument("--months-ahead", type=int, default=3)
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without running them")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        partitions = existing_partitions(conn)
+        if not partitions:
+            print("audit_logs is not partitioned, run Database/schema.sql first")
+            return
+        statements = plan(partitions, datetime.date.today(), args.retention_months, args.months_ahead)
+        for statement in statements:
+            print(statement)
+            if not args.dry_run:
+                conn.execute(text(statement))
+        if not statements:
+            print("audit_logs partitions are up to date")
+
+
+if __name__ == "__main__":
+    main()
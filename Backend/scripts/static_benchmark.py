@@ -0,0 +1,98 @@
+"""
+Requests/sec and bytes on the wire for loading the frontend, cold and warm.
+
+A "page load" fetches index.html and every local script, stylesheet and
+image it references, like a browser would:
+    cold identity   - empty cache, no compression (what the old static setup sent)
+    cold compressed - empty cache, Accept-Encoding: br, gzip
+    warm            - index.html revalidated with its ETag (304), hashed assets
+                      skipped because they're cached as immutable, the rest revalidated
+
+Needs a frontend build in app/static/frontend (npm run deploy in Frontend/).
+Runs in-process against the ASGI app unless --url points at a running server.
+
+Usage (from Backend/):
+    python scripts/static_benchmark.py --loads 200 --concurrency 20
+    python scripts/static_benchmark.py --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ASSET_REF = re.compile(r'(?:src|href)="(/[^"]+)"')
+COMPRESSED = "br, gzip"
+
+
+async def cold_load(client, encoding: str):
+    index = await client.get("/", headers={"accept-encoding": encoding})
+    index.raise_for_status()
+    assets = ASSET_REF.findall(index.text)
+    responses = await asyncio.gather(*(client.get(url, headers={"accept-encoding": encoding}) for url in assets))
+    for response in responses:
+        response.raise_for_status()
+    return [index, *responses]
+
+
+async def warm_load(client, primed: list):
+    # what a browser sends with everything from a cold load in its cache
+    requests = []
+    for response in primed:
+        if "immutable" in response.headers.get("cache-control", ""):
+            continue
+        headers = {"accept-encoding": COMPRESSED}
+        if "etag" in response.headers:
+            headers["if-none-match"] = response.headers["etag"]
+        if "last-modified" in response.headers:
+            headers["if-modified-since"] = response.headers["last-modified"]
+        requests.append(client.get(response.request.url.raw_path.decode(), headers=headers))
+    return await asyncio.gather(*requests)
+
+
+async def run(client, name: str, load, loads: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    totals = {"requests": 0, "bytes": 0, "not_modified": 0}
+
+    async def one():
+        async with semaphore:
+            for response in await load():
+                totals["requests"] += 1
+                totals["bytes"] += response.num_bytes_downloaded
+                totals["not_modified"] += response.status_code == 304
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(loads)))
+    seconds = time.perf_counter() - start
+    print(f"{name:<17}{loads / seconds:>12.1f}{totals['requests'] / seconds:>14.1f}"
+          f"{totals['requests'] / loads:>10.1f}{totals['bytes'] / loads / 1024:>12.1f}{totals['not_modified'] / loads:>8.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark static frontend serving")
+    parser.add_argument("--url", default=None, help="running server, default is the app in-process")
+    parser.add_argument("--loads", type=int, default=200, help="page loads per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async with client:
+        primed = await cold_load(client, COMPRESSED)
+        print(f"{len(primed) - 1} assets referenced by index.html, {args.loads} page loads per scenario\n")
+        print(f"{'scenario':<17}{'loads/sec':>12}{'requests/sec':>14}{'req/load':>10}{'KiB/load':>12}{'304s':>8}")
+        await run(client, "cold identity", lambda: cold_load(client, "identity"), args.loads, args.concurrency)
+        await run(client, "cold compressed", lambda: cold_load(client, COMPRESSED), args.loads, args.concurrency)
+        await run(client, "warm", lambda: warm_load(client, primed), args.loads, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Local stand-in for the Asprise receipt OCR API.
+
+Accepts the same multipart POST the backend sends and returns a canned
+receipt after an optional delay, so the OCR client and job queue can be
+exercised (and load tested) without network access or API credits.
+
+Usage (from Backend/):
+    python scripts/stub_asprise_server.py --port 9001 --delay 0.5 --fail-rate 0.1
+
+then point the backend at it:
+    ASPRISE_API_URL=http://127.0.0.1:9001/receipt
+"""
+import argparse
+import asyncio
+import random
+import uvicorn
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import JSONResponse
+
+STUB_RECEIPT = {
+    "merchant_name": "TESCO STORES",
+    "items": [
+        {"description": "MILK 2L", "qty": 1, "amount": 1.45},
+        {"description": "Milk 2 L", "qty": 1, "amount": 1.45},
+        {"description": "T BLUEBERRY 150G", "qty": 1, "amount": 2.00},
+        {"description": "SALAD TOMATOES", "qty": 1, "amount": 0.95},
+        {"description": "CHICKEN BREAST 500G", "qty": 1, "amount": 3.80},
+        {"description": "WASHING LIQUID", "qty": 1, "amount": 1.20},
+    ],
+}
+
+
+def create_app(delay: float = 0.0, fail_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Stub Asprise OCR")
+    app.state.requests = 0
+
+    @app.post("/receipt")
+    async def receipt(file: UploadFile = File(...), client_id: str = Form(None),
+                      recognizer: str = Form(None), ref_no: str = Form(None)):
+        app.state.requests += 1
+        image_bytes = await file.read()
+        if delay:
+            await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return JSONResponse(status_code=503, content={"success": False, "message": "stub failure"})
+        return {
+            "success": True,
+            "ref_no": ref_no,
+            "file_size": len(image_bytes),
+            "receipts": [STUB_RECEIPT],
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Asprise OCR server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.delay, args.fail_rate), host=args.host, port=args.port, log_level="warning")
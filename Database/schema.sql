@@ -23,6 +23,7 @@ CREATE TABLE PantryItems (
     quantity_value FLOAT DEFAULT 0,
     quantity_unit VARCHAR(100),
     added_on DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_pantry_user_item (user_id, item_name),
     FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
 );
 
@@ -33,7 +34,9 @@ CREATE TABLE Recipes (
     recipe_image VARCHAR(255),
     steps TEXT,
     prep_time INT,
-    cook_time INT
+    cook_time INT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_recipes_updated_at (updated_at)
 );
 
 -- RECIPE INGREDIENTS
@@ -48,177 +51,34 @@ CREATE TABLE RecipeIngredients (
 );
 
 -- AUDIT LOG
+-- written in batches by the backend (app/database/audit.py), not by triggers.
+-- partitioned by month so retention is a partition drop, see
+-- Backend/scripts/rotate_audit_partitions.py. MySQL wants the partitioning
+-- column in every unique key, hence the (id, timestamp) primary key
 CREATE TABLE audit_logs (
-    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    id BIGINT UNSIGNED AUTO_INCREMENT,
     timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     db_user VARCHAR(100),
     user_id VARCHAR(50),
     action ENUM('INSERT', 'UPDATE', 'DELETE') NOT NULL,
     table_name VARCHAR(64),
     record_id VARCHAR(100),
-    changes JSON
+    changes JSON,
+    PRIMARY KEY (id, timestamp),
+    INDEX idx_audit_logs_timestamp (timestamp)
+)
+PARTITION BY RANGE COLUMNS (timestamp) (
+    PARTITION p2026_01 VALUES LESS THAN ('2026-02-01'),
+    PARTITION p2026_02 VALUES LESS THAN ('2026-03-01'),
+    PARTITION p2026_03 VALUES LESS THAN ('2026-04-01'),
+    PARTITION p2026_04 VALUES LESS THAN ('2026-05-01'),
+    PARTITION p2026_05 VALUES LESS THAN ('2026-06-01'),
+    PARTITION p2026_06 VALUES LESS THAN ('2026-07-01'),
+    PARTITION p2026_07 VALUES LESS THAN ('2026-08-01'),
+    PARTITION p2026_08 VALUES LESS THAN ('2026-09-01'),
+    PARTITION p2026_09 VALUES LESS THAN ('2026-10-01'),
+    PARTITION p2026_10 VALUES LESS THAN ('2026-11-01'),
+    PARTITION p2026_11 VALUES LESS THAN ('2026-12-01'),
+    PARTITION p2026_12 VALUES LESS THAN ('2027-01-01'),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
 );
-
--- TRIGGERS FOR USERS TABLE INSERT
-DELIMITER $$
-
-CREATE TRIGGER users_insert_audit
-AFTER INSERT ON Users
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        NEW.id,
-        'INSERT',
-        'Users',
-        NEW.id,
-        JSON_OBJECT(
-            'name', NEW.name,
-            'email', NEW.email,
-            'picture', NEW.picture,
-            'client_id', NEW.client_id,
-            'role', NEW.role
-        )
-    );
-END$$
-
--- TRIGGERS FOR USERS TABLE UPDATE
-CREATE TRIGGER users_update_audit
-AFTER UPDATE ON Users
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        NEW.id,
-        'UPDATE',
-        'Users',
-        NEW.id,
-        JSON_OBJECT(
-            'old', JSON_OBJECT(
-                'name', OLD.name,
-                'email', OLD.email,
-                'picture', OLD.picture,
-                'client_id', OLD.client_id,
-                'role', OLD.role
-            ),
-            'new', JSON_OBJECT(
-                'name', NEW.name,
-                'email', NEW.email,
-                'picture', NEW.picture,
-                'client_id', NEW.client_id,
-                'role', NEW.role
-            )
-        )
-    );
-END$$
-
--- TRIGGERS FOR USERS TABLE DELETE
-CREATE TRIGGER users_delete_audit
-AFTER DELETE ON Users
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        OLD.id,
-        'DELETE',
-        'Users',
-        OLD.id,
-        JSON_OBJECT(
-            'name', OLD.name,
-            'email', OLD.email,
-            'picture', OLD.picture,
-            'client_id', OLD.client_id,
-            'role', OLD.role
-        )
-    );
-END$$
-
-DELIMITER ;
-
--- TRIGGERS FOR PANTRYITEMS TABLE INSERT
-DELIMITER $$
-
-CREATE TRIGGER pantryitems_insert_audit
-AFTER INSERT ON PantryItems
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        NEW.user_id,
-        'INSERT',
-        'PantryItems',
-        NEW.id,
-        JSON_OBJECT(
-            'item_name', NEW.item_name,
-            'category', NEW.category,
-            'storage', NEW.storage,
-            'quantity_value', NEW.quantity_value,
-            'quantity_unit', NEW.quantity_unit
-        )
-    );
-END$$
-
--- TRIGGERS FOR PANTRYITEMS TABLE UPDATE
-CREATE TRIGGER pantryitems_update_audit
-AFTER UPDATE ON PantryItems
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        NEW.user_id,
-        'UPDATE',
-        'PantryItems',
-        NEW.id,
-        JSON_OBJECT(
-            'old', JSON_OBJECT(
-                'item_name', OLD.item_name,
-                'category', OLD.category,
-                'storage', OLD.storage,
-                'quantity_value', OLD.quantity_value,
-                'quantity_unit', OLD.quantity_unit
-            ),
-            'new', JSON_OBJECT(
-                'item_name', NEW.item_name,
-                'category', NEW.category,
-                'storage', NEW.storage,
-                'quantity_value', NEW.quantity_value,
-                'quantity_unit', NEW.quantity_unit
-            )
-        )
-    );
-END$$
-
--- TRIGGERS FOR PANTRYITEMS TABLE DELETE
-CREATE TRIGGER pantryitems_delete_audit
-AFTER DELETE ON PantryItems
-FOR EACH ROW
-BEGIN
-    INSERT INTO audit_logs (timestamp, db_user, user_id, action, table_name, record_id, changes)
-    VALUES (
-        NOW(),
-        CURRENT_USER(),
-        OLD.user_id,
-        'DELETE',
-        'PantryItems',
-        OLD.id,
-        JSON_OBJECT(
-            'item_name', OLD.item_name,
-            'category', OLD.category,
-            'storage', OLD.storage,
-            'quantity_value', OLD.quantity_value,
-            'quantity_unit', OLD.quantity_unit
-        )
-    );
-END$$
-
-DELIMITER ;
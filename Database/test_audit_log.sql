@@ -1,3 +1,7 @@
+-- Audit rows are written by the backend (app/database/audit.py), not triggers,
+-- so statements run here directly are NOT audited any more. Use this script to
+-- seed data, then go through the API (or SessionLocal) to see audit_logs fill.
+
 -- Insert multiple users
 INSERT INTO Users (name, email, picture, client_id, role)
 VALUES
@@ -32,3 +36,9 @@ SELECT * FROM audit_logs;
 
 -- Display audit logs in readable format
 SELECT * FROM audit_logs\G;
+
+-- Rows per monthly partition
+SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+FROM information_schema.PARTITIONS
+WHERE TABLE_SCHEMA = 'stockd_db' AND TABLE_NAME = 'audit_logs'
+ORDER BY PARTITION_ORDINAL_POSITION;
@@ -2,6 +2,7 @@ import { spawn, spawnSync } from "child_process";
 import fs from "fs-extra";
 import path from "path";
 import os from "os";
+import zlib from "zlib";
 
 /**
  * This is an automated script to deploy production level project for development purposes.
@@ -33,6 +34,38 @@ fs.mkdirSync(backendStaticPath, { recursive: true });
 fs.copySync(distPath, backendStaticPath);
 console.log("Copied new frontend build to Backend/app/static/frontend.");
 
+// 3b. Write .br and .gz next to text assets so the backend can send them precompressed
+const COMPRESSIBLE = new Set([".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".ico"]);
+
+const precompress = (dir) => {
+    let written = 0;
+    for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+        const filePath = path.join(dir, entry.name);
+        if (entry.isDirectory()) {
+            written += precompress(filePath);
+            continue;
+        }
+        if (!COMPRESSIBLE.has(path.extname(entry.name)) || entry.name === "index.html") continue;
+        const body = fs.readFileSync(filePath);
+        const variants = {
+            ".br": zlib.brotliCompressSync(body, {
+                params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY },
+            }),
+            ".gz": zlib.gzipSync(body, { level: 9 }),
+        };
+        for (const [suffix, compressed] of Object.entries(variants)) {
+            // not worth it for tiny files that don't shrink
+            if (compressed.length < body.length * 0.9) {
+                fs.writeFileSync(filePath + suffix, compressed);
+                written += 1;
+            }
+        }
+    }
+    return written;
+};
+
+console.log(`Wrote ${precompress(backendStaticPath)} precompressed asset variants.`);
+
 // 4️. Detect Python and create virtual environment if needed
 console.log("Checking Python environment...");
 const pythonCmd = os.platform() === "win32" ? "python" : "python3";
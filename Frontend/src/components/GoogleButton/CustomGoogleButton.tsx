@@ -28,6 +28,8 @@ export const CustomGoogleButton: React.FC = () => {
         });
 
         localStorage.setItem("user", JSON.stringify(res.data.user));
+        // Signed session token, lets later requests skip the Google round trip
+        localStorage.setItem("session_token", res.data.session_token);
 
         navigate("/dashboard");
       } catch (err) {
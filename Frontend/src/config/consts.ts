@@ -5,6 +5,7 @@ export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || "";
 export const API_ROUTES = {
   UPLOAD_RECEIPT: `${API_BASE_URL}/upload-receipt`,
   VERIFY_GOOGLE: `${API_BASE_URL}/auth/google`,
+  SESSION: `${API_BASE_URL}/auth/session`,
 };
 
 // Google OAuth related constants